@@ -1,13 +1,17 @@
 import os
 import json
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
+import hashlib
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, send_file, url_for
 from werkzeug.utils import secure_filename
-from unified_analyzer import UnifiedImageAnalyzer as ImageAnalyzer
+from unified_analyzer import UnifiedImageAnalyzer as ImageAnalyzer, preprocess_image
 from config import Config, PLATFORM_TEMPLATES, SUPPORTED_MODELS
-import ollama
-import pandas as pd
+from upload_store import UploadStore, make_request_class
+from preview_cache import PreviewCache
+from excel_export import TUCHONG_COLUMNS, iter_tuchong_rows, stream_xlsx, content_disposition
+from job_store import JobStore
+from archive_input import is_archive_name, iter_archive_images
+from profiling import PROFILE_HEADER, header_requested
 from datetime import datetime
-import tempfile
 import re
 
 app = Flask(__name__)
@@ -19,6 +23,22 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 预览缩略图缓存
+preview_cache = PreviewCache(app.config['UPLOAD_FOLDER'])
+
+# 按内容哈希存储上传文件，解析请求时直接流式写盘并计算哈希
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    quota_bytes=Config.UPLOAD_QUOTA_BYTES,
+    retention_seconds=Config.UPLOAD_RETENTION_SECONDS,
+    chunk_size=Config.UPLOAD_CHUNK_SIZE,
+    on_evict=preview_cache.evict
+)
+app.request_class = make_request_class(upload_store)
+
+# 批量任务结果存储
+job_store = JobStore(Config.JOB_DB_PATH)
+
 # 初始化图片分析器
 analyzer = ImageAnalyzer()
 
@@ -48,6 +68,24 @@ def safe_filename(filename):
     
     return safe_chars
 
+def record_job_result(filename, analysis_data=None, formatted=None, error=None, file_hash=None,
+                      file_index=None):
+    """如果请求属于某个批量任务，将结构化结果保存到服务端"""
+    job_id = request.form.get('job_id')
+    if job_id:
+        if file_index is None:
+            file_index = request.form.get('file_index', type=int)
+        job_store.add_result(
+            job_id, filename, analysis_data, formatted, error=error,
+            file_hash=file_hash, file_index=file_index
+        )
+
+def get_pagination():
+    """读取分页参数"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    return page, per_page
+
 @app.route('/')
 def index():
     return render_template('enhanced_index_with_abort.html', platforms=PLATFORM_TEMPLATES.keys())
@@ -63,16 +101,25 @@ def upload_file():
     model = request.form.get('model', 'llava:7b')  # 添加模型参数
     
     if file.filename == '':
+        upload_store.discard(file)
         return jsonify({'error': '没有选择文件'}), 400
     
     if file and allowed_file(file.filename):
         filename = safe_filename(file.filename or 'unknown')
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        stored = upload_store.save(file)
         
-        # 使用指定模型分析图片
-        analysis_data = analyzer.analyze_image(filepath, platform, model, language)
+        try:
+            # 使用指定模型分析图片，预处理得到的缩小图同时用于预览
+            analysis_data = analyzer.analyze_image(
+                stored['path'], platform, model, language,
+                on_preprocessed=lambda data: preview_cache.seed(stored['file_hash'], data),
+                profile=header_requested(request.headers.get(PROFILE_HEADER)),
+                display_name=file.filename
+            )
+        finally:
+            upload_store.release(stored['stored_name'])
         formatted_result = analyzer.format_for_platform(analysis_data, platform, language)
+        record_job_result(filename, analysis_data, formatted_result, file_hash=stored['file_hash'])
 
         # 获取处理耗时
         processing_time = analysis_data.get('image_info', {}).get('processing_time', 0)
@@ -80,6 +127,9 @@ def upload_file():
         return jsonify({
             'success': True,
             'filename': filename,
+            'file_hash': stored['file_hash'],
+            'stored_filename': stored['stored_name'],
+            'preview_url': url_for('preview', file_hash=stored['file_hash'], size=256),
             'analysis': formatted_result,
             'raw_data': analysis_data,
             'platform': platform,
@@ -88,6 +138,7 @@ def upload_file():
             'processing_time': f"{processing_time:.2f}s"
         })
     
+    upload_store.discard(file)
     return jsonify({'error': '不支持的文件格式'}), 400
 
 @app.route('/batch_upload', methods=['POST'])
@@ -104,17 +155,26 @@ def batch_upload():
     total_files = request.form.get('total_files', '1')
     
     if file.filename == '':
+        upload_store.discard(file)
         return jsonify({'error': '没有选择文件'}), 400
     
     try:
         if file and allowed_file(file.filename):
             filename = safe_filename(file.filename or 'unknown')
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            stored = upload_store.save(file)
             
-            # 使用指定模型分析图片
-            analysis_data = analyzer.analyze_image(filepath, platform, model, language)
+            try:
+                # 使用指定模型分析图片，预处理得到的缩小图同时用于预览
+                analysis_data = analyzer.analyze_image(
+                    stored['path'], platform, model, language,
+                    on_preprocessed=lambda data: preview_cache.seed(stored['file_hash'], data),
+                    profile=header_requested(request.headers.get(PROFILE_HEADER)),
+                    display_name=file.filename
+                )
+            finally:
+                upload_store.release(stored['stored_name'])
             formatted_result = analyzer.format_for_platform(analysis_data, platform, language)
+            record_job_result(filename, analysis_data, formatted_result, file_hash=stored['file_hash'])
 
             # 获取处理耗时
             processing_time = analysis_data.get('image_info', {}).get('processing_time', 0)
@@ -122,6 +182,9 @@ def batch_upload():
             return jsonify({
                 'success': True,
                 'filename': filename,
+                'file_hash': stored['file_hash'],
+                'stored_filename': stored['stored_name'],
+                'preview_url': url_for('preview', file_hash=stored['file_hash'], size=256),
                 'analysis': formatted_result,
                 'file_index': file_index,
                 'total_files': total_files,
@@ -131,6 +194,8 @@ def batch_upload():
                 'processing_time': f"{processing_time:.2f}s"
             })
         else:
+            upload_store.discard(file)
+            record_job_result(file.filename or 'unknown', error='不支持的文件格式')
             return jsonify({
                 'success': False,
                 'filename': file.filename or 'unknown',
@@ -139,6 +204,10 @@ def batch_upload():
                 'total_files': total_files
             })
     except Exception as e:
+        try:
+            record_job_result(file.filename or 'unknown', error=f'处理失败: {str(e)}')
+        except Exception:
+            pass
         return jsonify({
             'success': False,
             'filename': file.filename or 'unknown',
@@ -147,14 +216,118 @@ def batch_upload():
             'total_files': total_files
         })
 
+@app.route('/archive_upload', methods=['POST'])
+def archive_upload():
+    """上传ZIP/TAR压缩包，逐个分析其中的图片，成员不解压到磁盘"""
+    if 'file' not in request.files:
+        return jsonify({'error': '没有选择文件'}), 400
+    
+    file = request.files['file']
+    platform = request.form.get('platform', 'general')
+    language = request.form.get('language', 'zh')
+    model = request.form.get('model', 'llava:7b')
+    
+    if not is_archive_name(file.filename or ''):
+        upload_store.discard(file)
+        return jsonify({'error': '仅支持 .zip、.tar、.tar.gz 压缩包'}), 400
+    
+    archive_name = safe_filename(file.filename)
+    results = []
+    try:
+        members = iter_archive_images(
+            file.stream, archive_name, max_member_size=app.config['MAX_CONTENT_LENGTH']
+        )
+        for index, member in enumerate(members, 1):
+            file_hash = hashlib.sha256(member.data).hexdigest()
+            try:
+                preprocessed = preprocess_image(member.name, validator=analyzer.image_validator, data=member.data,
+                                                phash=analyzer.duplicate_index is not None)
+                if preprocessed.get('data'):
+                    # 没有原图落盘，预处理缩小图即为预览来源
+                    preview_cache.seed(file_hash, preprocessed['data'])
+                analysis_data = analyzer.analyze_preprocessed(
+                    member.name, preprocessed, platform, model, language
+                )
+                formatted_result = analyzer.format_for_platform(analysis_data, platform, language)
+                record_job_result(member.name, analysis_data, formatted_result,
+                                  file_hash=file_hash, file_index=index)
+                processing_time = analysis_data.get('image_info', {}).get('processing_time', 0)
+                results.append({
+                    'success': 'error' not in analysis_data,
+                    'filename': member.name,
+                    'file_hash': file_hash,
+                    'preview_url': url_for('preview', file_hash=file_hash, size=256),
+                    'analysis': formatted_result,
+                    'processing_time': f"{processing_time:.2f}s"
+                })
+            except Exception as e:
+                record_job_result(member.name, error=f'处理失败: {str(e)}', file_hash=file_hash, file_index=index)
+                results.append({
+                    'success': False,
+                    'filename': member.name,
+                    'error': f'处理失败: {str(e)}'
+                })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'filename': archive_name,
+            'error': f'无法读取压缩包: {str(e)}',
+            'results': results
+        }), 400
+    finally:
+        upload_store.discard(file)
+    
+    successful = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'filename': archive_name,
+        'total_files': len(results),
+        'successful': successful,
+        'failed': len(results) - successful,
+        'platform': platform,
+        'language': language,
+        'model': model,
+        'results': results
+    })
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
+    upload_store.touch(filename)
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+@app.route('/preview/<file_hash>')
+def preview(file_hash):
+    """按内容哈希返回缓存的缩略图，支持ETag条件请求"""
+    if not preview_cache.is_valid_hash(file_hash):
+        return jsonify({'error': '无效的文件标识'}), 404
+
+    size = request.args.get('size', 256, type=int)
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    bucket = preview_cache.bucket_for(size)
+    etag = preview_cache.etag_for(file_hash, bucket, fmt)
+
+    # 客户端缓存仍有效时无需读取或生成缩略图
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        try:
+            path, bucket = preview_cache.get_preview(file_hash, size, fmt)
+        except Exception as e:
+            return jsonify({'error': f'生成预览失败: {str(e)}'}), 500
+        if path is None:
+            return jsonify({'error': '文件不存在'}), 404
+        response = send_file(path, mimetype=preview_cache.mimetype_for(fmt), etag=False, conditional=True)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept')
+    return response
+
 @app.route('/health')
 def health_check():
     """检查Ollama服务状态"""
     try:
+        import ollama
         models = ollama.list()
         available_model_names = [model['name'] for model in models['models']]
         
@@ -183,7 +356,8 @@ def health_check():
             'model_info': model_info,
             'available_models': available_model_names,
             'model_status': model_status,
-            'supported_platforms': list(PLATFORM_TEMPLATES.keys())
+            'supported_platforms': list(PLATFORM_TEMPLATES.keys()),
+            'degradation': analyzer.degradation.status() if analyzer.degradation is not None else None
         })
     except Exception as e:
         return jsonify({
@@ -203,6 +377,7 @@ def get_platforms():
 def get_models():
     """获取支持的模型信息"""
     try:
+        import ollama
         # 检查哪些模型已安装
         installed_models = ollama.list()
         available_model_names = [model['name'] for model in installed_models['models']]
@@ -236,6 +411,8 @@ def download_model():
         return jsonify({'error': '不支持的模型'}), 400
     
     try:
+        import ollama
+
         # 检查模型是否已存在
         models = ollama.list()
         available_models = [model['name'] for model in models['models']]
@@ -289,300 +466,88 @@ def download_model():
             'error': f'下载失败: {str(e)}'
         }), 500
 
-def clean_description(description):
-    """清理描述中的冗余前缀"""
-    if not description:
-        return '精美图片'
-
-    # 定义需要去除的前缀模式
-    redundant_prefixes = [
-        '图片展示了',
-        '图片显示了',
-        '图片描述了',
-        '这张图片',
-        '图片中',
-        '图片里',
-        '画面中',
-        '画面里',
-        '照片中',
-        '照片里',
-        '图像中',
-        '图像里',
-        '此图',
-        '本图',
-        '图中',
-        '图里'
-    ]
-
-    # 去除前缀
-    cleaned = description.strip()
-    for prefix in redundant_prefixes:
-        if cleaned.startswith(prefix):
-            cleaned = cleaned[len(prefix):].strip()
-            # 如果去除前缀后以"是"、"为"、"有"等开头，也去除
-            if cleaned.startswith('是'):
-                cleaned = cleaned[1:].strip()
-            elif cleaned.startswith('为'):
-                cleaned = cleaned[1:].strip()
-            elif cleaned.startswith('有'):
-                cleaned = cleaned[1:].strip()
-            break
-
-    # 确保首字母大写（如果是中文则不变）
-    if cleaned and len(cleaned) > 0:
-        if cleaned[0].isalpha() and cleaned[0].islower():
-            cleaned = cleaned[0].upper() + cleaned[1:]
-
-    return cleaned if cleaned else '精美图片'
-
-def optimize_description_length(description, min_length=5, max_length=50):
-    """优化描述长度，确保在指定范围内"""
-    if not description:
-        return '精美图片素材'
-
-    # 先清理冗余前缀
-    cleaned = clean_description(description)
-
-    # 计算字符长度
-    length = len(cleaned)
-
-    if length >= min_length and length <= max_length:
-        # 长度合适，直接返回
-        return cleaned
-    elif length < min_length:
-        # 太短，需要扩展
-        return expand_description(cleaned, min_length)
-    else:
-        # 太长，需要智能缩短
-        return shorten_description(cleaned, max_length)
-
-def expand_description(description, min_length):
-    """扩展过短的描述"""
-    if len(description) >= min_length:
-        return description
-
-    # 添加通用的美化词汇来扩展描述
-    enhancement_words = [
-        '精美的', '优质的', '高清的', '专业的', '艺术的',
-        '美丽的', '壮观的', '清晰的', '生动的', '细腻的'
-    ]
-
-    # 根据内容选择合适的修饰词
-    if '风景' in description or '景色' in description or '山' in description or '海' in description:
-        preferred_words = ['壮观的', '美丽的', '优质的']
-    elif '人物' in description or '肖像' in description:
-        preferred_words = ['专业的', '精美的', '高清的']
-    elif '食物' in description or '美食' in description:
-        preferred_words = ['诱人的', '精美的', '美味的']
-    else:
-        preferred_words = ['精美的', '优质的', '专业的']
-
-    # 尝试添加修饰词
-    for word in preferred_words:
-        expanded = word + description
-        if len(expanded) >= min_length and len(expanded) <= 50:
-            return expanded
-
-    # 如果还是太短，添加"摄影作品"后缀
-    if len(description) + 4 <= 50:
-        return description + '摄影作品'
-    elif len(description) + 2 <= 50:
-        return description + '作品'
-
-    return description
-
-def shorten_description(description, max_length):
-    """智能缩短过长的描述"""
-    if len(description) <= max_length:
-        return description
-
-    # 优先去除不必要的修饰词和连接词
-    words_to_remove = [
-        '非常', '十分', '特别', '极其', '相当', '比较', '较为',
-        '显得', '看起来', '看上去', '仿佛', '好像', '似乎',
-        '在...下', '在...中', '在...里', '的时候', '的瞬间'
-    ]
-
-    shortened = description
-    for word in words_to_remove:
-        shortened = shortened.replace(word, '')
-
-    # 如果还是太长，智能截取
-    if len(shortened) > max_length:
-        # 尽量在标点符号处截断
-        punctuation = ['，', '。', '、', '；', '：']
-        for i in range(max_length - 1, max_length // 2, -1):
-            if shortened[i] in punctuation:
-                return shortened[:i]
-
-        # 如果没有找到合适的标点，直接截取
-        return shortened[:max_length]
-
-    return shortened
-
 @app.route('/export_excel', methods=['POST'])
 def export_excel():
-    """导出批量处理结果为图虫平台Excel格式"""
-    try:
-        data = request.get_json()
-        results = data.get('results', [])
-
-        if not results:
-            return jsonify({'error': '没有数据可导出'}), 400
-
-        # 图虫平台Excel格式
-        excel_data = []
-
-        for result in results:
-            filename = result.get('filename', '')
-            analysis = result.get('analysis', {})
-
-            # 初始化默认值
-            description = '精美图片'
-            keywords_str = '摄影,图片,素材,创意,设计'
-            category = '其他'
-
-            # 处理analysis数据
-            if isinstance(analysis, str):
-                # 如果analysis是格式化后的字符串，需要解析
-                try:
-                    # 尝试从格式化字符串中提取信息
-                    lines = analysis.split('\n')
-                    for line in lines:
-                        if '图片说明：' in line:
-                            description = line.replace('图片说明：', '').strip()
-                        elif '图片关键字：' in line:
-                            keywords_str = line.replace('图片关键字：', '').strip()
-                        elif '图片分类：' in line:
-                            category = line.replace('图片分类：', '').strip()
-                except Exception as e:
-                    print(f"解析格式化字符串失败: {e}")
-            elif isinstance(analysis, dict):
-                # 如果analysis是字典，从原始数据中提取
-                # 优先使用格式化后的description
-                description = (
-                    analysis.get('description') or
-                    analysis.get('detailed_description') or
-                    analysis.get('main_subject', '精美图片')
-                )
-
-                # 处理关键词
-                keywords = analysis.get('keywords', [])
-                if not keywords:
-                    keywords = analysis.get('keywords_cn', [])
-                if isinstance(keywords, str):
-                    keywords = [k.strip() for k in keywords.split(',') if k.strip()]
-
-                if keywords:
-                    keywords_str = ','.join(keywords)
-
-                # 处理图片分类
-                category = analysis.get('image_type', '其他')
-
-            # 优化描述长度，确保在5-50字符范围内
-            description = optimize_description_length(description, 5, 50)
-
-            # 验证和调整关键词
-            keywords_list = [k.strip() for k in keywords_str.split(',') if k.strip()]
-
-            # 限制关键词数量（5-30个）
-            if len(keywords_list) > 30:
-                keywords_list = keywords_list[:30]
-            elif len(keywords_list) < 5:
-                # 补充通用关键词
-                default_keywords = ['摄影', '图片', '素材', '创意', '设计', '艺术', '视觉', '专业', '高质量', '商业']
-                keywords_list.extend(default_keywords[:5-len(keywords_list)])
-
-            keywords_str = ','.join(keywords_list)
-
-            # 确保分类在图虫网允许的分类列表中
-            tuchong_categories = [
-                '城市风光', '自然风光', '野生动物', '静物美食',
-                '动物萌宠', '商务肖像', '生活方式', '室内空间',
-                '生物医疗', '运动健康', '节日假日', '其他'
-            ]
-
-            # 图片分类映射优化
-            category_mapping = {
-                '风景': '自然风光',
-                '景观': '自然风光',
-                '风光': '自然风光',
-                '自然': '自然风光',
-                '山水': '自然风光',
-                '建筑': '城市风光',
-                '城市': '城市风光',
-                '街道': '城市风光',
-                '人物': '商务肖像',
-                '肖像': '商务肖像',
-                '食物': '静物美食',
-                '美食': '静物美食',
-                '动物': '动物萌宠',
-                '宠物': '动物萌宠',
-                '生活': '生活方式',
-                '室内': '室内空间',
-                '医疗': '生物医疗',
-                '运动': '运动健康',
-                '健康': '运动健康',
-                '节日': '节日假日'
-            }
-
-            # 先尝试直接匹配
-            if category not in tuchong_categories:
-                # 尝试映射匹配
-                mapped_category = None
-                for key, value in category_mapping.items():
-                    if key in category:
-                        mapped_category = value
-                        break
-
-                category = mapped_category if mapped_category else '其他'
-
-            # 使用正确的列名（与模板一致）
-            excel_row = {
-                '图片文件名': filename,
-                '是否独家(选项)': '否',  # 默认否
-                '图片说明': description,
-                '图片关键字': keywords_str,
-                '图片分类': category,
-                '图片用途(选项)': '商业广告类'  # 设置为商业广告类
-            }
-
-            excel_data.append(excel_row)
-
-        # 创建DataFrame
-        df = pd.DataFrame(excel_data)
-
-        # 创建临时文件
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'图虫平台批量导入_{timestamp}.xlsx'
-
-        # 使用临时目录
-        temp_dir = tempfile.gettempdir()
-        filepath = os.path.join(temp_dir, filename)
-
-        # 保存Excel文件
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='工作表1', index=False)
-
-            # 获取工作表并设置列宽
-            worksheet = writer.sheets['工作表1']
-            worksheet.column_dimensions['A'].width = 25  # 图片文件名
-            worksheet.column_dimensions['B'].width = 15  # 是否独家
-            worksheet.column_dimensions['C'].width = 50  # 图片说明
-            worksheet.column_dimensions['D'].width = 60  # 图片关键字
-            worksheet.column_dimensions['E'].width = 15  # 图片分类
-            worksheet.column_dimensions['F'].width = 20  # 图片用途
-
-        # 返回文件
-        return send_file(
-            filepath,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-
-    except Exception as e:
-        return jsonify({'error': f'导出失败: {str(e)}'}), 500
+    """导出批量处理结果为图虫平台Excel格式，边转换边流式下载"""
+    data = request.get_json(silent=True) or {}
+    results = data.get('results', [])
+
+    if not results:
+        return jsonify({'error': '没有数据可导出'}), 400
+    if not isinstance(results, list):
+        return jsonify({'error': 'results 必须是列表'}), 400
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'图虫平台批量导入_{timestamp}.xlsx'
+
+    rows = iter_tuchong_rows(results)
+
+    return Response(
+        stream_xlsx(rows, TUCHONG_COLUMNS, sheet_name='工作表1'),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': content_disposition(filename)}
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """创建批量任务，后续上传携带job_id即可在服务端保存结果"""
+    data = request.get_json(silent=True) or {}
+    job_id = job_store.create_job(
+        platform=data.get('platform', 'general'),
+        language=data.get('language', 'zh'),
+        model=data.get('model'),
+        total=data.get('total')
+    )
+    return jsonify({'success': True, 'job_id': job_id})
+
+@app.route('/jobs')
+def list_jobs():
+    """分页浏览历史任务"""
+    page, per_page = get_pagination()
+    jobs, total = job_store.list_jobs(page, per_page)
+    return jsonify({'jobs': jobs, 'page': page, 'per_page': per_page, 'total': total})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """获取任务信息"""
+    job = job_store.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results')
+def list_job_results(job_id):
+    """分页浏览任务结果，浏览器无需保留整个批次"""
+    if job_store.get_job(job_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    page, per_page = get_pagination()
+    results, total = job_store.list_results(job_id, page, per_page)
+    for result in results:
+        result['success'] = bool(result['success'])
+        if result['file_hash']:
+            result['preview_url'] = url_for('preview', file_hash=result['file_hash'], size=256)
+    return jsonify({'results': results, 'page': page, 'per_page': per_page, 'total': total})
+
+@app.route('/jobs/<job_id>/export_excel')
+def export_job_excel(job_id):
+    """直接从服务端保存的结构化结果导出图虫平台Excel"""
+    job = job_store.get_job(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if not job['successful']:
+        return jsonify({'error': '没有数据可导出'}), 400
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'图虫平台批量导入_{timestamp}.xlsx'
+
+    rows = iter_tuchong_rows(job_store.iter_results(job_id))
+
+    return Response(
+        stream_xlsx(rows, TUCHONG_COLUMNS, sheet_name='工作表1'),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': content_disposition(filename)}
+    )
 
 if __name__ == '__main__':
     print("🚀 PicTagger Enhanced 启动中...")
@@ -0,0 +1,124 @@
+"""
+压缩包输入
+直接从 ZIP/TAR 压缩包中逐个读取图片成员送入分析流程，不解压到磁盘，
+结果使用压缩包内的相对路径命名
+"""
+
+import os
+import logging
+import tarfile
+import zipfile
+from io import BytesIO
+from datetime import datetime
+
+from PIL import Image
+
+from file_discovery import is_image_name
+
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+logger = logging.getLogger('PicTagger')
+
+
+def is_archive_name(name):
+    return str(name).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_readable_archive(path):
+    """是否为可读取的 ZIP 或 TAR 压缩包"""
+    try:
+        return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+    except OSError:
+        return False
+
+
+class ArchiveMember:
+    """压缩包中的一张图片，str() 为 "压缩包名!成员路径"，name 为成员在包内的相对路径
+
+    archive_path 为压缩包的绝对路径，从文件对象读取时为 None
+    """
+
+    __slots__ = ('archive_name', 'name', 'data', 'mtime', 'archive_path')
+
+    def __init__(self, archive_name, name, data, mtime=None, archive_path=None):
+        self.archive_name = archive_name
+        self.name = name
+        self.data = data
+        self.mtime = mtime
+        self.archive_path = archive_path
+
+    def __str__(self):
+        return f"{self.archive_name}!{self.name}"
+
+    def __repr__(self):
+        return f"ArchiveMember({str(self)!r})"
+
+    def image_info(self):
+        """与 ImageUtils.get_image_info 相同结构的图片信息，从内存数据读取"""
+        try:
+            with Image.open(BytesIO(self.data)) as img:
+                return {
+                    'filename': self.name,
+                    'size': img.size,
+                    'mode': img.mode,
+                    'format': img.format,
+                    'file_size': len(self.data),
+                    'created_time': datetime.fromtimestamp(self.mtime).isoformat() if self.mtime else None
+                }
+        except Exception as e:
+            return {'error': str(e)}
+
+
+def _wanted(name):
+    """只保留图片成员，跳过 macOS 生成的资源文件"""
+    base = os.path.basename(name)
+    return (is_image_name(name) and not base.startswith('._')
+            and not name.startswith('__MACOSX/'))
+
+
+def _too_large(name, size, max_member_size):
+    if max_member_size and size > max_member_size:
+        logger.warning(f"跳过过大的压缩包成员 {name}: {size} 字节")
+        return True
+    return False
+
+
+def iter_archive_images(source, archive_name=None, max_member_size=None):
+    """按压缩包内顺序逐个产出图片成员（ArchiveMember）
+
+    source 为压缩包路径或可读的文件对象（ZIP需要可随机访问），
+    每次只在内存中保留当前成员的数据
+    """
+    if archive_name is None:
+        archive_name = os.path.basename(str(source))
+    archive_path = None if hasattr(source, 'read') else os.path.abspath(str(source))
+
+    is_zip = zipfile.is_zipfile(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+    if is_zip:
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not _wanted(info.filename):
+                    continue
+                if _too_large(info.filename, info.file_size, max_member_size):
+                    continue
+                mtime = datetime(*info.date_time).timestamp()
+                yield ArchiveMember(archive_name, info.filename, archive.read(info), mtime, archive_path)
+        return
+
+    # 流式模式按顺序读取，gzip/bz2/xz 自动识别，也适用于不可随机访问的输入
+    if hasattr(source, 'read'):
+        archive = tarfile.open(fileobj=source, mode='r|*')
+    else:
+        archive = tarfile.open(source, mode='r|*')
+    with archive:
+        for member in archive:
+            if not member.isfile() or not _wanted(member.name):
+                continue
+            if _too_large(member.name, member.size, max_member_size):
+                continue
+            fileobj = archive.extractfile(member)
+            yield ArchiveMember(archive_name, member.name, fileobj.read(), member.mtime, archive_path)
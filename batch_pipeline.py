@@ -0,0 +1,144 @@
+"""
+批量处理流水线
+预处理（解码、缩放）在进程池中进行，模型推理在有界线程池中并发执行，
+两者互相重叠，结果按输入顺序输出
+"""
+
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from unified_analyzer import preprocess_image
+from profiling import capture
+
+
+class BatchPipeline:
+    """预处理进程池 + 有界并发推理的批量分析流水线"""
+
+    def __init__(self, analyzer, platform='general', language='zh', model=None, engine='ollama',
+                 workers=1, concurrency=1):
+        self.analyzer = analyzer
+        self.platform = platform
+        self.language = language
+        self.model = model
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+
+        # 同时在途的图片数量上限，保证预处理结果不会无限堆积在内存中
+        self.window = self.workers * 2 + self.concurrency
+
+        self.started_at = None
+        self.completed = 0
+
+    def run(self, image_files, skip=None):
+        """处理图片，按输入顺序逐个产出 (图片路径, 分析结果, 异常)
+
+        skip(图片路径) 返回真时该图片不做处理，按原顺序产出 (图片路径, None, None)
+        """
+        self.started_at = time.time()
+        self.completed = 0
+
+        preprocess_pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        inference_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='inference')
+        pending = deque()
+
+        try:
+            for image_file in image_files:
+                if skip is not None and skip(image_file):
+                    future = Future()
+                    future.set_result(None)
+                else:
+                    future = self._submit(image_file, preprocess_pool, inference_pool)
+                pending.append((image_file, future))
+                while len(pending) >= self.window:
+                    yield self._collect(*pending.popleft())
+
+            while pending:
+                yield self._collect(*pending.popleft())
+        finally:
+            # 提前退出时取消尚未开始的任务
+            for _, future in pending:
+                future.cancel()
+            inference_pool.shutdown(wait=True, cancel_futures=True)
+            if preprocess_pool:
+                preprocess_pool.shutdown(wait=True, cancel_futures=True)
+
+    def images_per_minute(self):
+        """按已完成数量计算吞吐量"""
+        if not self.started_at:
+            return 0.0
+        elapsed = time.time() - self.started_at
+        return self.completed / elapsed * 60 if elapsed > 0 else 0.0
+
+    def _submit(self, image_file, preprocess_pool, inference_pool):
+        """提交单张图片，返回最终结果的Future"""
+        if preprocess_pool is None:
+            # 单进程时在推理线程内顺序预处理
+            return inference_pool.submit(self._process, image_file)
+
+        result = Future()
+
+        def on_preprocessed(preprocess_future):
+            if result.cancelled():
+                return
+            try:
+                preprocessed = preprocess_future.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            inference = inference_pool.submit(self._infer, image_file, preprocessed)
+            inference.add_done_callback(lambda f: _copy_future(f, result))
+
+        preprocess_pool.submit(
+            preprocess_image, str(image_file), None, getattr(image_file, 'data', None),
+            self.analyzer.duplicate_index is not None
+        ).add_done_callback(on_preprocessed)
+        return result
+
+    def _process(self, image_file):
+        # 开启剖析时记录预处理和推理的完整过程
+        with capture(f"analyze_image {image_file} ({self.platform}/{self.engine})") as record:
+            # 压缩包成员带有内存中的图片数据，普通文件按路径读取
+            preprocessed = preprocess_image(
+                str(image_file), validator=self.analyzer.image_validator, data=getattr(image_file, 'data', None),
+                phash=self.analyzer.duplicate_index is not None
+            )
+            result = self._infer(image_file, preprocessed)
+        return _attach_profile(result, record)
+
+    def _infer(self, image_file, preprocessed):
+        # 预处理在进程池中完成时只能剖析推理部分
+        with capture(f"analyze_preprocessed {image_file} ({self.platform}/{self.engine})") as record:
+            result = self.analyzer.analyze_preprocessed(
+                str(image_file), preprocessed, self.platform, self.model, self.language, self.engine
+            )
+        return _attach_profile(result, record)
+
+    def _collect(self, image_file, future):
+        try:
+            analysis_data, error = future.result(), None
+        except Exception as e:
+            analysis_data, error = None, e
+        if analysis_data is not None or error is not None:
+            # 跳过的图片不计入吞吐量
+            self.completed += 1
+        return image_file, analysis_data, error
+
+
+def _attach_profile(result, record):
+    if record and result is not None:
+        result.setdefault('image_info', {})['profile'] = record['profile']
+    return result
+
+
+def _copy_future(source, target):
+    """把推理Future的结果转移到对外的Future"""
+    if target.cancelled():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
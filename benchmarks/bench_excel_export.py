@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Excel导出基准测试
+在1万和10万行规模下测量流式XLSX导出的总耗时、首字节耗时和内存峰值，
+可选与旧的 pandas + openpyxl 导出方式对比
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_export import TUCHONG_COLUMNS, build_tuchong_row, stream_xlsx
+
+
+def generate_results(count):
+    """按需生成模拟的批量处理结果，交替使用字符串和结构化两种分析格式"""
+    for i in range(count):
+        if i % 2:
+            analysis = (
+                f"图片分类：自然风光\n"
+                f"图片说明：图片展示了第{i}张清晨湖面上的薄雾与远山倒影\n"
+                f"图片关键字：湖泊,薄雾,远山,倒影,清晨,宁静,风景,自然,户外,{i}"
+            )
+        else:
+            analysis = {
+                'image_type': '城市风景',
+                'description': f'第{i}张夜晚城市街道的车流光轨，高楼灯火通明',
+                'keywords': ['城市', '夜景', '车流', '光轨', '建筑', '街道', '灯光', str(i)]
+            }
+        yield {'filename': f'IMG_{i:06d}.JPG', 'analysis': analysis}
+
+
+def run_streaming(count, output_path):
+    """流式导出，返回 (总耗时, 首字节耗时, 内存峰值, 文件大小)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_chunk = None
+    size = 0
+
+    rows = (build_tuchong_row(result) for result in generate_results(count))
+    with open(output_path, 'wb') as f:
+        for chunk in stream_xlsx(rows, TUCHONG_COLUMNS):
+            if first_chunk is None and chunk:
+                first_chunk = time.perf_counter() - start
+            size += len(chunk)
+            f.write(chunk)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, first_chunk, peak, size
+
+
+def run_legacy(count, output_path):
+    """旧的 DataFrame + ExcelWriter 导出方式，下载要等整个文件写完"""
+    import pandas as pd
+
+    columns = [name for name, _ in TUCHONG_COLUMNS]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    excel_data = [dict(zip(columns, build_tuchong_row(result))) for result in generate_results(count)]
+    df = pd.DataFrame(excel_data)
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='工作表1', index=False)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, elapsed, peak, os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger Excel导出基准测试')
+    parser.add_argument('--rows', default='10000,100000', help='测试行数，逗号分隔 (默认: 10000,100000)')
+    parser.add_argument('--legacy', action='store_true', help='同时测量旧的pandas导出方式')
+    parser.add_argument('--verify', action='store_true', help='用openpyxl读取校验导出文件')
+    parser.add_argument('--output', help='将结果保存为JSON')
+    args = parser.parse_args()
+
+    engines = [('streaming', run_streaming)]
+    if args.legacy:
+        engines.append(('legacy', run_legacy))
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in [int(n) for n in args.rows.split(',')]:
+            for name, runner in engines:
+                path = os.path.join(work_dir, f'{name}_{count}.xlsx')
+                elapsed, first_chunk, peak, size = runner(count, path)
+                results.append({
+                    'engine': name,
+                    'rows': count,
+                    'seconds': elapsed,
+                    'first_byte_seconds': first_chunk,
+                    'peak_python_memory_bytes': peak,
+                    'output_bytes': size,
+                    'rows_per_second': count / elapsed if elapsed else 0
+                })
+                print(f"{name:9s} {count:>7d} 行  耗时 {elapsed:7.2f}s  首字节 {first_chunk:6.3f}s  "
+                      f"内存峰值 {peak / 1024 / 1024:7.1f} MB  文件 {size / 1024 / 1024:6.1f} MB")
+
+                if args.verify:
+                    import openpyxl
+                    workbook = openpyxl.load_workbook(path, read_only=True)
+                    row_count = sum(1 for _ in workbook.active.iter_rows())
+                    workbook.close()
+                    status = '✅' if row_count == count + 1 else '❌'
+                    print(f"    {status} 校验行数: {row_count - 1}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+近似重复索引基准测试
+按固定随机种子生成百万级 dHash，测量内存多索引的检索延迟（分位数）、
+边检索边写入时的检索延迟和单次写入的最长耗时（写入在索引锁内进行，会阻塞并发检索），
+检索延迟中位数超出上限时返回非零退出码
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+
+from near_duplicates import _HashTable  # noqa: E402
+
+
+def random_hashes(rng, count):
+    return np.frombuffer(rng.randbytes(count * 8), dtype=np.uint64).copy()
+
+
+def near_queries(rng, hashes, count, max_flips):
+    """一半为已有哈希翻转若干位，一半为随机哈希（通常没有匹配）"""
+    queries = []
+    for _ in range(count // 2):
+        value = int(hashes[rng.randrange(len(hashes))])
+        for bit in rng.sample(range(64), rng.randint(0, max_flips)):
+            value ^= 1 << bit
+        queries.append(value)
+    queries.extend(rng.getrandbits(64) for _ in range(count - len(queries)))
+    return queries
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        'p50_ms': statistics.median(timings) * 1000,
+        'p99_ms': timings[int(len(timings) * 0.99)] * 1000,
+        'max_ms': timings[-1] * 1000
+    }
+
+
+def time_lookups(table, queries, max_distance):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        table.nearest(query, max_distance)
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger 近似重复索引基准测试')
+    parser.add_argument('--size', type=int, default=1_000_000, help='索引中的哈希数 (默认: 1000000)')
+    parser.add_argument('--queries', type=int, default=2000, help='每轮检索次数 (默认: 2000)')
+    parser.add_argument('--adds', type=int, default=20000, help='边检索边写入的哈希数 (默认: 20000)')
+    parser.add_argument('--distance', type=int, default=4, help='汉明距离阈值 (默认: 4)')
+    parser.add_argument('--max-lookup-ms', type=float, default=1.0,
+                        help='检索延迟中位数上限，超出时返回非零退出码 (默认: 1.0)')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子 (默认: 42)')
+    parser.add_argument('--output', help='将结果保存为JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = random_hashes(rng, args.size + args.adds)
+    results = {'size': args.size, 'distance': args.distance}
+
+    start = time.perf_counter()
+    table = _HashTable(np.arange(args.size), hashes[:args.size])
+    results['build_s'] = time.perf_counter() - start
+    print(f"建立索引 {args.size} 条: {results['build_s']:.2f} s")
+
+    queries = near_queries(rng, hashes[:args.size], args.queries, args.distance * 2)
+    time_lookups(table, queries[:100], args.distance)  # 预热
+    results['lookup'] = time_lookups(table, queries, args.distance)
+
+    # 每写入一条检索一次，覆盖缓冲区从空到满的各个阶段
+    add_timings, lookup_timings = [], []
+    for row_id in range(args.size, args.size + args.adds):
+        start = time.perf_counter()
+        table.add(row_id, int(hashes[row_id]))
+        add_timings.append(time.perf_counter() - start)
+        query = queries[row_id % len(queries)]
+        start = time.perf_counter()
+        table.nearest(query, args.distance)
+        lookup_timings.append(time.perf_counter() - start)
+    results['lookup_while_adding'] = percentiles(lookup_timings)
+    results['add'] = percentiles(add_timings)
+
+    for name in ('lookup', 'lookup_while_adding', 'add'):
+        result = results[name]
+        print(f"{name:20s} p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms  "
+              f"max {result['max_ms']:7.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    slowest = max(results['lookup']['p50_ms'], results['lookup_while_adding']['p50_ms'])
+    if slowest > args.max_lookup_ms:
+        print(f"❌ 检索延迟中位数 {slowest:.3f} ms 超出上限 {args.max_lookup_ms} ms")
+        return 1
+    print(f"✅ 检索延迟中位数 {slowest:.3f} ms，未超出上限 {args.max_lookup_ms} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+图片预处理基准测试
+按固定随机种子生成测试图片集（JPEG/PNG/WebP/TIFF/GIF，不同像素数，CMYK、调色板、
+透明通道和截断文件），分别测量 validate_and_fix_image、standard/robust/force
+三种处理方法和 compress_image 的耗时、内存峰值（RSS）和输出字节数，
+结果保存为JSON，可与基线对比发现性能回退
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PATHS = ['validate', 'standard', 'robust', 'force', 'compress_image']
+
+# (名称, 格式, 扩展名, 百万像素, 颜色模式, 是否截断)
+CORPUS = [
+    ('jpeg_0.3mp', 'JPEG', '.jpg', 0.3, 'RGB', False),
+    ('jpeg_2mp', 'JPEG', '.jpg', 2, 'RGB', False),
+    ('jpeg_12mp', 'JPEG', '.jpg', 12, 'RGB', False),
+    ('jpeg_cmyk_6mp', 'JPEG', '.jpg', 6, 'CMYK', False),
+    ('jpeg_truncated_6mp', 'JPEG', '.jpg', 6, 'RGB', True),
+    ('png_2mp', 'PNG', '.png', 2, 'RGB', False),
+    ('png_rgba_6mp', 'PNG', '.png', 6, 'RGBA', False),
+    ('png_palette_2mp', 'PNG', '.png', 2, 'P', False),
+    ('png_truncated_2mp', 'PNG', '.png', 2, 'RGB', True),
+    ('webp_6mp', 'WEBP', '.webp', 6, 'RGB', False),
+    ('webp_rgba_2mp', 'WEBP', '.webp', 2, 'RGBA', False),
+    ('tiff_6mp', 'TIFF', '.tiff', 6, 'RGB', False),
+    ('tiff_cmyk_2mp', 'TIFF', '.tiff', 2, 'CMYK', False),
+    ('gif_palette_0.3mp', 'GIF', '.gif', 0.3, 'P', False),
+]
+
+# --large 时追加的大图
+LARGE_CORPUS = [
+    ('jpeg_24mp', 'JPEG', '.jpg', 24, 'RGB', False),
+    ('png_24mp', 'PNG', '.png', 24, 'RGB', False),
+]
+
+
+def render_image(megapixels, rng):
+    """生成带渐变、色块和细节纹理的 3:2 图片，内容只由随机数生成器决定"""
+    from PIL import Image, ImageDraw
+
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+
+    gradient = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (
+        gradient,
+        gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        gradient.transpose(Image.Transpose.ROTATE_180)
+    ))
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 20 + 1, width // 4), rng.randrange(height // 20 + 1, height // 4)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle([x, y, x + w, y + h], fill=color)
+        else:
+            draw.ellipse([x, y, x + w, y + h], fill=color)
+
+    # 细线条模拟照片中的高频细节，影响压缩后的大小
+    for _ in range(2000):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.line([x, y, x + rng.randrange(-40, 40), y + rng.randrange(-40, 40)],
+                  fill=(rng.randrange(256),) * 3, width=1)
+    return img
+
+
+def generate_corpus(directory, seed=20240101, large=False):
+    """生成测试图片集，返回 {名称: 路径}"""
+    from PIL import Image
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    cases = {}
+
+    for name, fmt, ext, megapixels, mode, truncated in CORPUS + (LARGE_CORPUS if large else []):
+        path = directory / f"{name}{ext}"
+        cases[name] = path
+        if path.exists():
+            continue
+
+        # 每个文件使用独立的种子，增减用例不影响其他文件的内容
+        rng = random.Random(f"{seed}-{name}")
+        img = render_image(megapixels, rng)
+        if mode == 'RGBA':
+            alpha = Image.linear_gradient('L').resize(img.size)
+            img.putalpha(alpha)
+        elif mode == 'P':
+            img = img.convert('P', palette=Image.Palette.ADAPTIVE, colors=256)
+        elif mode != 'RGB':
+            img = img.convert(mode)
+
+        options = {'quality': 90} if fmt in ('JPEG', 'WEBP') else {}
+        img.save(path, format=fmt, **options)
+
+        if truncated:
+            # 截去后40%，模拟下载中断的文件
+            data = path.read_bytes()
+            path.write_bytes(data[:int(len(data) * 0.6)])
+
+    return cases
+
+
+def corpus_fingerprint(cases):
+    """图片集内容的哈希，用于确认对比的两次结果使用相同的输入"""
+    digest = hashlib.sha256()
+    for name in sorted(cases):
+        digest.update(name.encode())
+        digest.update(hashlib.sha256(Path(cases[name]).read_bytes()).digest())
+    return digest.hexdigest()[:16]
+
+
+def _peak_rss_kb():
+    # Linux 上 ru_maxrss 会继承父进程 fork 时的峰值，优先读取本进程的 VmHWM
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_path(path_name, image_path):
+    """执行一次处理，返回输出字节数"""
+    if path_name == 'compress_image':
+        from image_analyzer import ImageAnalyzer
+        data, _, _ = ImageAnalyzer().compress_image(str(image_path))
+        return len(data)
+
+    from image_validator import ImageValidator
+    validator = ImageValidator()
+    if path_name == 'validate':
+        result, error_info = validator.validate_and_fix_image(str(image_path))
+        if not result:
+            raise RuntimeError('; '.join(error_info.get('errors', [])) or '验证失败')
+        return len(result['data'])
+
+    data, _, _ = validator._process_image_with_method(str(image_path), path_name, (1536, 1536), 90)
+    return len(data)
+
+
+def worker(path_name, image_path, runs):
+    """在独立进程中测量，保证内存峰值不受其他用例影响"""
+    from PIL import Image  # noqa: F401  预先导入，不计入内存峰值
+    if path_name == 'compress_image':
+        import image_analyzer  # noqa: F401
+    else:
+        import image_validator  # noqa: F401
+
+    baseline_rss = _peak_rss_kb()
+    timings = []
+    output_bytes = None
+    error = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            output_bytes = run_path(path_name, image_path)
+        except Exception as e:
+            error = str(e).splitlines()[0][:200]
+            break
+        timings.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'timings': timings,
+        'output_bytes': output_bytes,
+        'peak_rss_kb': max(_peak_rss_kb() - baseline_rss, 0),
+        'error': error
+    }))
+
+
+def measure(path_name, image_path, runs):
+    result = subprocess.run(
+        [sys.executable, __file__, '--worker', path_name, str(image_path), '--runs', str(runs)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'error': (result.stderr.strip().splitlines() or ['进程异常退出'])[-1]}
+    data = json.loads(lines[-1])
+
+    summary = {'output_bytes': data['output_bytes'], 'peak_rss_kb': data['peak_rss_kb']}
+    if data['timings']:
+        summary.update(
+            median=statistics.median(data['timings']),
+            min=min(data['timings']),
+            runs=len(data['timings'])
+        )
+    if data['error']:
+        summary['error'] = data['error']
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """返回超出容差的回退项"""
+    regressions = []
+    for case, paths in results.items():
+        for path_name, result in paths.items():
+            previous = baseline.get(case, {}).get(path_name)
+            if not previous:
+                continue
+            if 'error' in result and 'error' not in previous:
+                regressions.append(f"{case}/{path_name}: 基线成功，现在失败 ({result['error']})")
+                continue
+            if 'median' not in result or 'median' not in previous:
+                continue
+            limit = previous['median'] * (1 + tolerance)
+            if result['median'] > limit:
+                regressions.append(
+                    f"{case}/{path_name}: {result['median'] * 1000:.1f} ms > {limit * 1000:.1f} ms "
+                    f"(基线 {previous['median'] * 1000:.1f} ms)"
+                )
+            rss_limit = previous['peak_rss_kb'] * (1 + tolerance) + 1024
+            if result['peak_rss_kb'] > rss_limit:
+                regressions.append(
+                    f"{case}/{path_name}: 内存峰值 {result['peak_rss_kb'] / 1024:.1f} MB > "
+                    f"{rss_limit / 1024:.1f} MB (基线 {previous['peak_rss_kb'] / 1024:.1f} MB)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger 图片预处理基准测试')
+    parser.add_argument('--runs', type=int, default=3, help='每个用例运行次数 (默认: 3)')
+    parser.add_argument('--paths', default=','.join(PATHS),
+                        help=f"要测量的处理路径，逗号分隔 (默认: {','.join(PATHS)})")
+    parser.add_argument('--cases', help='只测量名称包含这些关键字的图片，逗号分隔 (如 jpeg,cmyk)')
+    parser.add_argument('--large', action='store_true', help='加入24百万像素的大图')
+    parser.add_argument('--seed', type=int, default=20240101, help='生成图片集的随机种子')
+    parser.add_argument('--corpus-dir', help='图片集目录，已存在的文件直接复用 (默认: 临时目录)')
+    parser.add_argument('--output', help='将结果保存为JSON')
+    parser.add_argument('--baseline', help='与基线JSON对比，超出容差时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='相对基线允许的变慢比例 (默认: 0.25)')
+    parser.add_argument('--worker', nargs=2, metavar=('PATH', 'IMAGE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], args.worker[1], args.runs)
+        return 0
+
+    paths = [p.strip() for p in args.paths.split(',') if p.strip()]
+    unknown = [p for p in paths if p not in PATHS]
+    if unknown:
+        parser.error(f"未知处理路径: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cases = generate_corpus(args.corpus_dir or temp_dir, args.seed, args.large)
+        fingerprint = corpus_fingerprint(cases)
+        if args.cases:
+            keywords = [k.strip() for k in args.cases.split(',') if k.strip()]
+            cases = {name: path for name, path in cases.items() if any(k in name for k in keywords)}
+
+        print(f"图片集 {len(cases)} 张 (种子 {args.seed}, 指纹 {fingerprint})")
+        print(f"{'图片':22s} {'路径':15s} {'中位数':>10s} {'内存峰值':>10s} {'输出':>10s}")
+
+        results = {}
+        for name, image_path in cases.items():
+            results[name] = {}
+            for path_name in paths:
+                result = measure(path_name, image_path, args.runs)
+                results[name][path_name] = result
+                if 'median' in result:
+                    line = (f"{result['median'] * 1000:8.1f}ms {result['peak_rss_kb'] / 1024:8.1f}MB "
+                            f"{result['output_bytes'] / 1024:8.1f}KB")
+                else:
+                    line = f"失败: {result['error']}"
+                print(f"{name:22s} {path_name:15s} {line}")
+
+    if args.output:
+        from PIL import __version__ as pillow_version
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'pillow': pillow_version,
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'corpus_fingerprint': fingerprint,
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('corpus_fingerprint') != fingerprint:
+            print("⚠️ 图片集与基线不同（种子或编码器版本变化），对比结果仅供参考")
+
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print("❌ 预处理性能回退:")
+            for line in regressions:
+                print(f"  • {line}")
+            return 1
+        print("✅ 预处理性能未超出基线容差")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
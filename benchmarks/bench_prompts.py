@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+提示词版本基准测试
+用 prompts.py 中的各个提示词版本分析同一组图片，统计每个版本的提示词 token、生成 token、
+耗时、JSON 解析成功率和字段完整度（模型一次回答中有值的字段占模板字段的比例），
+以及缺少核心字段需要补充提问的比例，用测量结果决定提示词改动
+"""
+
+import sys
+import json
+import time
+import base64
+import argparse
+import statistics
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import Config  # noqa: E402
+from prompts import PROMPT_VERSIONS, ANALYSIS_OPTIONS, build_prompt, prompt_fields  # noqa: E402
+from json_repair import parse_model_json, core_fields, missing_fields  # noqa: E402
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.tiff', '.tif', '.gif', '.bmp'}
+
+
+def load_fixtures(directory, limit=None):
+    """按文件名顺序读取并预处理图片，返回 [(文件名, JPEG数据)]"""
+    from image_validator import ImageValidator
+    validator = ImageValidator()
+    fixtures = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        result, _ = validator.validate_and_fix_image(str(path))
+        if result:
+            fixtures.append((path.name, result['data']))
+        if limit and len(fixtures) >= limit:
+            break
+    return fixtures
+
+
+class OllamaRunner:
+    def __init__(self, model):
+        from image_analyzer import ImageAnalyzer
+        self.analyzer = ImageAnalyzer()
+        self.model = model or self.analyzer.model
+
+    def run(self, prompt, image_data):
+        """返回 (回答文本, 提示词token数, 生成token数)"""
+        image_b64 = base64.b64encode(image_data).decode('utf-8')
+        response = self.analyzer._chat(self.model, prompt, image_b64, ANALYSIS_OPTIONS)
+        return response['message']['content'], response.get('prompt_eval_count'), response.get('eval_count')
+
+
+class MLXRunner:
+    def __init__(self, model):
+        from mlx_analyzer import MLXImageAnalyzer
+        self.analyzer = MLXImageAnalyzer(model) if model else MLXImageAnalyzer()
+        if self.analyzer.mlx_available:
+            self.analyzer._load_model()
+        if self.analyzer.model is None:
+            raise RuntimeError("MLX模型不可用")
+
+    def run(self, prompt, image_data):
+        # mlx_vlm 只返回文本，不统计 token 数
+        from PIL import Image
+        text = self.analyzer._run(prompt, Image.open(BytesIO(image_data)),
+                                  max_tokens=ANALYSIS_OPTIONS['num_predict'],
+                                  temperature=ANALYSIS_OPTIONS['temperature'])
+        return text, None, None
+
+
+def measure(runner, version, platform, language, fixtures, runs):
+    prompt = build_prompt(version, platform, language)
+    expected = prompt_fields(prompt)
+    core = [field for field in core_fields(platform) if field in expected]
+
+    calls = []
+    for name, image_data in fixtures:
+        for _ in range(runs):
+            start = time.perf_counter()
+            try:
+                content, prompt_tokens, completion_tokens = runner.run(prompt, image_data)
+            except Exception as e:
+                calls.append({'image': name, 'error': str(e)[:200]})
+                continue
+            elapsed = time.perf_counter() - start
+
+            data, info = parse_model_json(content)
+            present = [field for field in expected if (data or {}).get(field)]
+            calls.append({
+                'image': name,
+                'wall_time': elapsed,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'parse': 'failed' if data is None else ('repaired' if info['repaired'] else 'clean'),
+                'truncated': info['truncated'],
+                'completeness': len(present) / len(expected) if expected else 1.0,
+                'needs_reask': data is not None and bool(missing_fields(data, core))
+            })
+    return prompt, expected, calls
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return statistics.mean(values) if values else None
+
+
+def summarize(prompt, expected, calls):
+    done = [call for call in calls if 'error' not in call]
+    wall_times = sorted(call['wall_time'] for call in done)
+
+    def rate(predicate):
+        return sum(1 for call in done if predicate(call)) / len(done) if done else None
+
+    return {
+        'prompt_chars': len(prompt),
+        'expected_fields': expected,
+        'calls': len(calls),
+        'errors': len(calls) - len(done),
+        'prompt_tokens': _mean([call['prompt_tokens'] for call in done]),
+        'completion_tokens': _mean([call['completion_tokens'] for call in done]),
+        'wall_time_median': statistics.median(wall_times) if wall_times else None,
+        'wall_time_p95': wall_times[min(int(len(wall_times) * 0.95), len(wall_times) - 1)] if wall_times else None,
+        'parse_clean': rate(lambda call: call['parse'] == 'clean'),
+        'parse_repaired': rate(lambda call: call['parse'] == 'repaired'),
+        'parse_failed': rate(lambda call: call['parse'] == 'failed'),
+        'truncated': rate(lambda call: call['truncated']),
+        'completeness': _mean([call['completeness'] for call in done]),
+        'reask_rate': rate(lambda call: call['needs_reask'])
+    }
+
+
+def _percent(value):
+    return value * 100 if value is not None else None
+
+
+def _fmt(value, pattern):
+    return pattern.format(value) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger 提示词版本基准测试')
+    parser.add_argument('images', help='测试图片目录')
+    parser.add_argument('--versions', default=','.join(PROMPT_VERSIONS),
+                        help=f"要对比的提示词版本，逗号分隔 (默认: {','.join(PROMPT_VERSIONS)})")
+    parser.add_argument('-p', '--platform', default='general', help='平台 (默认: general)')
+    parser.add_argument('--language', default='zh', choices=['zh', 'en'], help='回答语言 (默认: zh)')
+    parser.add_argument('--engine', default='ollama', choices=['ollama', 'mlx'], help='推理引擎 (默认: ollama)')
+    parser.add_argument('--model', help=f'模型名 (默认: {Config.OLLAMA_MODEL})')
+    parser.add_argument('--limit', type=int, help='最多使用的图片数')
+    parser.add_argument('--runs', type=int, default=1, help='每张图片每个版本的运行次数 (默认: 1)')
+    parser.add_argument('--record-cassette', metavar='DB', help='同时录制模型响应，之后可用 --replay-cassette 重复测试')
+    parser.add_argument('--replay-cassette', metavar='DB', help='回放录制的响应，只测量解析和字段完整度')
+    parser.add_argument('--output', help='将结果保存为JSON')
+    args = parser.parse_args()
+
+    versions = [version.strip() for version in args.versions.split(',') if version.strip()]
+    unknown = [version for version in versions if version not in PROMPT_VERSIONS]
+    if unknown:
+        parser.error(f"未知提示词版本: {', '.join(unknown)}")
+
+    if args.record_cassette or args.replay_cassette:
+        from cassette import use_cassette
+        # 回放时只接受同一图片、同一提示词的录制，否则各版本的对比没有意义
+        use_cassette(args.record_cassette or args.replay_cassette,
+                     'record' if args.record_cassette else 'replay', strict=True)
+
+    fixtures = load_fixtures(args.images, args.limit)
+    if not fixtures:
+        print(f"❌ 没有可用的测试图片: {args.images}")
+        return 1
+
+    try:
+        runner = OllamaRunner(args.model) if args.engine == 'ollama' else MLXRunner(args.model)
+    except (ImportError, RuntimeError) as e:
+        print(f"❌ 推理引擎 {args.engine} 不可用: {e}")
+        return 1
+    print(f"{len(fixtures)} 张图片 × {args.runs} 次, 平台 {args.platform}, 语言 {args.language}, 引擎 {args.engine}")
+
+    results = {}
+    for version in versions:
+        print(f"测试 {version}: {PROMPT_VERSIONS[version]['description']}")
+        prompt, expected, calls = measure(runner, version, args.platform, args.language, fixtures, args.runs)
+        results[version] = {'summary': summarize(prompt, expected, calls), 'calls': calls}
+
+    print(f"\n{'版本':12s} {'提示词token':>11s} {'生成token':>9s} {'耗时p50':>8s} {'耗时p95':>8s} "
+          f"{'解析成功':>8s} {'需修复':>6s} {'完整度':>6s} {'需补问':>6s} {'错误':>4s}")
+    for version, result in results.items():
+        s = result['summary']
+        parsed = None if s['parse_failed'] is None else 1 - s['parse_failed']
+        print(f"{version:12s} {_fmt(s['prompt_tokens'], '{:11.0f}'):>11s} "
+              f"{_fmt(s['completion_tokens'], '{:9.0f}'):>9s} "
+              f"{_fmt(s['wall_time_median'], '{:7.2f}s'):>8s} {_fmt(s['wall_time_p95'], '{:7.2f}s'):>8s} "
+              f"{_fmt(_percent(parsed), '{:7.0f}%'):>8s} {_fmt(_percent(s['parse_repaired']), '{:5.0f}%'):>6s} "
+              f"{_fmt(_percent(s['completeness']), '{:5.0f}%'):>6s} {_fmt(_percent(s['reask_rate']), '{:5.0f}%'):>6s} "
+              f"{s['errors']:4d}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'engine': args.engine,
+                'model': args.model or (Config.OLLAMA_MODEL if args.engine == 'ollama' else None),
+                'platform': args.platform,
+                'language': args.language,
+                'images': [name for name, _ in fixtures],
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到: {args.output}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
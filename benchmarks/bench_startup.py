@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+测量 cli.py --help、cli.py <图片> 和 Web 应用启动的耗时，
+可与基线结果对比以发现启动性能回退
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 不可达的Ollama地址，使 cli.py <图片> 只测量启动和处理流程，不依赖模型服务
+UNREACHABLE_OLLAMA = 'http://127.0.0.1:9'
+
+# 启动时不应导入的重型模块，只在首次分析时才加载
+LAZY_MODULES = ('numpy', 'ollama', 'mlx', 'mlx_vlm')
+
+# 只做启动、不处理图片的命令，检查其中是否提前导入了 LAZY_MODULES
+STARTUP_ONLY = ('cli_help', 'app_boot')
+
+
+def create_sample_image(directory):
+    """生成一张小测试图片"""
+    from PIL import Image
+
+    path = Path(directory) / 'startup_sample.jpg'
+    Image.new('RGB', (640, 480), (120, 160, 200)).save(path, quality=85)
+    return path
+
+
+def build_cases(work_dir):
+    """构造需要测量的命令"""
+    sample = create_sample_image(work_dir)
+    output = Path(work_dir) / 'startup_result.json'
+    return {
+        'cli_help': [sys.executable, str(ROOT / 'cli.py'), '--help'],
+        'cli_file': [sys.executable, str(ROOT / 'cli.py'), str(sample), '-o', str(output)],
+        'app_boot': [sys.executable, '-c', 'import app_enhanced'],
+    }
+
+
+def time_command(cmd, runs, work_dir):
+    """多次运行命令，返回耗时列表（秒）"""
+    env = dict(os.environ, OLLAMA_HOST=UNREACHABLE_OLLAMA, PYTHONPATH=str(ROOT))
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _importtime_lines(cmd, work_dir):
+    env = dict(os.environ, OLLAMA_HOST=UNREACHABLE_OLLAMA, PYTHONPATH=str(ROOT))
+    result = subprocess.run(
+        [cmd[0], '-X', 'importtime'] + cmd[1:],
+        cwd=work_dir, env=env, capture_output=True, text=True
+    )
+    return [line for line in result.stderr.splitlines() if line.startswith('import time:')]
+
+
+def eager_imports(cmd, work_dir):
+    """命令启动过程中导入了的 LAZY_MODULES"""
+    loaded = {line.rsplit('|', 1)[-1].strip() for line in _importtime_lines(cmd, work_dir)}
+    return [module for module in LAZY_MODULES if module in loaded]
+
+
+def slowest_imports(cmd, work_dir, limit=10):
+    """使用 -X importtime 找出最慢的导入"""
+    entries = []
+    for line in _importtime_lines(cmd, work_dir):
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative_us = int(parts[1])
+        except ValueError:
+            continue  # 表头
+        # 顶层模块只有一个前导空格，嵌套导入缩进更深，避免重复计入
+        name = parts[2].rstrip()[1:]
+        if not name.startswith(' '):
+            entries.append((cumulative_us, name))
+    return sorted(entries, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger 启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='每个命令运行次数 (默认: 5)')
+    parser.add_argument('--output', help='将结果保存为JSON')
+    parser.add_argument('--baseline', help='与基线JSON对比，超出容差时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='相对基线允许的变慢比例 (默认: 0.25)')
+    parser.add_argument('--importtime', action='store_true', help='列出各命令最慢的导入')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cases = build_cases(work_dir)
+        results = {}
+        eager = {}
+
+        for name, cmd in cases.items():
+            # 预热一次，排除首次编译字节码的影响
+            time_command(cmd, 1, work_dir)
+            timings = time_command(cmd, args.runs, work_dir)
+            results[name] = {
+                'median': statistics.median(timings),
+                'min': min(timings),
+                'max': max(timings),
+                'runs': args.runs
+            }
+            print(f"{name:10s} median {results[name]['median'] * 1000:8.1f} ms  "
+                  f"min {results[name]['min'] * 1000:8.1f} ms")
+
+            if args.importtime:
+                for cumulative_us, module in slowest_imports(cmd, work_dir):
+                    print(f"    {cumulative_us / 1000:8.1f} ms  {module}")
+
+            if name in STARTUP_ONLY:
+                modules = eager_imports(cmd, work_dir)
+                if modules:
+                    eager[name] = modules
+                    results[name]['eager_imports'] = modules
+
+    if eager:
+        print("❌ 启动时导入了应延迟加载的模块:")
+        for name, modules in eager.items():
+            print(f"  • {name}: {', '.join(modules)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            limit = baseline[name]['median'] * (1 + args.tolerance)
+            if result['median'] > limit:
+                regressions.append(
+                    f"{name}: {result['median'] * 1000:.1f} ms > {limit * 1000:.1f} ms "
+                    f"(基线 {baseline[name]['median'] * 1000:.1f} ms)"
+                )
+
+        if regressions:
+            print("❌ 启动耗时回退:")
+            for line in regressions:
+                print(f"  • {line}")
+            return 1
+        print("✅ 启动耗时未超出基线容差")
+
+    return 1 if eager else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
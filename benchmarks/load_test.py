@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Web API 端到端压力测试
+启动一个模拟 Ollama 的推理服务（固定延迟，可设置并行数和出错比例）和本地 app_enhanced 实例，
+多个并发用户按比例发送 /upload、/batch_upload、/export_excel 请求，
+统计吞吐量（张/分钟）、各接口延迟 p50/p95/p99、错误率，以及服务进程的 CPU 和内存随时间的变化
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from PIL import Image
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = ['upload', 'batch_upload', 'export_excel']
+
+# 同时包含各平台模板核心字段的回答，避免触发缺失字段的补充请求
+FAKE_ANALYSIS = {
+    'image_type': '风景摄影',
+    'main_subject': '湖边的山峦',
+    'description': '清晨的湖面倒映着远处的山峦，薄雾笼罩，画面宁静',
+    'scene_description': '湖泊、山峦和晨雾',
+    'keywords': ['湖泊', '山峦', '晨雾', '倒影', '风景', '自然', '宁静', '清晨'],
+    'keywords_cn': ['湖泊', '山峦', '晨雾', '倒影', '风景', '自然', '宁静', '清晨'],
+    'keywords_en': ['lake', 'mountain', 'morning mist', 'reflection', 'landscape', 'nature', 'calm', 'morning'],
+    'category': '自然风光',
+    'mood': '宁静',
+    'composition': '三分法构图',
+    'commercial_value': '适合旅游和自然主题'
+}
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """实现 ollama 客户端用到的 /api/tags、/api/show 和非流式 /api/chat"""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({'models': [{'name': name} for name in self.server.models]})
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == '/api/show':
+            self._send_json({'modelfile': '', 'parameters': '', 'template': ''})
+            return
+        if self.path != '/api/chat':
+            self._send_json({'error': 'not found'}, 404)
+            return
+
+        server = self.server
+        with server.rng_lock:
+            latency = max(server.rng.gauss(server.latency, server.jitter), 0)
+            failed = server.rng.random() < server.error_rate
+
+        # 与 Ollama 默认行为一致，超出并行数的请求排队等待
+        with server.slots:
+            time.sleep(latency)
+
+        if failed:
+            self._send_json({'error': 'simulated inference failure'}, 500)
+            return
+
+        prompt = ''.join(message.get('content', '') for message in request.get('messages', []))
+        content = json.dumps(FAKE_ANALYSIS, ensure_ascii=False)
+        self._send_json({
+            'model': request.get('model'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            'total_duration': int(latency * 1e9),
+            'prompt_eval_count': len(prompt) // 2,
+            'eval_count': len(content) // 2
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama(models, latency, jitter, parallel, error_rate, seed):
+    """在后台线程中启动模拟推理服务，返回 (服务, 地址)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.models = models
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.slots = threading.Semaphore(parallel)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(ollama_url, workdir, port=None):
+    """以 flask run 启动 app_enhanced，上传目录和任务数据库放在临时目录，返回 (进程, 地址)"""
+    port = port or _free_port()
+    env = dict(os.environ)
+    env.update({
+        'OLLAMA_HOST': ollama_url,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'JOB_DB_PATH': os.path.join(workdir, 'jobs.db'),
+        'NEAR_DUPLICATE_DB': '',
+        'KEYWORD_DICT_DB': '',
+        'PICTAGGER_PROFILE': ''
+    })
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app_enhanced', 'run',
+         '--host', '127.0.0.1', '--port', str(port), '--with-threads', '--no-reload', '--no-debugger'],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，详见 {log.name}")
+        try:
+            if requests.get(f"{url}/platforms", timeout=1).ok:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"服务在60秒内未就绪，详见 {log.name}")
+
+
+def make_images(count, megapixels, seed):
+    """生成带色块边缘的测试图片（避免被质量筛查判为模糊或纯色），返回 [(文件名, JPEG数据)]"""
+    rng = random.Random(seed)
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+    images = []
+    for i in range(count):
+        blocks = Image.frombytes('RGB', (48, 32), rng.randbytes(48 * 32 * 3))
+        buffer = BytesIO()
+        blocks.resize((width, height), Image.NEAREST).save(buffer, format='JPEG', quality=90)
+        images.append((f"load_{i:03d}.jpg", buffer.getvalue()))
+    return images
+
+
+def load_images(directory):
+    extensions = {'.jpg', '.jpeg', '.png', '.webp', '.tiff', '.tif', '.gif', '.bmp'}
+    return [
+        (path.name, path.read_bytes())
+        for path in sorted(Path(directory).iterdir())
+        if path.suffix.lower() in extensions
+    ]
+
+
+class ResourceSampler(threading.Thread):
+    """定期记录服务进程的 CPU 使用率、常驻内存和区间内完成的请求数"""
+
+    def __init__(self, pid, interval, completed):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.completed = completed
+        self.timeline = []
+        self._stop_event = threading.Event()
+
+    def _read(self):
+        """返回 (累计CPU秒数, 常驻内存字节)"""
+        if PSUTIL_AVAILABLE:
+            process = psutil.Process(self.pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{self.pid}/statm") as f:
+            pages = int(f.read().split()[1])
+        ticks = os.sysconf('SC_CLK_TCK')
+        return (int(fields[11]) + int(fields[12])) / ticks, pages * os.sysconf('SC_PAGE_SIZE')
+
+    def run(self):
+        start = time.time()
+        try:
+            last_cpu, _ = self._read()
+        except Exception as e:
+            print(f"无法读取进程 {self.pid} 的资源使用: {e}")
+            return
+        last_time, last_completed = start, self.completed()
+
+        while not self._stop_event.wait(self.interval):
+            try:
+                cpu, rss = self._read()
+            except Exception:
+                break
+            now, completed = time.time(), self.completed()
+            self.timeline.append({
+                't': round(now - start, 1),
+                'cpu_percent': round((cpu - last_cpu) / (now - last_time) * 100, 1),
+                'rss_mb': round(rss / 1024 / 1024, 1),
+                'completed': completed - last_completed
+            })
+            last_cpu, last_time, last_completed = cpu, now, completed
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def percentile(values, p):
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class LoadRunner:
+    """多个并发用户按权重随机选择接口发送请求"""
+
+    def __init__(self, base_url, mix, images, platform, language, model, export_rows, seed):
+        self.base_url = base_url
+        self.endpoints = [name for name in ENDPOINTS if mix.get(name)]
+        self.weights = [mix[name] for name in self.endpoints]
+        self.images = images
+        self.form = {'platform': platform, 'language': language, 'model': model}
+        self.export_rows = export_rows
+        self.seed = seed
+        self.records = []
+        self._lock = threading.Lock()
+        # 最近成功的分析结果，作为导出请求的内容
+        self._recent = deque(maxlen=50)
+        self._recent.append({'filename': 'seed.jpg', 'analysis': FAKE_ANALYSIS})
+
+    def completed(self):
+        return len(self.records)
+
+    def _request(self, session, endpoint, rng):
+        if endpoint == 'export_excel':
+            with self._lock:
+                recent = list(self._recent)
+            results = [recent[i % len(recent)] for i in range(self.export_rows)]
+            response = session.post(f"{self.base_url}/export_excel", json={'results': results},
+                                    stream=True, timeout=300)
+            size = sum(len(chunk) for chunk in response.iter_content(65536))
+            if response.status_code >= 400:
+                return f"HTTP {response.status_code}", size
+            return None, size
+
+        filename, data = rng.choice(self.images)
+        form = dict(self.form)
+        if endpoint == 'batch_upload':
+            form.update(file_index='1', total_files='1')
+        response = session.post(f"{self.base_url}/{endpoint}", data=form,
+                                files={'file': (filename, data)}, timeout=300)
+        if response.status_code >= 400:
+            return f"HTTP {response.status_code}", len(response.content)
+
+        payload = response.json()
+        if not payload.get('success'):
+            return payload.get('error') or '请求失败', len(response.content)
+        # /batch_upload 不返回原始数据，分析失败时格式化结果为失败说明
+        error = (payload.get('raw_data') or {}).get('error')
+        analysis = payload.get('analysis')
+        if not error and isinstance(analysis, str) and analysis.startswith(('分析失败', 'Analysis failed')):
+            error = analysis.split('：', 1)[-1].split(': ', 1)[-1]
+        if error:
+            error = error if error.startswith('分析失败') else f"分析失败: {error}"
+            return error[:120], len(response.content)
+        with self._lock:
+            self._recent.append({'filename': filename, 'analysis': payload.get('analysis')})
+        return None, len(response.content)
+
+    def user(self, index, deadline, remaining):
+        rng = random.Random(f"{self.seed}-{index}")
+        session = requests.Session()
+        while time.time() < deadline:
+            if remaining is not None:
+                with self._lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+
+            endpoint = rng.choices(self.endpoints, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                error, size = self._request(session, endpoint, rng)
+            except requests.RequestException as e:
+                error, size = type(e).__name__, 0
+            except ValueError:
+                error, size = '响应不是JSON', 0
+            latency = time.perf_counter() - start
+
+            with self._lock:
+                self.records.append({'endpoint': endpoint, 'latency': latency, 'error': error, 'bytes': size})
+
+    def run(self, users, duration, total_requests):
+        deadline = time.time() + duration
+        remaining = [total_requests] if total_requests else None
+        threads = [threading.Thread(target=self.user, args=(i, deadline, remaining), daemon=True)
+                   for i in range(users)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+
+def summarize(records, elapsed):
+    summary = {'elapsed': round(elapsed, 2), 'requests': len(records), 'endpoints': {}}
+    errors = [record for record in records if record['error']]
+    summary['error_rate'] = round(len(errors) / len(records), 4) if records else 0
+    summary['requests_per_second'] = round(len(records) / elapsed, 2) if elapsed else 0
+
+    images = [record for record in records if record['endpoint'] != 'export_excel' and not record['error']]
+    summary['images_per_minute'] = round(len(images) / elapsed * 60, 1) if elapsed else 0
+
+    for endpoint in ENDPOINTS:
+        selected = [record for record in records if record['endpoint'] == endpoint]
+        if not selected:
+            continue
+        latencies = [record['latency'] for record in selected if not record['error']]
+        error_counts = {}
+        for record in selected:
+            if record['error']:
+                error_counts[record['error']] = error_counts.get(record['error'], 0) + 1
+        summary['endpoints'][endpoint] = {
+            'requests': len(selected),
+            'errors': sum(error_counts.values()),
+            'error_types': error_counts,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else None
+        }
+    return summary
+
+
+def parse_mix(value):
+    """解析 upload=6,batch_upload=3,export_excel=1 形式的请求比例"""
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"未知接口: {name}（可选: {', '.join(ENDPOINTS)}）")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的比例: {part}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("至少需要一个比例大于0的接口")
+    return mix
+
+
+def _ms(value):
+    return f"{value * 1000:8.0f}ms" if value is not None else f"{'-':>10s}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PicTagger Web API 压力测试')
+    parser.add_argument('--url', help='测试已运行的服务（如 http://localhost:5001），不提供时自动启动本地实例和模拟推理服务')
+    parser.add_argument('--pid', type=int, help='配合 --url 使用，记录该服务进程的 CPU 和内存')
+    parser.add_argument('--users', type=int, default=4, help='并发用户数 (默认: 4)')
+    parser.add_argument('--duration', type=float, default=60, help='测试时长秒数 (默认: 60)')
+    parser.add_argument('--requests', type=int, help='总请求数，达到后提前结束')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('upload=6,batch_upload=3,export_excel=1'),
+                        help='各接口请求比例 (默认: upload=6,batch_upload=3,export_excel=1)')
+    parser.add_argument('--images', help='使用目录中的图片，默认生成测试图片')
+    parser.add_argument('--image-count', type=int, default=20, help='生成的测试图片数 (默认: 20)')
+    parser.add_argument('--megapixels', type=float, default=2, help='生成的测试图片像素数，单位百万 (默认: 2)')
+    parser.add_argument('--export-rows', type=int, default=50, help='每个导出请求包含的结果数 (默认: 50)')
+    parser.add_argument('-p', '--platform', default='general', help='分析平台 (默认: general)')
+    parser.add_argument('--language', default='zh', help='回答语言 (默认: zh)')
+    parser.add_argument('--model', default='llava:7b', help='请求中的模型名 (默认: llava:7b)')
+    parser.add_argument('--inference-latency', type=float, default=1.0, help='模拟推理平均耗时秒数 (默认: 1.0)')
+    parser.add_argument('--inference-jitter', type=float, default=0.2, help='模拟推理耗时标准差 (默认: 0.2)')
+    parser.add_argument('--inference-parallel', type=int, default=1,
+                        help='模拟推理服务同时处理的请求数，相当于 OLLAMA_NUM_PARALLEL (默认: 1)')
+    parser.add_argument('--inference-error-rate', type=float, default=0.0, help='模拟推理失败的比例 (默认: 0)')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='CPU/内存采样间隔秒数 (默认: 1)')
+    parser.add_argument('--seed', type=int, default=20240101, help='随机种子')
+    parser.add_argument('--output', help='将汇总和资源时间线保存为JSON')
+    args = parser.parse_args()
+
+    images = load_images(args.images) if args.images else make_images(args.image_count, args.megapixels, args.seed)
+    if not images:
+        print(f"❌ 目录中没有图片: {args.images}")
+        return 1
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        fake_server = None
+        if args.url:
+            base_url, pid = args.url.rstrip('/'), args.pid
+        else:
+            fake_server, ollama_url = start_fake_ollama(
+                [args.model], args.inference_latency, args.inference_jitter,
+                args.inference_parallel, args.inference_error_rate, args.seed
+            )
+            process, base_url = start_app(ollama_url, workdir)
+            pid = process.pid
+            print(f"模拟推理服务: {ollama_url} (平均 {args.inference_latency}s, 并行 {args.inference_parallel})")
+        print(f"测试 {base_url}: {args.users} 个并发用户, {args.duration:.0f}s, "
+              f"比例 {', '.join(f'{k}={v:g}' for k, v in args.mix.items())}, 图片 {len(images)} 张")
+
+        runner = LoadRunner(base_url, args.mix, images, args.platform, args.language, args.model,
+                            args.export_rows, args.seed)
+        sampler = ResourceSampler(pid, args.sample_interval, runner.completed) if pid else None
+        try:
+            if sampler:
+                sampler.start()
+            elapsed = runner.run(args.users, args.duration, args.requests)
+        finally:
+            if sampler:
+                sampler.stop()
+            if process:
+                process.terminate()
+                process.wait(timeout=10)
+            if fake_server:
+                fake_server.shutdown()
+
+    summary = summarize(runner.records, elapsed)
+    timeline = sampler.timeline if sampler else []
+
+    print(f"\n请求 {summary['requests']} 个, 用时 {summary['elapsed']}s, "
+          f"{summary['requests_per_second']} 请求/秒, {summary['images_per_minute']} 张/分钟, "
+          f"错误率 {summary['error_rate'] * 100:.1f}%")
+    print(f"{'接口':14s} {'请求':>6s} {'错误':>6s} {'p50':>10s} {'p95':>10s} {'p99':>10s} {'最长':>10s}")
+    for endpoint, stats in summary['endpoints'].items():
+        print(f"{endpoint:14s} {stats['requests']:6d} {stats['errors']:6d} {_ms(stats['p50'])} "
+              f"{_ms(stats['p95'])} {_ms(stats['p99'])} {_ms(stats['max'])}")
+        for error, count in stats['error_types'].items():
+            print(f"  • {error}: {count}")
+
+    if timeline:
+        print(f"\n服务进程: CPU 平均 {sum(s['cpu_percent'] for s in timeline) / len(timeline):.0f}%, "
+              f"最高 {max(s['cpu_percent'] for s in timeline):.0f}%; "
+              f"内存 起始 {timeline[0]['rss_mb']:.0f}MB, 最高 {max(s['rss_mb'] for s in timeline):.0f}MB, "
+              f"结束 {timeline[-1]['rss_mb']:.0f}MB")
+    elif args.url and not args.pid:
+        print("\n未提供 --pid，不记录服务进程的 CPU 和内存")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'config': {
+                    'users': args.users, 'duration': args.duration, 'mix': args.mix,
+                    'images': len(images), 'platform': args.platform,
+                    'inference_latency': None if args.url else args.inference_latency,
+                    'inference_parallel': None if args.url else args.inference_parallel
+                },
+                'summary': summary,
+                'timeline': timeline
+            }, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到: {args.output}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+本机性能校准
+对候选模型、图片尺寸和JPEG质量在本机做小规模基准测试，在满足 p95 延迟或吞吐量目标的组合中
+选择输出质量（JSON 解析成功且字段完整的程度）最高的一组写入调优配置文件，
+config.py 启动时读取该文件作为 OLLAMA_MODEL、MAX_IMAGE_SIZE 和 IMAGE_QUALITY 的默认值
+"""
+
+import json
+import time
+import base64
+import platform
+import statistics
+from datetime import datetime
+
+from config import SUPPORTED_MODELS
+from image_validator import ImageValidator
+from json_repair import parse_model_json
+from prompts import ANALYSIS_OPTIONS, build_prompt, prompt_fields
+
+
+DEFAULT_SIZES = [768, 1024, 1280, 1536]
+DEFAULT_QUALITIES = [80, 90]
+
+
+def installed_models():
+    """本机已安装且在支持列表中的模型，Ollama 不可用时返回空列表"""
+    try:
+        import ollama
+        names = {model['name'] for model in ollama.list()['models']}
+    except Exception:
+        return []
+    return [name for name in SUPPORTED_MODELS if name in names]
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def measure_candidate(analyzer, model, size, quality, image_paths, runs=1, platform_name='general', language='zh'):
+    """以一组参数预处理并分析样本图片，延迟包含预处理和一次推理请求"""
+    validator = ImageValidator()
+    prompt = build_prompt(analyzer.prompt_version, platform_name, language)
+    expected = prompt_fields(prompt)
+
+    latencies, scores, errors = [], [], 0
+    started = time.perf_counter()
+    for path in image_paths:
+        for _ in range(runs):
+            start = time.perf_counter()
+            try:
+                result, _ = validator.validate_and_fix_image(str(path), (size, size), quality)
+                if not result:
+                    errors += 1
+                    continue
+                image_b64 = base64.b64encode(result['data']).decode('utf-8')
+                response = analyzer._chat(model, prompt, image_b64, ANALYSIS_OPTIONS)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+            # 解析失败计为0分，否则为模板字段中有值的比例
+            data, _ = parse_model_json(response['message']['content'])
+            scores.append(sum(1 for field in expected if data.get(field)) / len(expected) if data else 0.0)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'model': model,
+        'max_image_size': size,
+        'image_quality': quality,
+        'samples': len(latencies),
+        'errors': errors,
+        'p50': round(statistics.median(latencies), 3) if latencies else None,
+        'p95': round(_percentile(latencies, 95), 3) if latencies else None,
+        'throughput': round(len(latencies) / elapsed * 60, 1) if elapsed else 0,
+        'quality': round(statistics.mean(scores), 3) if scores else 0.0
+    }
+
+
+def meets_target(candidate, target_p95=None, target_throughput=None):
+    if not candidate['samples'] or candidate['errors']:
+        return False
+    if target_p95 is not None and candidate['p95'] > target_p95:
+        return False
+    if target_throughput is not None and candidate['throughput'] < target_throughput:
+        return False
+    return True
+
+
+def choose(candidates, target_p95=None, target_throughput=None):
+    """返回 (选中的组合, 是否满足目标)
+
+    满足目标的组合中按输出质量、图片尺寸、JPEG质量依次取最高，同等时取延迟更低的；
+    都不满足时退而选择 p95 延迟最低的组合
+    """
+    eligible = [c for c in candidates if meets_target(c, target_p95, target_throughput)]
+    if eligible:
+        best = max(eligible, key=lambda c: (round(c['quality'], 2), c['max_image_size'], c['image_quality'], -c['p95']))
+        return best, True
+    measured = [c for c in candidates if c['samples']]
+    if not measured:
+        return None, False
+    return min(measured, key=lambda c: c['p95']), False
+
+
+def calibrate(image_paths, models, sizes=None, qualities=None, target_p95=None, target_throughput=None,
+              runs=1, platform_name='general', language='zh', log=print):
+    """对所有候选组合测量并选择，返回调优配置字典"""
+    from image_analyzer import ImageAnalyzer
+    analyzer = ImageAnalyzer()
+    sizes = sorted(sizes or DEFAULT_SIZES)
+    qualities = sorted(qualities or DEFAULT_QUALITIES)
+
+    candidates = []
+    for model in models:
+        # 首次请求包含模型加载时间，先预热一次，不计入结果
+        log(f"预热模型 {model}...")
+        measure_candidate(analyzer, model, sizes[0], qualities[0], image_paths[:1], 1, platform_name, language)
+
+        for quality in qualities:
+            for index, size in enumerate(sizes):
+                candidate = measure_candidate(analyzer, model, size, quality, image_paths, runs,
+                                              platform_name, language)
+                candidates.append(candidate)
+                log(f"  {model} {size}px q{quality}: p50 {candidate['p50']}s, p95 {candidate['p95']}s, "
+                    f"{candidate['throughput']} 张/分钟, 质量 {candidate['quality']:.2f}, 错误 {candidate['errors']}")
+
+                # 推理耗时随分辨率增加，当前尺寸已达不到目标时跳过更大的尺寸
+                if candidate['samples'] and not meets_target(candidate, target_p95, target_throughput):
+                    skipped = sizes[index + 1:]
+                    if skipped:
+                        log(f"  未达到目标，跳过 {', '.join(f'{s}px' for s in skipped)}")
+                    break
+
+    best, target_met = choose(candidates, target_p95, target_throughput)
+    if best is None:
+        raise RuntimeError("所有候选组合都失败，请检查 Ollama 服务和样本图片")
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'host': platform.node(),
+        'target': {'p95': target_p95, 'throughput': target_throughput},
+        'target_met': target_met,
+        'model': best['model'],
+        'max_image_size': best['max_image_size'],
+        'image_quality': best['image_quality'],
+        'measured': best,
+        'candidates': candidates
+    }
+
+
+def write_profile(profile, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,173 @@
+"""
+推理响应录制与回放
+录制模式下把每次 ollama.chat 的模型、提示词、参数和响应以 zlib 压缩存入 SQLite；
+回放模式下按图片哈希和请求参数直接返回录制的响应，不连接 Ollama，
+用于在不运行模型的情况下，对解析、格式化和导出做可重复的大批量性能测试
+"""
+
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from config import Config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    params TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    prompt BLOB NOT NULL,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    image_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    response BLOB NOT NULL,
+    created_at REAL,
+    UNIQUE (image_hash, params)
+);
+CREATE INDEX IF NOT EXISTS idx_responses_params ON responses (params);
+"""
+
+MODES = ('record', 'replay')
+
+
+class CassetteMiss(LookupError):
+    """回放时没有可用的录制响应"""
+
+
+def request_params(model, prompt, options=None):
+    """模型、提示词和推理参数的哈希，相同请求（不含图片）的录制共用"""
+    payload = json.dumps({'model': model, 'prompt': prompt, 'options': options or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def image_hash(image_b64):
+    """base64 图片数据的哈希，纯文本请求为空字符串"""
+    if image_b64 is None:
+        return ''
+    return hashlib.sha1(image_b64.encode('ascii')).hexdigest()
+
+
+class Cassette:
+    """SQLite 中的推理响应录制
+
+    回放时优先返回同一图片、同一请求的录制；没有时默认从同一请求的其他图片录制中
+    按图片哈希确定地选择一条，少量录制即可回放任意规模的图片集，strict 时则视为缺失
+    """
+
+    def __init__(self, db_path, mode='replay', strict=False):
+        if mode not in MODES:
+            raise ValueError(f"未知的录制模式: {mode}（可选: {', '.join(MODES)}）")
+        self.db_path = db_path
+        self.mode = mode
+        self.strict = strict
+        self.stats = {'recorded': 0, 'replayed': 0, 'substituted': 0, 'missed': 0}
+        self._lock = threading.Lock()
+        # 推理线程池中的多个线程共用一个连接，由锁串行化
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._known_params = set()
+        self._ids_by_params = {}
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def record(self, model, prompt, image_b64, options, response):
+        params = request_params(model, prompt, options)
+        data = zlib.compress(json.dumps(dict(response), ensure_ascii=False).encode('utf-8'), 6)
+        with self._lock:
+            with self._conn:
+                if params not in self._known_params:
+                    self._conn.execute(
+                        'INSERT OR IGNORE INTO requests (params, model, prompt, options) VALUES (?, ?, ?, ?)',
+                        (params, model, zlib.compress(prompt.encode('utf-8'), 6),
+                         json.dumps(options or {}, sort_keys=True))
+                    )
+                    self._known_params.add(params)
+                self._conn.execute(
+                    'INSERT INTO responses (image_hash, params, response, created_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (image_hash, params) DO UPDATE SET '
+                    'response = excluded.response, created_at = excluded.created_at',
+                    (image_hash(image_b64), params, data, time.time())
+                )
+            self.stats['recorded'] += 1
+
+    def _substitute_ids(self, params):
+        ids = self._ids_by_params.get(params)
+        if ids is None:
+            ids = self._ids_by_params[params] = [
+                row[0] for row in self._conn.execute(
+                    'SELECT id FROM responses WHERE params = ? ORDER BY id', (params,)
+                )
+            ]
+        return ids
+
+    def replay(self, model, prompt, image_b64, options):
+        """返回录制的响应，没有可用录制时抛出 CassetteMiss"""
+        params = request_params(model, prompt, options)
+        digest = image_hash(image_b64)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response FROM responses WHERE image_hash = ? AND params = ?', (digest, params)
+            ).fetchone()
+            if row is not None:
+                self.stats['replayed'] += 1
+            elif not self.strict:
+                ids = self._substitute_ids(params)
+                if ids:
+                    row = self._conn.execute(
+                        'SELECT response FROM responses WHERE id = ?',
+                        (ids[int(digest[:12] or '0', 16) % len(ids)],)
+                    ).fetchone()
+                    self.stats['substituted'] += 1
+            if row is None:
+                self.stats['missed'] += 1
+                raise CassetteMiss(f"录制中没有 {model} 的此请求 (参数 {params[:12]})")
+        return json.loads(zlib.decompress(row[0]))
+
+    def summary(self):
+        stats = self.stats
+        if self.replaying:
+            return (f"回放录制 {self.db_path}: 命中 {stats['replayed']}, "
+                    f"替代 {stats['substituted']}, 缺失 {stats['missed']}")
+        return f"录制到 {self.db_path}: {stats['recorded']} 个响应"
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def use_cassette(db_path, mode='replay', strict=False):
+    """设置本进程使用的录制，db_path 为空时停用，返回新的录制实例"""
+    global _active
+    with _active_lock:
+        if _active is not None:
+            _active.close()
+        _active = Cassette(db_path, mode, strict) if db_path else None
+        return _active
+
+
+def active_cassette():
+    """本进程使用的录制，未通过 use_cassette 设置时按 CASSETTE_DB 配置创建，未配置时返回 None"""
+    global _active
+    with _active_lock:
+        if _active is None and Config.CASSETTE_DB:
+            _active = Cassette(Config.CASSETTE_DB, Config.CASSETTE_MODE, Config.CASSETTE_STRICT)
+        return _active
@@ -0,0 +1,148 @@
+"""
+批量处理检查点
+每完成一张图片就把结果追加写入JSONL文件，中断后可用 --resume 跳过已完成的图片，
+最终的 JSON/CSV/TXT 导出也从检查点读取，处理过程中不在内存里累积结果
+"""
+
+import os
+import json
+import hashlib
+
+
+def params_key(platform, language='zh', model=None, engine='ollama'):
+    """影响分析结果的参数组合，参数不同的结果不能复用"""
+    raw = json.dumps([platform, language, model, engine])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def is_successful(result):
+    """结果是否可视为已完成（失败的图片在恢复时会重新处理）"""
+    return 'error' not in result and not (result.get('raw_data') or {}).get('error')
+
+
+# 与模型服务状态无关、文件不变时重试结果也相同的失败类型
+DETERMINISTIC_ERRORS = ('quality_screen_failed', 'image_validation_failed')
+
+
+def is_deterministic_failure(result):
+    """失败是否由图片本身决定（无法解码、未通过质量筛查），这类结果可以按文件指纹复用"""
+    return (result.get('raw_data') or {}).get('error_type') in DETERMINISTIC_ERRORS
+
+
+def read_records(path):
+    """逐行读取检查点，产出 (行偏移, 行长度, 记录)，遇到写了一半的行即停止"""
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            yield offset, len(line), record
+            offset += len(line)
+
+
+def merge_checkpoints(paths, output_path):
+    """合并多个分片的检查点，同一图片优先保留成功的结果，按文件路径排序写出；
+    返回合并后的参数key"""
+    entries = {}
+    params = set()
+    for i, path in enumerate(paths):
+        for offset, _, record in read_records(path):
+            params.add(record.get('params'))
+            ok = is_successful(record['result'])
+            previous = entries.get(record['key'])
+            if previous is None or ok or not previous[2]:
+                entries[record['key']] = (i, offset, ok)
+
+    if len(params) > 1:
+        raise ValueError('检查点的分析参数（平台/语言/模型/引擎）不一致，无法合并')
+
+    sources = [open(path, 'rb') for path in paths]
+    try:
+        with open(output_path, 'wb') as out:
+            for key in sorted(entries):
+                i, offset, _ = entries[key]
+                sources[i].seek(offset)
+                out.write(sources[i].readline())
+    finally:
+        for source in sources:
+            source.close()
+
+    return params.pop() if params else None
+
+
+class ResultCheckpoint:
+    """追加写入的JSONL结果检查点"""
+
+    def __init__(self, path, params, resume=False):
+        self.path = str(path)
+        self.params = params
+        # 文件路径 -> (行偏移, 是否成功)，只记录当前参数下的结果
+        self._index = {}
+
+        if resume and os.path.exists(self.path):
+            self._load()
+            self._file = open(self.path, 'ab')
+        else:
+            self._file = open(self.path, 'wb')
+
+    @staticmethod
+    def key_for(filepath):
+        return os.path.abspath(str(filepath))
+
+    def _load(self):
+        """读取已有检查点，截掉中断时写了一半的最后一行"""
+        valid_end = 0
+        for offset, length, record in read_records(self.path):
+            if record.get('params') == self.params:
+                self._index[record['key']] = (offset, is_successful(record['result']))
+            valid_end = offset + length
+
+        if valid_end != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def is_done(self, filepath):
+        entry = self._index.get(self.key_for(filepath))
+        return bool(entry and entry[1])
+
+    def append(self, result):
+        """写入一条结果，立即刷新到文件"""
+        key = self.key_for(result.get('filepath', result.get('filename')))
+        line = json.dumps({'key': key, 'params': self.params, 'result': result}, ensure_ascii=False)
+        offset = self._file.tell()
+        self._file.write(line.encode('utf-8') + b'\n')
+        self._file.flush()
+        self._index[key] = (offset, is_successful(result))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        """按首次处理顺序读取每张图片的最新结果"""
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, 'rb') as f:
+            for offset, _ in list(self._index.values()):
+                f.seek(offset)
+                yield json.loads(f.readline())['result']
+
+    def counts(self):
+        """返回 (成功数, 失败数)"""
+        successful = sum(1 for _, ok in self._index.values() if ok)
+        return successful, len(self._index) - successful
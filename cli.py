@@ -9,14 +9,15 @@ import os
 import sys
 import json
 from pathlib import Path
-from unified_analyzer import UnifiedImageAnalyzer as ImageAnalyzer
 from utils import ImageUtils, ResultExporter, ModelManager, setup_logging
+from file_discovery import iter_image_files, prefetch, parse_shard, shard_of
+from archive_input import ArchiveMember, is_archive_name, is_readable_archive, iter_archive_images
 
 def main():
     parser = argparse.ArgumentParser(description='PicTagger CLI - 智能图片标签生成器')
     
     # 基本参数
-    parser.add_argument('input', help='输入图片文件或目录路径')
+    parser.add_argument('input', nargs='?', help='输入图片文件、目录或压缩包 (.zip/.tar/.tar.gz) 路径')
     parser.add_argument('-p', '--platform', default='general', 
                        choices=['general', 'tuchong', 'shutterstock', 'getty', 'adobe_stock'],
                        help='目标平台 (默认: general)')
@@ -28,14 +29,70 @@ def main():
     # 高级选项
     parser.add_argument('--recursive', '-r', action='store_true',
                        help='递归处理子目录')
+    parser.add_argument('--no-sort', action='store_true',
+                       help='不排序，边发现文件边处理（适合超大目录树）')
+    parser.add_argument('--watch', action='store_true',
+                       help='处理完现有图片后持续监视目录，分析新增或修改的图片 (Ctrl+C 结束并导出)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                       help='监视模式下文件大小和修改时间保持不变多少秒后才开始分析 (默认: 2)')
     parser.add_argument('--keywords-only', action='store_true',
                        help='仅输出关键词')
     parser.add_argument('--check-duplicates', action='store_true',
                        help='检查重复文件')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='详细输出')
+    parser.add_argument('--no-progress', action='store_true',
+                       help='不显示整体进度（完成数、吞吐量、延迟分位数、剩余时间）')
+    parser.add_argument('--progress-interval', type=float,
+                       help='进度刷新间隔秒数 (默认: 终端0.5秒，非终端30秒)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='图片预处理进程数 (默认: 1)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='同时进行的模型推理请求数 (默认: 1)')
+    parser.add_argument('--checkpoint',
+                       help='逐条写入结果的JSONL检查点路径 (默认: 输出文件名.jsonl)')
+    parser.add_argument('--resume', action='store_true',
+                       help='从检查点恢复，跳过相同参数下已成功处理的图片')
+    parser.add_argument('--manifest',
+                       help='增量处理清单路径 (SQLite)，按路径/大小/修改时间/inode 复用未变化文件的上次结果')
+    parser.add_argument('--near-duplicates', metavar='DB',
+                       help='近似重复索引路径 (SQLite)，与已分析图片感知哈希相近的图片直接复用其结果')
+    parser.add_argument('--duplicate-distance', type=int,
+                       help='近似重复的最大汉明距离 (默认: 4，共64位)')
+    parser.add_argument('--record-cassette', metavar='DB',
+                       help='录制每次模型调用的请求和响应 (SQLite)，供之后回放')
+    parser.add_argument('--replay-cassette', metavar='DB',
+                       help='回放录制的模型响应，不连接 Ollama，用于可重复的大批量性能测试')
+    parser.add_argument('--cassette-strict', action='store_true',
+                       help='回放时只使用同一图片的录制，没有时记为失败 (默认从同一请求的其他录制中选取)')
+    
+    # 多节点分片
+    parser.add_argument('--shard', type=shard_arg,
+                       help='只处理第 i 个分片，共 N 片，格式 i/N (如 1/4)')
+    parser.add_argument('--shard-by', default='path', choices=['path', 'content'],
+                       help='分片依据：相对路径或文件内容哈希 (默认: path)')
+    parser.add_argument('--merge', nargs='+', metavar='CHECKPOINT',
+                       help='合并各分片的JSONL检查点并导出')
     
     # 系统管理
+    parser.add_argument('--profile-summary', nargs='?', const='', metavar='DIR',
+                       help='汇总性能剖析记录中最耗时的函数 (默认目录: PROFILE_DIR)')
+    parser.add_argument('--profile-top', type=int, default=25,
+                       help='--profile-summary 列出的函数数量 (默认: 25)')
+    parser.add_argument('--calibrate', action='store_true',
+                       help='用输入目录中的样本图片测量候选模型和图片尺寸，写入满足延迟/吞吐量目标的调优配置')
+    parser.add_argument('--target-p95', type=float,
+                       help='--calibrate 的单张图片 p95 延迟目标（秒）')
+    parser.add_argument('--target-throughput', type=float,
+                       help='--calibrate 的吞吐量目标（张/分钟）')
+    parser.add_argument('--calibrate-models',
+                       help='候选模型，逗号分隔 (默认: 已安装的支持模型)')
+    parser.add_argument('--calibrate-sizes',
+                       help='候选图片长边像素，逗号分隔 (默认: 768,1024,1280,1536)')
+    parser.add_argument('--calibrate-qualities',
+                       help='候选JPEG质量，逗号分隔 (默认: 80,90)')
+    parser.add_argument('--calibrate-samples', type=int, default=5,
+                       help='--calibrate 使用的样本图片数 (默认: 5)')
     parser.add_argument('--check-model', action='store_true',
                        help='检查模型状态')
     parser.add_argument('--download-model', action='store_true',
@@ -59,81 +116,364 @@ def main():
         success = ModelManager.download_recommended_model()
         sys.exit(0 if success else 1)
     
+    if args.profile_summary is not None:
+        from profiling import summarize
+        print(summarize(args.profile_summary or None, top=args.profile_top))
+        return
+    
+    if args.merge:
+        merge_shards(args, logger)
+        return
+    
+    if args.calibrate:
+        run_calibration(args, logger)
+        return
+    
+    if not args.input:
+        parser.error('需要指定输入图片文件或目录路径')
+    
     # 验证输入路径
     input_path = Path(args.input)
     if not input_path.exists():
         logger.error(f"输入路径不存在: {input_path}")
         sys.exit(1)
     
+    if args.watch:
+        if not input_path.is_dir():
+            logger.error("监视模式需要输入目录")
+            sys.exit(1)
+        # 先记录基线，处理现有文件期间新增的图片也能被发现
+        from watcher import DirectoryWatcher
+        watcher = DirectoryWatcher(input_path, args.recursive, settle_seconds=args.settle)
+    
     # 收集图片文件
-    image_files = collect_image_files(input_path, args.recursive)
+    is_archive = input_path.is_file() and is_archive_name(input_path.name)
+    if is_archive:
+        # 压缩包成员直接在内存中处理，不解压到磁盘
+        if not is_readable_archive(input_path):
+            logger.error(f"无法读取压缩包: {input_path}")
+            sys.exit(1)
+        from config import Config
+        image_files = iter_archive_images(input_path, max_member_size=Config.MAX_CONTENT_LENGTH)
+    else:
+        image_files = iter_image_files(input_path, args.recursive)
+    if args.shard:
+        shard_index, shard_count = args.shard
+        image_files = (
+            f for f in image_files
+            if shard_of(f, input_path, shard_count, args.shard_by) == shard_index
+        )
+        logger.info(f"分片 {shard_index}/{shard_count}（按{'内容' if args.shard_by == 'content' else '路径'}）")
     
-    if not image_files:
-        logger.error("未找到图片文件")
-        sys.exit(1)
+    if args.no_sort or is_archive:
+        # 流式发现，总数未知；压缩包按包内顺序处理，避免把所有成员读入内存
+        # 压缩包成员带有图片数据，只预读少量成员
+        image_files = prefetch(image_files, maxsize=4 if is_archive else 1024)
+        total = None
+    else:
+        image_files = sorted(image_files)
+        total = len(image_files)
+        
+        if not image_files and not args.watch:
+            logger.error("未找到图片文件")
+            sys.exit(1)
+        
+        logger.info(f"找到 {total} 个图片文件")
+    
+    # 确定输出路径和检查点
+    output_path, checkpoint_path = resolve_output_paths(args)
+    
+    from config import Config
+    from checkpoint import ResultCheckpoint, params_key, is_successful, is_deterministic_failure
+    checkpoint = ResultCheckpoint(
+        checkpoint_path, params_key(args.platform, 'zh', Config.OLLAMA_MODEL, 'ollama'),
+        resume=args.resume
+    )
     
-    logger.info(f"找到 {len(image_files)} 个图片文件")
+    run_successful = run_failed = run_skipped = run_reused = run_near_duplicates = 0
     
-    # 初始化分析器
+    # 增量清单：未变化的文件只做一次 stat，直接复用上次结果
+    manifest = None
+    if args.manifest:
+        from manifest import StatManifest
+        manifest = StatManifest(args.manifest, checkpoint.params)
+    reused = {}
+    fingerprints = {}
+    
+    if args.resume:
+        logger.info(f"从检查点恢复: 已完成 {checkpoint.counts()[0]} 个图片")
+        if total is not None:
+            image_files = [f for f in image_files if not checkpoint.is_done(f)]
+            run_skipped = total - len(image_files)
+            total = len(image_files)
+    
+    # 推理响应录制与回放
+    cassette = None
+    if args.record_cassette and args.replay_cassette:
+        logger.error("--record-cassette 和 --replay-cassette 不能同时使用")
+        sys.exit(1)
+    if args.record_cassette or args.replay_cassette:
+        from cassette import use_cassette
+        cassette = use_cassette(
+            args.record_cassette or args.replay_cassette,
+            'record' if args.record_cassette else 'replay',
+            strict=args.cassette_strict
+        )
+    elif Config.CASSETTE_DB:
+        from cassette import active_cassette
+        cassette = active_cassette()
+    if cassette is not None and cassette.replaying:
+        logger.info(f"回放模型响应: {cassette.db_path} ({len(cassette)} 条录制)")
+    
+    # 初始化分析器（延迟导入，保证 --help 和系统管理命令快速启动）
+    from unified_analyzer import UnifiedImageAnalyzer as ImageAnalyzer
+    from batch_pipeline import BatchPipeline
     analyzer = ImageAnalyzer()
-    results = []
+    if args.near_duplicates or args.duplicate_distance is not None:
+        distance = args.duplicate_distance if args.duplicate_distance is not None else Config.NEAR_DUPLICATE_DISTANCE
+        db_path = args.near_duplicates or Config.NEAR_DUPLICATE_DB
+        if not db_path:
+            logger.error("--duplicate-distance 需要配合 --near-duplicates 或 NEAR_DUPLICATE_DB 使用")
+            sys.exit(1)
+        analyzer.enable_near_duplicates(db_path, distance)
+    pipeline = BatchPipeline(
+        analyzer, args.platform, workers=args.workers, concurrency=args.concurrency
+    )
+    if args.workers > 1 or args.concurrency > 1:
+        logger.info(f"并行处理: 预处理进程 {args.workers}, 推理并发 {args.concurrency}")
     
-    # 处理图片
-    for i, image_file in enumerate(image_files, 1):
-        logger.info(f"处理 ({i}/{len(image_files)}): {image_file.name}")
-        
-        try:
-            # 检查重复文件
-            if args.check_duplicates:
-                is_dup, dup_name = ImageUtils.is_duplicate(str(image_file), str(image_file.parent))
+    progress = None
+    if not args.no_progress:
+        from progress import ProgressReporter
+        progress = ProgressReporter(total, interval=args.progress_interval, logger=logger)
+    
+    def pending_files(files, skip_done):
+        """逐个产出待处理文件，跳过已完成和重复的文件"""
+        nonlocal run_skipped
+        for image_file in files:
+            if skip_done and checkpoint.is_done(image_file):
+                run_skipped += 1
+                continue
+            if manifest is not None:
+                previous, fingerprints[image_file] = manifest.lookup(image_file)
+                # 关闭质量筛查后，之前被筛查拒收的图片重新处理
+                if (previous is not None and not Config.QUALITY_SCREEN
+                        and (previous.get('raw_data') or {}).get('error_type') == 'quality_screen_failed'):
+                    previous = None
+                if previous is not None:
+                    reused[image_file] = previous
+                    yield image_file
+                    continue
+            if args.check_duplicates and not isinstance(image_file, ArchiveMember):
+                try:
+                    is_dup, dup_name = ImageUtils.is_duplicate(str(image_file), str(image_file.parent))
+                except Exception as e:
+                    logger.error(f"检查重复文件 {image_file.name} 时出错: {e}")
+                    is_dup = False
                 if is_dup:
                     logger.warning(f"发现重复文件: {image_file.name} (与 {dup_name} 相同)")
                     continue
+            yield image_file
+    
+    def process(files, total, skip_done=False):
+        """分析一批图片并写入检查点，结果按输入顺序返回"""
+        nonlocal run_successful, run_failed, run_reused, run_near_duplicates
+        results = pipeline.run(pending_files(files, skip_done), skip=lambda f: f in reused)
+        for i, (image_file, analysis_data, error) in enumerate(results, 1):
+            position = f"{i}/{total}" if total is not None else str(i)
+            file_fingerprint = fingerprints.pop(image_file, None)
             
-            # 分析图片
-            analysis_data = analyzer.analyze_image(str(image_file), args.platform)
-            formatted_result = analyzer.format_for_platform(analysis_data, args.platform)
-
-            # 获取处理耗时
-            processing_time = analysis_data.get('image_info', {}).get('processing_time', 0)
-            logger.info(f"完成 {image_file.name}，耗时: {processing_time:.2f}秒")
-
-            # 获取图片信息
-            image_info = ImageUtils.get_image_info(str(image_file))
-
-            result = {
-                'filename': image_file.name,
-                'filepath': str(image_file),
-                'image_info': image_info,
-                'analysis': formatted_result,
-                'processing_time': f"{processing_time:.2f}s",
-                'raw_data': analysis_data,
-                'platform': args.platform
-            }
+            if image_file in reused:
+                result = reused.pop(image_file)
+                result.update(filename=image_file.name, filepath=str(image_file))
+                checkpoint.append(result)
+                if is_successful(result):
+                    run_reused += 1
+                    logger.info(f"复用 ({position}) {image_file.name}，文件未变化")
+                else:
+                    run_failed += 1
+                    logger.info(f"跳过 ({position}) {image_file.name}，文件未变化，上次未通过: "
+                                f"{str(result['raw_data'].get('error')).splitlines()[0]}")
+                if progress:
+                    progress.update(cache_hit=True)
+                continue
             
-            results.append(result)
+            try:
+                if error is not None:
+                    raise error
             
-            if args.verbose:
-                print(f"\n--- {image_file.name} ---")
-                print(formatted_result)
-                print("-" * 50)
+                formatted_result = analyzer.format_for_platform(analysis_data, args.platform)
+
+                # 获取处理耗时
+                processing_time = analysis_data.get('image_info', {}).get('processing_time', 0)
+                near_duplicate_of = analysis_data.get('image_info', {}).get('near_duplicate_of')
+                if near_duplicate_of:
+                    run_near_duplicates += 1
+                    logger.info(f"完成 ({position}) {image_file.name}，与 {near_duplicate_of} 近似重复，复用其结果")
+                else:
+                    logger.info(f"完成 ({position}) {image_file.name}，耗时: {processing_time:.2f}秒")
+
+                # 获取图片信息
+                if isinstance(image_file, ArchiveMember):
+                    image_info = image_file.image_info()
+                else:
+                    image_info = ImageUtils.get_image_info(str(image_file))
+
+                result = {
+                    'filename': image_file.name,
+                    'filepath': str(image_file),
+                    'image_info': image_info,
+                    'analysis': formatted_result,
+                    'processing_time': f"{processing_time:.2f}s",
+                    'raw_data': analysis_data,
+                    'platform': args.platform
+                }
+            
+                checkpoint.append(result)
+                if is_successful(result):
+                    run_successful += 1
+                else:
+                    run_failed += 1
+                # 无法解码或未通过质量筛查的图片也记入清单，文件不变时不再重复读取和筛查；
+                # 推理出错等临时失败不记录，下次运行重新处理
+                if manifest is not None and (is_successful(result) or is_deterministic_failure(result)):
+                    manifest.record(image_file, result, file_fingerprint)
+                if progress:
+                    progress.update(latency=processing_time, error=not is_successful(result),
+                                    cache_hit=bool(near_duplicate_of))
+            
+                if args.verbose:
+                    print(f"\n--- {image_file.name} ---")
+                    print(formatted_result)
+                    print("-" * 50)
         
-        except Exception as e:
-            logger.error(f"处理 {image_file.name} 时出错: {e}")
-            results.append({
-                'filename': image_file.name,
-                'filepath': str(image_file),
-                'error': str(e),
-                'platform': args.platform
-            })
-    
-    # 输出结果
+            except Exception as e:
+                logger.error(f"处理 {image_file.name} 时出错: {e}")
+                checkpoint.append({
+                    'filename': image_file.name,
+                    'filepath': str(image_file),
+                    'error': str(e),
+                    'platform': args.platform
+                })
+                run_failed += 1
+                if progress:
+                    progress.update(error=True)
+    
+    # 处理现有图片
+    process(image_files, total, skip_done=args.resume)
+    
+    images_per_minute = pipeline.images_per_minute()
+    
+    if args.resume:
+        logger.info(f"跳过 {run_skipped} 个已完成的图片")
+    
+    if args.watch:
+        logger.info(f"开始监视目录 ({watcher.mode}): {watcher.root}，按 Ctrl+C 结束")
+        try:
+            for batch in watcher.batches():
+                logger.info(f"发现 {len(batch)} 个新增或修改的图片")
+                if progress:
+                    progress.add_total(len(batch))
+                process(batch, len(batch))
+        except KeyboardInterrupt:
+            logger.info("停止监视")
+    
+    if progress:
+        progress.close()
+    
+    checkpoint.close()
+    if manifest is not None:
+        manifest.close()
+    if analyzer.duplicate_index is not None:
+        analyzer.duplicate_index.close()
+    if cassette is not None:
+        logger.info(cassette.summary())
+    
+    if total is None and run_successful + run_failed + run_skipped + run_reused == 0:
+        logger.error("未找到图片文件")
+        sys.exit(1)
+    logger.info(f"检查点已保存到: {checkpoint_path}")
+    
+    # 从检查点导出结果（包含恢复前已完成的图片）
+    export_results(checkpoint, args, output_path, logger)
+    
+    # 统计信息
+    logger.info(f"处理完成: 成功 {run_successful}, 失败 {run_failed}, 吞吐量 {images_per_minute:.1f} 张/分钟")
+    if manifest is not None:
+        logger.info(f"清单复用 {run_reused} 个未变化的图片")
+    if analyzer.duplicate_index is not None:
+        logger.info(f"近似重复复用 {run_near_duplicates} 个图片")
+    if args.resume:
+        successful, failed = checkpoint.counts()
+        logger.info(f"检查点累计: 成功 {successful}, 失败 {failed}")
+
+def run_calibration(args, logger):
+    """本机校准：测量候选组合并写入调优配置"""
+    from config import Config
+    from calibration import calibrate, installed_models, write_profile
+
+    if args.target_p95 is None and args.target_throughput is None:
+        logger.error("--calibrate 需要指定 --target-p95 或 --target-throughput")
+        sys.exit(1)
+    if not args.input or not Path(args.input).is_dir():
+        logger.error("--calibrate 需要包含样本图片的输入目录")
+        sys.exit(1)
+
+    samples = sorted(iter_image_files(args.input))[:args.calibrate_samples]
+    if not samples:
+        logger.error("输入目录中没有样本图片")
+        sys.exit(1)
+
+    def int_list(value):
+        return [int(item) for item in value.split(',') if item.strip()] if value else None
+
+    models = ([m.strip() for m in args.calibrate_models.split(',') if m.strip()] if args.calibrate_models
+              else installed_models() or [Config.OLLAMA_MODEL])
+    logger.info(f"校准: {len(samples)} 张样本, 候选模型 {', '.join(models)}")
+
+    profile = calibrate(
+        samples, models, int_list(args.calibrate_sizes), int_list(args.calibrate_qualities),
+        target_p95=args.target_p95, target_throughput=args.target_throughput,
+        platform_name=args.platform, log=logger.info
+    )
+    write_profile(profile, Config.TUNED_PROFILE)
+
+    measured = profile['measured']
+    status = "满足目标" if profile['target_met'] else "没有组合满足目标，使用延迟最低的组合"
+    logger.info(f"{status}: 模型 {profile['model']}, 图片 {profile['max_image_size']}px, "
+                f"质量 {profile['image_quality']} (p95 {measured['p95']}s, {measured['throughput']} 张/分钟, "
+                f"输出质量 {measured['quality']:.2f})")
+    logger.info(f"调优配置已保存到: {Config.TUNED_PROFILE}，显式设置的环境变量仍然优先")
+
+def shard_arg(value):
+    """argparse 的 --shard 参数类型"""
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def resolve_output_paths(args):
+    """确定导出文件和检查点路径，分片运行时默认检查点名带上分片编号"""
     if args.output:
         output_path = Path(args.output)
     else:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = Path(f"pictagger_results_{timestamp}.{args.format}")
     
+    shard_suffix = f".shard{args.shard[0]}of{args.shard[1]}" if args.shard else ""
+    if args.checkpoint:
+        checkpoint_path = Path(args.checkpoint)
+    elif args.output:
+        checkpoint_path = output_path.with_suffix(f'{shard_suffix}.jsonl')
+    else:
+        checkpoint_path = Path(f'pictagger_checkpoint{shard_suffix}.jsonl')
+    if checkpoint_path == output_path or (args.merge and str(checkpoint_path) in args.merge):
+        checkpoint_path = output_path.with_suffix('.merged.jsonl')
+    
+    return output_path, checkpoint_path
+
+def export_results(results, args, output_path, logger):
+    """按输出格式导出结果"""
     try:
         if args.keywords_only:
             output_file, keyword_count = ResultExporter.export_keywords_only(
@@ -160,32 +500,29 @@ def main():
     except Exception as e:
         logger.error(f"导出结果时出错: {e}")
         sys.exit(1)
+
+def merge_shards(args, logger):
+    """合并各分片的检查点，生成一份导出"""
+    from checkpoint import ResultCheckpoint, merge_checkpoints
     
-    # 统计信息
-    successful = len([r for r in results if 'error' not in r])
-    failed = len(results) - successful
-    
-    logger.info(f"处理完成: 成功 {successful}, 失败 {failed}")
-
-def collect_image_files(path, recursive=False):
-    """收集图片文件"""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff'}
-    image_files = []
-    
-    if path.is_file():
-        if path.suffix.lower() in image_extensions:
-            image_files.append(path)
-    elif path.is_dir():
-        if recursive:
-            for file_path in path.rglob('*'):
-                if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                    image_files.append(file_path)
-        else:
-            for file_path in path.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                    image_files.append(file_path)
-    
-    return sorted(image_files)
+    missing = [path for path in args.merge if not os.path.exists(path)]
+    if missing:
+        logger.error(f"检查点不存在: {', '.join(missing)}")
+        sys.exit(1)
+    
+    output_path, checkpoint_path = resolve_output_paths(args)
+    try:
+        params = merge_checkpoints(args.merge, str(checkpoint_path))
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    
+    with ResultCheckpoint(checkpoint_path, params, resume=True) as checkpoint:
+        successful, failed = checkpoint.counts()
+        logger.info(f"合并 {len(args.merge)} 个检查点到: {checkpoint_path}")
+        export_results(checkpoint, args, output_path, logger)
+    
+    logger.info(f"合并完成: 成功 {successful}, 失败 {failed}")
 
 if __name__ == '__main__':
     from datetime import datetime
@@ -1,12 +1,29 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def load_tuned_profile(path):
+    """读取 cli.py --calibrate 生成的调优配置，不存在或无法解析时返回空字典"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return profile if isinstance(profile, dict) else {}
+
+
+# 本机校准得到的模型和图片参数，作为默认值使用，环境变量优先
+TUNED_PROFILE = os.getenv('TUNED_PROFILE', 'pictagger_tuned.json')
+_tuned = load_tuned_profile(TUNED_PROFILE)
+
 class Config:
     # Ollama配置
     OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
-    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'qwen2.5vl:7b')
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', _tuned.get('model', 'qwen2.5vl:7b'))
+    TUNED_PROFILE = TUNED_PROFILE
     
     # Flask配置
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
@@ -14,10 +31,52 @@ class Config:
     
     # 上传配置
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))        # 上传写盘块大小
+    UPLOAD_QUOTA_BYTES = int(os.getenv('UPLOAD_QUOTA_MB', 2048)) * 1024 * 1024   # 上传目录磁盘配额，0为不限制
+    UPLOAD_RETENTION_SECONDS = int(os.getenv('UPLOAD_RETENTION_DAYS', 7)) * 86400  # 上传文件保留期限，0为不限制
+    
+    # 批量任务结果存储
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'pictagger_jobs.db')
     
     # 图片处理配置
-    MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', 1536))  # 增加到1536以更好处理大图
-    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 90))     # 提高质量保持细节
+    MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', _tuned.get('max_image_size', 1536)))  # 增加到1536以更好处理大图
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', _tuned.get('image_quality', 90)))     # 提高质量保持细节
+    
+    # 模型返回的JSON缺少核心字段时，只针对缺失字段重新提问的最大token数，0为不重新提问
+    JSON_REASK_MAX_TOKENS = int(os.getenv('JSON_REASK_MAX_TOKENS', 256))
+    
+    # 推理前质量筛查：按 PLATFORM_TEMPLATES[平台]['quality'] 的阈值拒收模糊、纯色、严重过曝/欠曝或
+    # 分辨率不足的图片，不调用模型（默认关闭）
+    QUALITY_SCREEN = os.getenv('QUALITY_SCREEN', '').lower() in ('1', 'true', 'yes', 'on')
+    
+    # 近似重复复用：感知哈希索引数据库路径（留空不启用）和最大汉明距离
+    NEAR_DUPLICATE_DB = os.getenv('NEAR_DUPLICATE_DB', '')
+    NEAR_DUPLICATE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_DISTANCE', 4))
+    
+    # 中英关键词词典路径（留空不启用），收录词条数达到下限后模型只生成一种语言的关键词
+    KEYWORD_DICT_DB = os.getenv('KEYWORD_DICT_DB', '')
+    KEYWORD_DICT_MIN_TERMS = int(os.getenv('KEYWORD_DICT_MIN_TERMS', 500))
+    
+    # 性能剖析：开启后每次分析记录 cProfile 和内存峰值（也可按请求用 X-PicTagger-Profile 头开启）
+    PROFILE_ENABLED = os.getenv('PICTAGGER_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))   # 保留最新的记录份数
+    
+    # 分析提示词版本（见 prompts.py），留空时 Ollama 使用 v1、MLX 使用 v1-mlx
+    PROMPT_VERSION = os.getenv('PROMPT_VERSION', '')
+    
+    # 推理响应录制：record 录制每次模型调用，replay 直接返回录制的响应而不连接 Ollama（留空不启用）
+    CASSETTE_DB = os.getenv('CASSETTE_DB', '')
+    CASSETTE_MODE = os.getenv('CASSETTE_MODE', 'record')
+    CASSETTE_STRICT = os.getenv('CASSETTE_STRICT', '').lower() in ('1', 'true', 'yes', 'on')  # 回放时只接受同一图片的录制
+    
+    # 负载降级：单张图片推理的延迟目标（秒，0为不启用）。排队数或按近期延迟预计的等待时间超出目标时
+    # 依次降低分辨率、换用小模型（DEGRADE_MODEL，留空跳过这一级）、只要求核心字段，负载回落后逐级恢复
+    DEGRADE_SLO_SECONDS = float(os.getenv('DEGRADE_SLO_SECONDS', 0))
+    DEGRADE_QUEUE_HIGH = int(os.getenv('DEGRADE_QUEUE_HIGH', 8))           # 排队数达到该值时直接降级
+    DEGRADE_MODEL = os.getenv('DEGRADE_MODEL', '')
+    DEGRADE_RECOVER_SECONDS = float(os.getenv('DEGRADE_RECOVER_SECONDS', 30))  # 负载回落后保持多久才升回一级
+    DEGRADE_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', 1))             # 推理服务同时处理的请求数
     
     # 批量处理配置
     MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 50))  # 增加到50张
@@ -65,18 +124,22 @@ SUPPORTED_MODELS = {
 }
 
 # 图片供稿平台关键词模板
+# quality 为推理前质量筛查阈值：最低像素数（百万）、清晰度（512像素长边上的拉普拉斯方差）、
+# 过曝/欠曝像素比例上限、颜色离散度下限（低于此值视为纯色画面）；不配置则不筛查
 PLATFORM_TEMPLATES = {
     'general': {
         'max_keywords': 30,
         'language': 'zh',
         'style': 'general',
-        'prompt_suffix': '生成通用的图片分析关键词。'
+        'prompt_suffix': '生成通用的图片分析关键词。',
+        'quality': {'min_megapixels': 0.1, 'min_sharpness': 5, 'max_clipped': 0.5, 'min_color_spread': 3}
     },
     'tuchong': {
         'max_keywords': 30,
         'language': 'zh',
         'style': 'artistic',
         'prompt_suffix': '生成适合图虫网的中文艺术摄影关键词。',
+        'quality': {'min_megapixels': 1, 'min_sharpness': 8, 'max_clipped': 0.4, 'min_color_spread': 4},
         'categories': [
             '城市风光', '自然风光', '野生动物', '静物美食', 
             '动物萌宠', '商务肖像', '生活方式', '室内空间', 
@@ -87,13 +150,15 @@ PLATFORM_TEMPLATES = {
         'max_keywords': 45,
         'language': 'en',
         'style': 'versatile',
-        'prompt_suffix': 'Generate versatile stock photo keywords for Adobe Stock.'
+        'prompt_suffix': 'Generate versatile stock photo keywords for Adobe Stock.',
+        'quality': {'min_megapixels': 4, 'min_sharpness': 10, 'max_clipped': 0.3, 'min_color_spread': 4}
     },
     'vcg': {
         'max_keywords': 50,
         'language': 'zh',
         'style': 'commercial',
         'prompt_suffix': '生成适合视觉中国的商业摄影关键词，注重商业价值和专业性。',
+        'quality': {'min_megapixels': 4, 'min_sharpness': 10, 'max_clipped': 0.3, 'min_color_spread': 4},
         'categories': [
             '商业金融', '科技创新', '医疗健康', '教育培训',
             '旅游休闲', '生活方式', '工业制造', '建筑空间',
@@ -0,0 +1,148 @@
+"""
+负载降级
+排队积压或近期推理变慢、预计等待时间超出延迟目标时，按档位依次降低图片分辨率、换用小模型、
+只要求核心字段；负载回落并保持一段时间后逐级恢复。每个结果的 image_info 中记录产生它的档位
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image
+
+from config import Config
+
+logger = logging.getLogger('PicTagger')
+
+# 升级前要求上一档的预计等待时间低于目标的这一比例，避免在阈值附近来回切换
+RECOVER_RATIO = 0.6
+
+
+def default_tiers():
+    """按配置生成降级档位，每一档在上一档的基础上再降一项"""
+    full_size = Config.MAX_IMAGE_SIZE
+    tiers = [{'name': 'full', 'model': None, 'max_image_size': None, 'prompt_version': None}]
+
+    if full_size > 1024:
+        tiers.append(dict(tiers[-1], name='reduced_resolution', max_image_size=1024))
+    if Config.DEGRADE_MODEL:
+        tiers.append(dict(tiers[-1], name='small_model', model=Config.DEGRADE_MODEL,
+                          max_image_size=min(full_size, 768)))
+    tiers.append(dict(tiers[-1], name='core_fields', max_image_size=min(full_size, 768),
+                      prompt_version='v2-core'))
+    return tiers
+
+
+def policy_from_config():
+    """DEGRADE_SLO_SECONDS 大于0时返回按配置创建的降级策略，否则返回 None"""
+    if Config.DEGRADE_SLO_SECONDS <= 0:
+        return None
+    return DegradationPolicy(default_tiers(), Config.DEGRADE_SLO_SECONDS, Config.DEGRADE_QUEUE_HIGH,
+                             Config.DEGRADE_PARALLEL, Config.DEGRADE_RECOVER_SECONDS)
+
+
+def downscale(image_data, max_size, quality):
+    """将预处理后的JPEG缩小到 max_size 以内，已经足够小时原样返回"""
+    with Image.open(BytesIO(image_data)) as img:
+        if max(img.size) <= max_size:
+            return image_data
+        img.draft('RGB', (max_size, max_size))
+        img = img.convert('RGB')
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+
+class DegradationPolicy:
+    """根据排队数和各档位的近期推理延迟选择档位，线程安全
+
+    排队数为正在等待或进行推理的请求数（含本次）。预计等待时间 = 该档位单次推理耗时的指数滑动平均 ×
+    ceil(排队数 / 推理服务并行数)。超出目标或排队数达到 queue_high 时降一级；
+    排队数回落到 queue_low 以下、上一档的预计等待低于目标的 RECOVER_RATIO，
+    并且距上次切换已过 recover_seconds 时升一级。
+    """
+
+    def __init__(self, tiers, slo_seconds, queue_high=8, parallel=1, recover_seconds=30,
+                 step_down_seconds=2, alpha=0.3):
+        self.tiers = tiers
+        self.slo_seconds = slo_seconds
+        self.queue_high = queue_high
+        self.queue_low = max(1, queue_high // 4)
+        self.parallel = max(1, parallel)
+        self.recover_seconds = recover_seconds
+        self.step_down_seconds = step_down_seconds
+        self.alpha = alpha
+
+        self.level = 0
+        self.inflight = 0
+        self._latency = [None] * len(tiers)
+        self._changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _expected_latency(self, level):
+        # 还没有测量过的档位按更高一档的延迟估计，偏保守
+        for candidate in range(level, -1, -1):
+            if self._latency[candidate] is not None:
+                return self._latency[candidate]
+        return None
+
+    def estimated_wait(self, level, depth):
+        latency = self._expected_latency(level)
+        if latency is None:
+            return 0.0
+        return latency * math.ceil(depth / self.parallel)
+
+    def _adjust(self, depth, now):
+        level = self.level
+        elapsed = now - self._changed_at
+        if (level < len(self.tiers) - 1 and elapsed >= self.step_down_seconds
+                and (depth >= self.queue_high or self.estimated_wait(level, depth) > self.slo_seconds)):
+            level += 1
+        elif (level > 0 and elapsed >= self.recover_seconds and depth <= self.queue_low
+              and self.estimated_wait(level - 1, depth) <= self.slo_seconds * RECOVER_RATIO):
+            level -= 1
+
+        if level != self.level:
+            logger.info(f"负载{'降级' if level > self.level else '恢复'}: {self.tiers[self.level]['name']} -> "
+                        f"{self.tiers[level]['name']}（排队 {depth}，"
+                        f"预计等待 {self.estimated_wait(self.level, depth):.1f}s，目标 {self.slo_seconds}s）")
+            self.level = level
+            self._changed_at = now
+
+    @contextmanager
+    def slot(self):
+        """登记一次推理，产出 (档位序号, 档位)，结束时记录该档位的延迟
+
+        同时在推理服务中排队的请求会拉长测得的延迟，按开始时的排队数折算为单次推理耗时，
+        负载回落后才能据此判断是否恢复
+        """
+        with self._lock:
+            self.inflight += 1
+            depth = self.inflight
+            self._adjust(depth, time.monotonic())
+            level = self.level
+        start = time.monotonic()
+        try:
+            yield level, self.tiers[level]
+        finally:
+            latency = (time.monotonic() - start) / math.ceil(depth / self.parallel)
+            with self._lock:
+                self.inflight -= 1
+                previous = self._latency[level]
+                self._latency[level] = latency if previous is None else \
+                    self.alpha * latency + (1 - self.alpha) * previous
+
+    def status(self):
+        with self._lock:
+            return {
+                'tier': self.tiers[self.level]['name'],
+                'level': self.level,
+                'inflight': self.inflight,
+                'slo_seconds': self.slo_seconds,
+                'latency': {tier['name']: round(latency, 3) for tier, latency in zip(self.tiers, self._latency)
+                            if latency is not None}
+            }
@@ -0,0 +1,442 @@
+"""
+Excel导出
+将批量分析结果逐行写入流式生成的XLSX文件，内存占用不随行数增长，
+并可在处理完全部行之前开始下载
+"""
+
+import re
+import logging
+import zipfile
+import unicodedata
+from io import RawIOBase
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger('PicTagger')
+
+
+def clean_description(description):
+    """清理描述中的冗余前缀"""
+    if not description:
+        return '精美图片'
+
+    # 定义需要去除的前缀模式
+    redundant_prefixes = [
+        '图片展示了',
+        '图片显示了',
+        '图片描述了',
+        '这张图片',
+        '图片中',
+        '图片里',
+        '画面中',
+        '画面里',
+        '照片中',
+        '照片里',
+        '图像中',
+        '图像里',
+        '此图',
+        '本图',
+        '图中',
+        '图里'
+    ]
+
+    # 去除前缀
+    cleaned = description.strip()
+    for prefix in redundant_prefixes:
+        if cleaned.startswith(prefix):
+            cleaned = cleaned[len(prefix):].strip()
+            # 如果去除前缀后以"是"、"为"、"有"等开头，也去除
+            if cleaned.startswith('是'):
+                cleaned = cleaned[1:].strip()
+            elif cleaned.startswith('为'):
+                cleaned = cleaned[1:].strip()
+            elif cleaned.startswith('有'):
+                cleaned = cleaned[1:].strip()
+            break
+
+    # 确保首字母大写（如果是中文则不变）
+    if cleaned and len(cleaned) > 0:
+        if cleaned[0].isalpha() and cleaned[0].islower():
+            cleaned = cleaned[0].upper() + cleaned[1:]
+
+    return cleaned if cleaned else '精美图片'
+
+
+def optimize_description_length(description, min_length=5, max_length=50):
+    """优化描述长度，确保在指定范围内"""
+    if not description:
+        return '精美图片素材'
+
+    # 先清理冗余前缀
+    cleaned = clean_description(description)
+
+    # 计算字符长度
+    length = len(cleaned)
+
+    if length >= min_length and length <= max_length:
+        # 长度合适，直接返回
+        return cleaned
+    elif length < min_length:
+        # 太短，需要扩展
+        return expand_description(cleaned, min_length)
+    else:
+        # 太长，需要智能缩短
+        return shorten_description(cleaned, max_length)
+
+
+def expand_description(description, min_length):
+    """扩展过短的描述"""
+    if len(description) >= min_length:
+        return description
+
+    # 添加通用的美化词汇来扩展描述
+    enhancement_words = [
+        '精美的', '优质的', '高清的', '专业的', '艺术的',
+        '美丽的', '壮观的', '清晰的', '生动的', '细腻的'
+    ]
+
+    # 根据内容选择合适的修饰词
+    if '风景' in description or '景色' in description or '山' in description or '海' in description:
+        preferred_words = ['壮观的', '美丽的', '优质的']
+    elif '人物' in description or '肖像' in description:
+        preferred_words = ['专业的', '精美的', '高清的']
+    elif '食物' in description or '美食' in description:
+        preferred_words = ['诱人的', '精美的', '美味的']
+    else:
+        preferred_words = ['精美的', '优质的', '专业的']
+
+    # 尝试添加修饰词
+    for word in preferred_words:
+        expanded = word + description
+        if len(expanded) >= min_length and len(expanded) <= 50:
+            return expanded
+
+    # 如果还是太短，添加"摄影作品"后缀
+    if len(description) + 4 <= 50:
+        return description + '摄影作品'
+    elif len(description) + 2 <= 50:
+        return description + '作品'
+
+    return description
+
+
+def shorten_description(description, max_length):
+    """智能缩短过长的描述"""
+    if len(description) <= max_length:
+        return description
+
+    # 优先去除不必要的修饰词和连接词
+    words_to_remove = [
+        '非常', '十分', '特别', '极其', '相当', '比较', '较为',
+        '显得', '看起来', '看上去', '仿佛', '好像', '似乎',
+        '在...下', '在...中', '在...里', '的时候', '的瞬间'
+    ]
+
+    shortened = description
+    for word in words_to_remove:
+        shortened = shortened.replace(word, '')
+
+    # 如果还是太长，智能截取
+    if len(shortened) > max_length:
+        # 尽量在标点符号处截断
+        punctuation = ['，', '。', '、', '；', '：']
+        for i in range(max_length - 1, max_length // 2, -1):
+            if shortened[i] in punctuation:
+                return shortened[:i]
+
+        # 如果没有找到合适的标点，直接截取
+        return shortened[:max_length]
+
+    return shortened
+
+
+# 确保分类在图虫网允许的分类列表中
+TUCHONG_CATEGORIES = [
+    '城市风光', '自然风光', '野生动物', '静物美食',
+    '动物萌宠', '商务肖像', '生活方式', '室内空间',
+    '生物医疗', '运动健康', '节日假日', '其他'
+]
+
+# 图片分类映射优化
+CATEGORY_MAPPING = {
+    '风景': '自然风光',
+    '景观': '自然风光',
+    '风光': '自然风光',
+    '自然': '自然风光',
+    '山水': '自然风光',
+    '建筑': '城市风光',
+    '城市': '城市风光',
+    '街道': '城市风光',
+    '人物': '商务肖像',
+    '肖像': '商务肖像',
+    '食物': '静物美食',
+    '美食': '静物美食',
+    '动物': '动物萌宠',
+    '宠物': '动物萌宠',
+    '生活': '生活方式',
+    '室内': '室内空间',
+    '医疗': '生物医疗',
+    '运动': '运动健康',
+    '健康': '运动健康',
+    '节日': '节日假日'
+}
+
+
+# 图虫平台导入模板的列名与列宽
+TUCHONG_COLUMNS = [
+    ('图片文件名', 25),
+    ('是否独家(选项)', 15),
+    ('图片说明', 50),
+    ('图片关键字', 60),
+    ('图片分类', 15),
+    ('图片用途(选项)', 20)
+]
+
+
+def build_tuchong_row(result):
+    """将单个分析结果转换为图虫平台Excel的一行"""
+    filename = result.get('filename', '')
+    analysis = result.get('analysis', {})
+
+    # 初始化默认值
+    description = '精美图片'
+    keywords_str = '摄影,图片,素材,创意,设计'
+    category = '其他'
+
+    # 处理analysis数据
+    if isinstance(analysis, str):
+        # 如果analysis是格式化后的字符串，需要解析
+        try:
+            # 尝试从格式化字符串中提取信息
+            lines = analysis.split('\n')
+            for line in lines:
+                if '图片说明：' in line:
+                    description = line.replace('图片说明：', '').strip()
+                elif '图片关键字：' in line:
+                    keywords_str = line.replace('图片关键字：', '').strip()
+                elif '图片分类：' in line:
+                    category = line.replace('图片分类：', '').strip()
+        except Exception as e:
+            print(f"解析格式化字符串失败: {e}")
+    elif isinstance(analysis, dict):
+        # 如果analysis是字典，从原始数据中提取
+        # 优先使用格式化后的description
+        description = (
+            analysis.get('description') or
+            analysis.get('detailed_description') or
+            analysis.get('main_subject', '精美图片')
+        )
+
+        # 处理关键词
+        keywords = analysis.get('keywords', [])
+        if not keywords:
+            keywords = analysis.get('keywords_cn', [])
+        if isinstance(keywords, str):
+            keywords = [k.strip() for k in keywords.split(',') if k.strip()]
+
+        if keywords:
+            keywords_str = ','.join(keywords)
+
+        # 处理图片分类
+        category = analysis.get('image_type', '其他')
+
+    # 优化描述长度，确保在5-50字符范围内
+    description = optimize_description_length(description, 5, 50)
+
+    # 验证和调整关键词
+    keywords_list = [k.strip() for k in keywords_str.split(',') if k.strip()]
+
+    # 限制关键词数量（5-30个）
+    if len(keywords_list) > 30:
+        keywords_list = keywords_list[:30]
+    elif len(keywords_list) < 5:
+        # 补充通用关键词
+        default_keywords = ['摄影', '图片', '素材', '创意', '设计', '艺术', '视觉', '专业', '高质量', '商业']
+        keywords_list.extend(default_keywords[:5-len(keywords_list)])
+
+    keywords_str = ','.join(keywords_list)
+
+    # 先尝试直接匹配
+    if category not in TUCHONG_CATEGORIES:
+        # 尝试映射匹配
+        mapped_category = None
+        for key, value in CATEGORY_MAPPING.items():
+            if key in category:
+                mapped_category = value
+                break
+
+        category = mapped_category if mapped_category else '其他'
+
+    # 使用正确的列顺序（与模板一致）
+    return [
+        filename,
+        '否',  # 是否独家，默认否
+        description,
+        keywords_str,
+        category,
+        '商业广告类'  # 图片用途，设置为商业广告类
+    ]
+
+
+def iter_tuchong_rows(results):
+    """逐条转换为图虫平台Excel行
+
+    流式下载开始后无法再返回错误响应，单条结果格式异常时记录日志并跳过该行，保证文件完整
+    """
+    for index, result in enumerate(results, 1):
+        try:
+            yield build_tuchong_row(result)
+        except Exception as e:
+            name = result.get('filename') if isinstance(result, dict) else None
+            logger.warning(f"导出Excel时跳过第 {index} 条结果 {name or ''}: {e}")
+
+
+# XML 1.0 不允许出现的控制字符
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# 样式0为默认，样式1为加粗表头
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+class _ChunkSink(RawIOBase):
+    """不可回退的输出缓冲区，zipfile写入后由生成器取走已产生的字节"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cell_xml(value, style=0):
+    """生成内联字符串单元格，避免共享字符串表需要预先收集全部文本"""
+    text = _ILLEGAL_XML_CHARS.sub('', '' if value is None else str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    style_attr = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style_attr}><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def stream_xlsx(rows, columns, sheet_name='工作表1', flush_rows=500):
+    """逐行生成XLSX文件字节流
+
+    rows: 可迭代的行（每行为单元格值列表），按需逐行读取
+    columns: [(列名, 列宽), ...]
+    flush_rows: 每写入多少行向调用方输出一次已压缩的数据
+    """
+    sink = _ChunkSink()
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        zf.writestr('_rels/.rels', _ROOT_RELS_XML)
+        zf.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        zf.writestr('xl/styles.xml', _STYLES_XML)
+        yield sink.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            cols = ''.join(
+                f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>'
+                for i, (_, width) in enumerate(columns, 1)
+            )
+            header = ''.join(_cell_xml(name, style=1) for name, _ in columns)
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                f'<cols>{cols}</cols><sheetData><row r="1">{header}</row>'
+            ).encode('utf-8'))
+
+            pending = []
+            for row_number, row in enumerate(rows, 2):
+                cells = ''.join(_cell_xml(value) for value in row)
+                pending.append(f'<row r="{row_number}">{cells}</row>')
+                if len(pending) >= flush_rows:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending.clear()
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            if pending:
+                sheet.write(''.join(pending).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+    yield sink.drain()
+
+
+def content_disposition(filename):
+    """生成附件下载的Content-Disposition头，非ASCII文件名使用RFC 5987编码"""
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        return f'attachment; filename="{simple}"; filename*=UTF-8\'\'{quoted}'
@@ -0,0 +1,127 @@
+"""
+图片文件发现
+基于 os.scandir 的生成器逐个产出图片文件，配合有界预取队列，
+超大目录树可以边遍历边分析，不必等全部文件收集、排序完成
+"""
+
+import os
+import queue
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff'}
+
+logger = logging.getLogger('PicTagger')
+
+
+def is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_image_files(path, recursive=False):
+    """按目录遍历顺序逐个产出图片文件路径（Path）"""
+    path = Path(path)
+    if path.is_file():
+        if is_image_name(path.name):
+            yield path
+        return
+
+    pending = [str(path)]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = []
+                for entry in entries:
+                    try:
+                        # 先按扩展名过滤，DirEntry 的类型信息通常无需额外 stat
+                        if is_image_name(entry.name) and entry.is_file():
+                            yield Path(entry.path)
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"无法读取目录 {directory}: {e}")
+            continue
+        # 逆序入栈，使子目录按遍历顺序处理
+        pending.extend(reversed(subdirs))
+
+
+def parse_shard(value):
+    """解析 "i/N" 形式的分片参数（i 从1开始），返回 (i, N)"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N，例如 1/4: {value}")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"分片序号应在 1 到 {count} 之间: {value}")
+    return index, count
+
+
+def shard_of(path, root, count, by='path'):
+    """返回文件所属分片（从1开始）
+
+    by='path' 按相对输入目录的路径哈希，各节点挂载位置不同也能得到相同结果；
+    by='content' 按文件内容哈希，文件被移动或改名后仍落在同一分片；
+    压缩包成员按包内路径或成员数据计算
+    """
+    data = getattr(path, 'data', None)
+    if by == 'content':
+        if data is not None:
+            digest = hashlib.md5(data).hexdigest()
+        else:
+            from utils import ImageUtils
+            digest = ImageUtils.calculate_file_hash(str(path))
+    else:
+        if data is not None:
+            relative = path.name
+        else:
+            root = Path(root)
+            relative = Path(path).relative_to(root) if root.is_dir() else Path(path).name
+        digest = hashlib.sha1(Path(relative).as_posix().encode('utf-8')).hexdigest()
+    return int(digest[:16], 16) % count + 1
+
+
+_DONE = object()
+
+
+def prefetch(iterable, maxsize=1024):
+    """在后台线程中提前消费 iterable，最多缓存 maxsize 项"""
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        # 消费方提前停止时放弃写入，避免后台线程永久阻塞
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=producer, name='file-discovery', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -1,17 +1,23 @@
 import base64
-import json
 from io import BytesIO
 from PIL import Image
-import ollama
 from config import Config, PLATFORM_TEMPLATES
+from json_repair import parse_model_json, core_fields, missing_fields, build_reask_prompt, merge_fields
+from keyword_dictionary import shared_dictionary, use_single_language, single_language_prompt, complete_keywords
+from cassette import active_cassette
+from prompts import ANALYSIS_OPTIONS, build_prompt, add_usage
 
 class ImageAnalyzer:
     def __init__(self):
         self.config = Config()
         self.model = self.config.OLLAMA_MODEL
+        self.keyword_dictionary = shared_dictionary()
+        self.prompt_version = self.config.PROMPT_VERSION or 'v1'
     
-    def compress_image(self, image_path, max_size=(1536, 1536), quality=90):
+    def compress_image(self, image_path, max_size=None, quality=None):
         """压缩图片以减少模型处理时间和内存占用，针对相机大图片优化"""
+        max_size = max_size or (self.config.MAX_IMAGE_SIZE, self.config.MAX_IMAGE_SIZE)
+        quality = quality or self.config.IMAGE_QUALITY
         with Image.open(image_path) as img:
             # 获取原始尺寸
             original_size = img.size
@@ -36,103 +42,37 @@ class ImageAnalyzer:
             
             return buffer.getvalue(), original_size, img.size
     
-    def generate_platform_prompt(self, platform='general', language='zh'):
-        """根据不同平台和语言生成优化的提示词"""
-        
-        if language == 'zh':
-            # 根据平台调整分类选项
-            if platform == 'tuchong' and platform in PLATFORM_TEMPLATES:
-                categories = PLATFORM_TEMPLATES[platform].get('categories', [])
-                category_options = '、'.join(categories)
-                base_prompt = f"""请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
-
-{{
-    "image_type": "图片分类，必须从以下选项中选择一个：{category_options}。如果识别不出具体分类，请选择'其他'",
-    "description": "图片说明，简洁明了地描述图片的主要内容和特点",
-    "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词5", "关键词6", "关键词7", "..."]
-}}
-
-重要要求：
-1. image_type字段必须严格从给定的12个分类选项中选择，不能使用其他分类
-2. 如果无法确定具体分类，请选择"其他"
-3. keywords字段必须包含至少5个以上的关键词，用于描述图片内容、风格、色彩、情感等
-4. 所有内容都用中文输出
-5. 请根据图片内容仔细选择最合适的分类"""
-            else:
-                base_prompt = """请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
-
-{
-    "image_type": "图片类型（风景/人物/动物/建筑/食物/产品/抽象/其他）",
-    "main_subject": "主要内容的简洁描述",
-    "detailed_description": "详细描述图片的构图、色彩、光线、氛围等",
-    "keywords_cn": ["中文关键词1", "中文关键词2", "..."],
-    "keywords_en": ["English keyword1", "English keyword2", "..."],
-    "mood": "情感色调（积极/中性/消极/神秘/温暖/冷静等）",
-    "color_palette": ["主要颜色1", "主要颜色2", "..."],
-    "composition": "构图描述（三分法/对称/引导线等）",
-    "lighting": "光线描述（自然光/人工光/逆光/侧光等）",
-    "commercial_use": "商业用途建议",
-    "target_audience": "目标受众",
-    "seasonal": "季节性（如适用）",
-    "location_type": "场景类型（室内/室外/工作室等）"
-}
-
-重要：请确保所有描述性文字都使用中文，关键词部分提供中英文两个版本。"""
-        else:
-            # 根据平台调整分类选项
-            if platform == 'tuchong' and platform in PLATFORM_TEMPLATES:
-                categories = PLATFORM_TEMPLATES[platform].get('categories', [])
-                category_options = ', '.join(categories)
-                base_prompt = f"""Please analyze this image in detail and output in the following JSON format:
-
-{{
-    "image_type": "Image category, must choose one from: {category_options}. If cannot identify specific category, choose 'Other'",
-    "description": "Image description, concisely describe the main content and characteristics of the image",
-    "keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5", "keyword6", "keyword7", "..."]
-}}
-
-Important requirements:
-1. The image_type field must strictly choose from the given 12 category options, no other categories allowed
-2. If unable to determine specific category, choose "Other"
-3. The keywords field must contain at least 5 or more keywords describing image content, style, colors, emotions, etc.
-4. All content should be in Chinese
-5. Please carefully select the most appropriate category based on the image content"""
-            else:
-                base_prompt = """Please analyze this image in detail and output in the following JSON format (please answer in English):
-
-{
-    "image_type": "Image type (landscape/portrait/animal/architecture/food/product/abstract/other)",
-    "main_subject": "Brief description of main content",
-    "detailed_description": "Detailed description of composition, colors, lighting, atmosphere, etc.",
-    "keywords_cn": ["Chinese keyword1", "Chinese keyword2", "..."],
-    "keywords_en": ["English keyword1", "English keyword2", "..."],
-    "mood": "Emotional tone (positive/neutral/negative/mysterious/warm/calm, etc.)",
-    "color_palette": ["Main color1", "Main color2", "..."],
-    "composition": "Composition description (rule of thirds/symmetry/leading lines, etc.)",
-    "lighting": "Lighting description (natural light/artificial light/backlight/side light, etc.)",
-    "commercial_use": "Commercial use suggestions",
-    "target_audience": "Target audience",
-    "seasonal": "Seasonality (if applicable)",
-    "location_type": "Scene type (indoor/outdoor/studio, etc.)"
-}
-
-Important: Please ensure all descriptive text is in English, and provide both Chinese and English versions for keywords."""
-
-        if platform in PLATFORM_TEMPLATES:
-            template = PLATFORM_TEMPLATES[platform]
-            if language == 'zh':
-                platform_prompt = f"{base_prompt}\n\n特别要求：{template['prompt_suffix']}"
-                platform_prompt += f"\n关键词数量限制：{template['max_keywords']}个"
-            else:
-                platform_prompt = f"{base_prompt}\n\nSpecial requirements: {template['prompt_suffix']}"
-                platform_prompt += f"\nKeyword limit: {template['max_keywords']} keywords"
-            return platform_prompt
-        
-        return base_prompt
+    def generate_platform_prompt(self, platform='general', language='zh', version=None):
+        """根据不同平台和语言生成优化的提示词，version 为 prompts.py 中的提示词版本"""
+        return build_prompt(version or self.prompt_version, platform, language)
     
+    def check_model_availability(self):
+        """检查Ollama服务和默认模型是否可用"""
+        try:
+            import ollama
+            models = ollama.list()
+            available_models = [model['name'] for model in models['models']]
+            return {
+                'available': True,
+                'model': self.model,
+                'model_installed': self.model in available_models,
+                'models': available_models
+            }
+        except Exception as e:
+            return {
+                'available': False,
+                'model': self.model,
+                'error': str(e)
+            }
+
     def check_and_download_model(self, model_name):
         """检查模型是否存在，如果不存在则尝试下载"""
+        cassette = active_cassette()
+        if cassette is not None and cassette.replaying:
+            return True
+
         try:
+            import ollama
             # 检查模型是否已安装
             models = ollama.list()
             available_models = [model['name'] for model in models['models']]
@@ -161,8 +101,28 @@ Important: Please ensure all descriptive text is in English, and provide both Ch
             print(f"检查/下载模型时出错: {str(e)}")
             return False
 
-    def analyze_image(self, image_path, platform='general', model=None, language='zh'):
-        """使用指定模型分析图片"""
+    def _chat(self, model, prompt, image_b64=None, options=None):
+        """向Ollama发送一次带图片的对话请求，启用录制时记录响应或直接回放"""
+        cassette = active_cassette()
+        if cassette is not None and cassette.replaying:
+            return cassette.replay(model, prompt, image_b64, options)
+
+        import ollama
+        message = {'role': 'user', 'content': prompt}
+        if image_b64 is not None:
+            message['images'] = [image_b64]
+        response = ollama.chat(model=model, messages=[message], options=options or {})
+        if cassette is not None:
+            cassette.record(model, prompt, image_b64, options, response)
+        return response
+
+    def analyze_image(self, image_path, platform='general', model=None, language='zh', image_data=None,
+                      prompt_version=None):
+        """使用指定模型分析图片
+
+        image_data: 已预处理的JPEG数据，提供时不再重新读取和压缩图片
+        prompt_version: 本次使用的提示词版本，默认为分析器的 prompt_version
+        """
         # 如果没有指定模型，使用默认模型
         if model is None:
             model = self.model
@@ -178,55 +138,79 @@ Important: Please ensure all descriptive text is in English, and provide both Ch
         
         try:
             # 压缩图片
-            compressed_image, original_size, compressed_size = self.compress_image(image_path)
+            if image_data is not None:
+                compressed_image, original_size, compressed_size = image_data, None, None
+            else:
+                compressed_image, original_size, compressed_size = self.compress_image(image_path)
             
             # 转换为base64
             image_b64 = base64.b64encode(compressed_image).decode('utf-8')
             
-            # 生成平台和语言特定的提示词
-            prompt = self.generate_platform_prompt(platform, language)
-            
-            # 调用Ollama API
-            response = ollama.chat(
-                model=model,
-                messages=[{
-                    'role': 'user',
-                    'content': prompt,
-                    'images': [image_b64]
-                }],
-                options={
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                    'num_predict': 1000
-                }
-            )
-            
-            # 尝试解析JSON响应
+            # 生成平台和语言特定的提示词，词典可以补全时只要求一种语言的关键词
+            prompt_version = prompt_version or self.prompt_version
+            prompt = self.generate_platform_prompt(platform, language, prompt_version)
+            single_language = use_single_language(self.keyword_dictionary, platform)
+            fields = core_fields(platform)
+            if single_language:
+                prompt = single_language_prompt(prompt, language)
+                fields.remove('keywords_en' if language == 'zh' else 'keywords_cn')
+            
+            # 调用Ollama API，累计本次分析所有请求的token数
+            usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+            response = add_usage(usage, self._chat(model, prompt, image_b64, ANALYSIS_OPTIONS))
             content = response['message']['content']
-            
-            # 提取JSON部分
-            try:
-                # 查找JSON开始和结束位置
-                json_start = content.find('{')
-                json_end = content.rfind('}') + 1
-                
-                if json_start != -1 and json_end > json_start:
-                    json_str = content[json_start:json_end]
-                    analysis_data = json.loads(json_str)
+
+            # 解析JSON响应，格式有误或被截断时尽量修复
+            analysis_data, repair_info = parse_model_json(content)
+            reask = []
+            keyword_counts = None
+            if analysis_data is not None:
+                # 只针对缺失的核心字段重新提问，而不是整张图重新分析
+                reask = missing_fields(analysis_data, fields)
+                if reask and Config.JSON_REASK_MAX_TOKENS > 0:
+                    try:
+                        extra_response = add_usage(usage, self._chat(
+                            model, build_reask_prompt(reask, language), image_b64,
+                            {'temperature': 0.2, 'num_predict': Config.JSON_REASK_MAX_TOKENS}
+                        ))
+                        extra, _ = parse_model_json(extra_response['message']['content'])
+                        if extra:
+                            analysis_data = merge_fields(analysis_data, extra, reask)
+                    except Exception as e:
+                        print(f"补充字段请求失败: {str(e)}")
                 else:
-                    # 如果没有找到JSON，返回原始文本
-                    analysis_data = {"raw_response": content}
-                
-            except json.JSONDecodeError:
-                # JSON解析失败，返回原始响应
+                    reask = []
+
+                # 另一种语言的关键词由词典补全，词典没有的词只请模型翻译这些词；
+                # 模型同时给出两种语言时从中学习对照
+                if single_language:
+                    keyword_counts = complete_keywords(
+                        analysis_data, language, self.keyword_dictionary,
+                        lambda text, max_tokens: add_usage(usage, self._chat(model, text, None, {
+                            'temperature': 0.2, 'num_predict': max_tokens
+                        }))['message']['content']
+                    )
+                elif self.keyword_dictionary is not None:
+                    self.keyword_dictionary.learn_from_analysis(analysis_data)
+            else:
+                # 完全没有可用的JSON时返回原始文本
                 analysis_data = {"raw_response": content}
-            
+
             # 添加图片元信息
             analysis_data['image_info'] = {
                 'original_size': original_size,
                 'compressed_size': compressed_size,
-                'platform': platform
+                'platform': platform,
+                'json_repaired': repair_info['repaired'],
+                'json_truncated': repair_info['truncated'],
+                'reask_fields': reask,
+                'prompt_version': prompt_version,
+                'prompt_tokens': usage['prompt_tokens'],
+                'completion_tokens': usage['completion_tokens']
             }
+            if keyword_counts is not None:
+                analysis_data['image_info']['keywords_from_dictionary'] = keyword_counts[0]
+                analysis_data['image_info']['keywords_translated_by_model'] = keyword_counts[1]
             
             return analysis_data
             
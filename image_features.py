@@ -0,0 +1,205 @@
+"""
+本地图像特征
+主色调、亮度、对比度和光线类型可以直接从预处理后的缩略图像素计算，
+不再让模型生成 color_palette / lighting 字段，节省生成的 token
+"""
+
+import colorsys
+import importlib.util
+from io import BytesIO
+
+from PIL import Image
+
+# 只检查是否安装，NumPy 在计算时才导入，不拖慢 CLI 和 Web 服务的启动
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+
+# 由本地计算、不再写入提示词的字段
+LOCAL_FIELDS = ('color_palette', 'lighting')
+
+# 计算特征时使用的缩略图边长，4096 个像素足以得到稳定的主色调
+SAMPLE_SIZE = 64
+
+LIGHTING_NAMES = {
+    'backlit': ('逆光', 'backlight'),
+    'low_key': ('低调光', 'low-key lighting'),
+    'high_key': ('高调光', 'high-key lighting'),
+    'high_contrast': ('强对比光', 'high-contrast lighting'),
+    'soft': ('柔和光', 'soft lighting'),
+    'even': ('均匀光', 'even lighting')
+}
+
+# (色相上限, 中文名, 英文名)，按色相角度从小到大
+HUE_NAMES = [
+    (15, '红色', 'red'),
+    (40, '橙色', 'orange'),
+    (65, '黄色', 'yellow'),
+    (165, '绿色', 'green'),
+    (195, '青色', 'cyan'),
+    (255, '蓝色', 'blue'),
+    (290, '紫色', 'purple'),
+    (345, '粉色', 'pink'),
+    (360, '红色', 'red')
+]
+
+
+def color_name(rgb):
+    """把 RGB 颜色映射为 (中文名, 英文名)"""
+    r, g, b = (channel / 255.0 for channel in rgb)
+    hue, saturation, value = colorsys.rgb_to_hsv(r, g, b)
+
+    # 低饱和或很暗时按无彩色处理
+    if value < 0.18:
+        return '黑色', 'black'
+    if saturation < 0.15:
+        if value > 0.85:
+            return '白色', 'white'
+        return '灰色', 'gray'
+
+    degrees = hue * 360
+    if degrees < 45 and value < 0.6 and saturation > 0.3:
+        return '棕色', 'brown'
+    for limit, name_zh, name_en in HUE_NAMES:
+        if degrees < limit:
+            return name_zh, name_en
+    return '红色', 'red'
+
+
+def _sample_pixels(image_data):
+    """把图片数据解码为 SAMPLE_SIZE 大小的 RGB 像素数组"""
+    import numpy as np
+
+    with Image.open(BytesIO(image_data)) as img:
+        # draft 让 JPEG 在解码时直接按比例缩小
+        img.draft('RGB', (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+        img = img.convert('RGB')
+        img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+        return np.asarray(img, dtype=np.float32)
+
+
+def _kmeans(pixels, k, iterations=10):
+    """向量化 k-means，按亮度分位数确定初始中心，结果可复现"""
+    import numpy as np
+
+    luminance = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    order = np.argsort(luminance, kind='stable')
+    seeds = order[((np.arange(k) + 0.5) / k * len(pixels)).astype(int)]
+    centers = pixels[seeds].copy()
+
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        occupied = counts > 0
+        updated = centers.copy()
+        updated[occupied] = sums[occupied] / counts[occupied, None]
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+        centers = updated
+
+    labels = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    return centers, np.bincount(labels, minlength=k) / len(pixels)
+
+
+def _lighting_key(luma):
+    """根据亮度分布判断光线类型"""
+    import numpy as np
+
+    height, width = luma.shape
+    brightness = float(luma.mean())
+    contrast = float(luma.std())
+    shadows = float((luma < 0.2).mean())
+    highlights = float((luma > 0.9).mean())
+
+    # 逆光：中心主体明显暗于四周，且四周有高光
+    border = max(1, min(height, width) // 5)
+    center = luma[border:height - border, border:width - border]
+    edges = np.concatenate([
+        luma[:border].ravel(), luma[height - border:].ravel(),
+        luma[:, :border].ravel(), luma[:, width - border:].ravel()
+    ])
+    if center.size and float(edges.mean()) - float(center.mean()) > 0.2 and float((edges > 0.85).mean()) > 0.15:
+        return 'backlit'
+
+    if brightness < 0.3 and shadows > 0.5:
+        return 'low_key'
+    if brightness > 0.7 and highlights > 0.3 and shadows < 0.05:
+        return 'high_key'
+    if contrast > 0.3 or (shadows > 0.2 and highlights > 0.1):
+        return 'high_contrast'
+    if contrast < 0.12:
+        return 'even'
+    return 'soft'
+
+
+def extract_features(image_data, colors=5, min_ratio=0.05):
+    """从预处理后的图片数据计算主色调、亮度、对比度和光线类型
+
+    返回可序列化的字典，颜色名同时保留中英文，由 apply_features 按语言选用；
+    NumPy 不可用或图片无法解码时返回 None
+    """
+    if not NUMPY_AVAILABLE or not image_data:
+        return None
+    import numpy as np
+
+    try:
+        pixels = _sample_pixels(image_data)
+    except Exception:
+        return None
+
+    luma = (pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)) / 255.0
+    flat = pixels.reshape(-1, 3)
+    centers, ratios = _kmeans(flat, min(colors, len(flat)))
+
+    # 同名颜色合并（色值取占比最大的一簇），按占比从高到低排列
+    palette = {}
+    for center, ratio in sorted(zip(centers, ratios), key=lambda item: item[1], reverse=True):
+        if ratio <= 0:
+            continue
+        rgb = tuple(int(round(channel)) for channel in center)
+        name_zh, name_en = color_name(rgb)
+        if name_en in palette:
+            palette[name_en]['ratio'] += float(ratio)
+        else:
+            palette[name_en] = {
+                'name_zh': name_zh,
+                'name_en': name_en,
+                'hex': '#{:02x}{:02x}{:02x}'.format(*rgb),
+                'ratio': float(ratio)
+            }
+
+    dominant = []
+    for color in sorted(palette.values(), key=lambda item: item['ratio'], reverse=True):
+        if color['ratio'] >= min_ratio:
+            color['ratio'] = round(color['ratio'], 3)
+            dominant.append(color)
+
+    return {
+        'dominant_colors': dominant,
+        'brightness': round(float(luma.mean()), 3),
+        'contrast': round(float(luma.std()), 3),
+        'lighting_key': _lighting_key(luma)
+    }
+
+
+def apply_features(analysis_data, features, language='zh'):
+    """把本地特征写入分析结果，覆盖模型可能给出的同名字段"""
+    if not features or analysis_data is None:
+        return analysis_data
+    index = 0 if language == 'zh' else 1
+    name_key = 'name_zh' if language == 'zh' else 'name_en'
+    analysis_data['color_palette'] = [color[name_key] for color in features['dominant_colors']]
+    analysis_data['lighting'] = LIGHTING_NAMES[features['lighting_key']][index]
+    analysis_data['image_features'] = features
+    return analysis_data
+
+
+def strip_local_fields(prompt):
+    """从提示词的JSON模板中去掉由本地计算的字段"""
+    if not NUMPY_AVAILABLE:
+        return prompt
+    markers = tuple(f'"{field}"' for field in LOCAL_FIELDS)
+    return '\n'.join(line for line in prompt.split('\n') if not line.strip().startswith(markers))
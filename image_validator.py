@@ -4,7 +4,6 @@
 """
 
 import os
-import tempfile
 from PIL import Image, ImageFile
 from io import BytesIO
 import base64
@@ -26,10 +25,22 @@ class ImageValidator:
             return None, file_info
 
         # 第2步：尝试多种方式打开和处理图片
+        return self._process_with_fallbacks(image_path, file_info, max_size, quality)
+
+    def validate_and_fix_bytes(self, data, name='', max_size=(1536, 1536), quality=90):
+        """验证并修复内存中的图片数据（如压缩包成员），不写入磁盘"""
+        file_info = self._check_bytes_basic(data, name)
+        if file_info['has_error']:
+            return None, file_info
+
+        return self._process_with_fallbacks(data, file_info, max_size, quality)
+
+    def _process_with_fallbacks(self, source, file_info, max_size, quality):
+        """依次尝试各处理方法，source 为文件路径或图片字节"""
         for attempt, method in enumerate(['standard', 'robust', 'force'], 1):
             try:
                 result = self._process_image_with_method(
-                    image_path, method, max_size, quality
+                    source, method, max_size, quality
                 )
                 if result:
                     compressed_data, original_size, new_size = result
@@ -95,6 +106,38 @@ class ImageValidator:
 
         return info
 
+    def _check_bytes_basic(self, data, name):
+        """内存数据的基本检查"""
+        _, ext = os.path.splitext(name)
+        info = {
+            'has_error': False,
+            'errors': [],
+            'warnings': [],
+            'file_path': name,
+            'file_size': len(data),
+            'file_extension': ext.lower()
+        }
+
+        if not data:
+            info['errors'].append("文件大小为0字节")
+            info['has_error'] = True
+            return info
+
+        if len(data) < 100:
+            info['warnings'].append(f"文件过小({len(data)}字节)，可能不是有效图片")
+
+        if not self._check_image_header(data[:20], ext.lower()):
+            info['warnings'].append("文件头信息异常，可能不是标准图片格式")
+
+        return info
+
+    @staticmethod
+    def _open(source):
+        """打开文件路径或图片字节"""
+        if isinstance(source, bytes):
+            return Image.open(BytesIO(source))
+        return Image.open(source)
+
     def _check_image_header(self, header, ext):
         """检查图片文件头"""
         if not header:
@@ -134,7 +177,7 @@ class ImageValidator:
 
     def _process_standard(self, image_path, max_size, quality):
         """标准处理方法"""
-        with Image.open(image_path) as img:
+        with self._open(image_path) as img:
             original_size = img.size
 
             # 转换颜色模式
@@ -159,7 +202,7 @@ class ImageValidator:
 
     def _process_robust(self, image_path, max_size, quality):
         """健壮处理方法 - 使用更宽松的设置"""
-        with Image.open(image_path) as img:
+        with self._open(image_path) as img:
             original_size = img.size
 
             # 强制重新加载图片数据
@@ -182,46 +225,39 @@ class ImageValidator:
     def _process_force(self, image_path, max_size, quality):
         """强制处理方法 - 最后的尝试"""
         try:
-            # 尝试用PIL的最宽松模式打开
-            with open(image_path, 'rb') as f:
-                data = f.read()
-
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-                tmp.write(data)
-                tmp_path = tmp.name
-
-            try:
-                with Image.open(tmp_path) as img:
-                    # 强制加载
-                    img.load()
-                    original_size = img.size
-
-                    # 创建新图片对象
-                    new_img = Image.new('RGB', img.size, (255, 255, 255))
-
-                    try:
-                        if img.mode == 'RGB':
-                            new_img = img.copy()
-                        else:
-                            new_img.paste(img)
-                    except:
-                        # 如果粘贴失败，创建一个纯色图片
-                        pass
-
-                    # 缩放
-                    if max(original_size) > max(max_size):
-                        new_img = new_img.resize(max_size, Image.Resampling.NEAREST)
-
-                    # 保存
-                    buffer = BytesIO()
-                    new_img.save(buffer, format='JPEG', quality=85)
-
-                    return buffer.getvalue(), original_size, new_img.size
-            finally:
-                # 清理临时文件
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
+            # 尝试用PIL的最宽松模式打开，先完整读入内存
+            if isinstance(image_path, bytes):
+                data = image_path
+            else:
+                with open(image_path, 'rb') as f:
+                    data = f.read()
+
+            with Image.open(BytesIO(data)) as img:
+                # 强制加载
+                img.load()
+                original_size = img.size
+
+                # 创建新图片对象
+                new_img = Image.new('RGB', img.size, (255, 255, 255))
+
+                try:
+                    if img.mode == 'RGB':
+                        new_img = img.copy()
+                    else:
+                        new_img.paste(img)
+                except:
+                    # 如果粘贴失败，创建一个纯色图片
+                    pass
+
+                # 缩放
+                if max(original_size) > max(max_size):
+                    new_img = new_img.resize(max_size, Image.Resampling.NEAREST)
+
+                # 保存
+                buffer = BytesIO()
+                new_img.save(buffer, format='JPEG', quality=85)
+
+                return buffer.getvalue(), original_size, new_img.size
 
         except Exception as e:
             raise Exception(f"强制处理也失败了: {str(e)}")
@@ -0,0 +1,147 @@
+"""
+批量任务结果存储
+在服务端以SQLite保存每个批量任务的结构化分析结果，
+支持按任务导出和分页浏览历史记录
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    platform TEXT,
+    language TEXT,
+    model TEXT,
+    total INTEGER,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    file_index INTEGER,
+    filename TEXT,
+    file_hash TEXT,
+    success INTEGER,
+    analysis_json TEXT,
+    formatted TEXT,
+    error TEXT,
+    processing_time REAL,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_results_job ON results (job_id, id);
+"""
+
+
+class JobStore:
+    """批量任务及其结果的持久化存储"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def _conn(self):
+        # 每个线程使用独立连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def create_job(self, platform='general', language='zh', model=None, total=None):
+        """创建批量任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        with self._conn as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, platform, language, model, total, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, platform, language, model, total, time.time())
+            )
+        return job_id
+
+    def add_result(self, job_id, filename, analysis_data=None, formatted=None, error=None,
+                   file_hash=None, file_index=None):
+        """保存单张图片的分析结果"""
+        analysis_data = analysis_data or {}
+        error = error or analysis_data.get('error')
+        processing_time = analysis_data.get('image_info', {}).get('processing_time')
+        with self._conn as conn:
+            conn.execute(
+                'INSERT INTO results (job_id, file_index, filename, file_hash, success, analysis_json, '
+                'formatted, error, processing_time, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, file_index, filename, file_hash, 0 if error else 1,
+                 json.dumps(analysis_data, ensure_ascii=False), formatted, error,
+                 processing_time, time.time())
+            )
+
+    def get_job(self, job_id):
+        """获取任务信息及成功/失败统计"""
+        row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        counts = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(success), 0) FROM results WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        job = dict(row)
+        job['processed'] = counts[0]
+        job['successful'] = counts[1]
+        job['failed'] = counts[0] - counts[1]
+        return job
+
+    def list_jobs(self, page=1, per_page=20):
+        """分页列出任务，最新的在前"""
+        offset = (page - 1) * per_page
+        rows = self._conn.execute(
+            'SELECT j.*, COUNT(r.id) AS processed, COALESCE(SUM(r.success), 0) AS successful '
+            'FROM jobs j LEFT JOIN results r ON r.job_id = j.id '
+            'GROUP BY j.id ORDER BY j.created_at DESC LIMIT ? OFFSET ?',
+            (per_page, offset)
+        ).fetchall()
+        total = self._conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+        return [dict(row) for row in rows], total
+
+    def list_results(self, job_id, page=1, per_page=20):
+        """分页列出任务结果，按处理顺序"""
+        offset = (page - 1) * per_page
+        rows = self._conn.execute(
+            'SELECT id, file_index, filename, file_hash, success, formatted, error, processing_time '
+            'FROM results WHERE job_id = ? ORDER BY id LIMIT ? OFFSET ?',
+            (job_id, per_page, offset)
+        ).fetchall()
+        total = self._conn.execute('SELECT COUNT(*) FROM results WHERE job_id = ?', (job_id,)).fetchone()[0]
+        return [dict(row) for row in rows], total
+
+    def iter_results(self, job_id, success_only=True, batch_size=500):
+        """逐批读取任务的结构化结果，供流式导出使用"""
+        conn = self._connect()
+        try:
+            query = 'SELECT filename, file_hash, success, analysis_json, error FROM results WHERE job_id = ?'
+            if success_only:
+                query += ' AND success = 1'
+            cursor = conn.execute(query + ' ORDER BY id', (job_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
+                        'filename': row['filename'],
+                        'file_hash': row['file_hash'],
+                        'success': bool(row['success']),
+                        'analysis': json.loads(row['analysis_json'] or '{}'),
+                        'error': row['error']
+                    }
+        finally:
+            conn.close()
@@ -0,0 +1,288 @@
+"""
+模型输出JSON修复
+视觉模型返回的JSON经常带有代码块标记、多余逗号、未转义的引号、中文全角标点，
+或因 token 上限被截断；这里用宽松的解析器尽量还原字段，截断时保留已完整输出的部分，
+并给出缺失字段供只针对这些字段重新提问
+"""
+
+import json
+
+
+# 字符串外（结构位置）出现时按对应的JSON结构字符处理
+STRUCTURAL = {
+    '{': '{', '｛': '{',
+    '}': '}', '｝': '}',
+    '[': '[', '［': '[',
+    ']': ']', '］': ']',
+    ':': ':', '：': ':',
+    ',': ',', '，': ',', '、': ','
+}
+
+# 开引号 -> 可作为闭引号的字符
+QUOTES = {
+    '"': '"”＂',
+    '“': '”"',
+    '＂': '＂"”',
+    "'": "'",
+    '‘': '’'
+}
+
+WHITESPACE = ' \t\r\n　﻿'
+
+# 不完整的值（输出在此处被截断）
+_INCOMPLETE = object()
+
+
+class _LenientParser:
+    """宽松的递归下降JSON解析器"""
+
+    def __init__(self, text, pos=0):
+        self.text = text
+        self.pos = pos
+        self.truncated = False
+
+    def at_end(self):
+        return self.pos >= len(self.text)
+
+    def skip_whitespace(self):
+        text = self.text
+        while self.pos < len(text):
+            if text[self.pos] in WHITESPACE:
+                self.pos += 1
+            elif text.startswith('//', self.pos):
+                end = text.find('\n', self.pos)
+                self.pos = len(text) if end == -1 else end + 1
+            elif text.startswith('/*', self.pos):
+                end = text.find('*/', self.pos + 2)
+                self.pos = len(text) if end == -1 else end + 2
+            else:
+                break
+
+    def peek_structural(self):
+        return STRUCTURAL.get(self.text[self.pos]) if not self.at_end() else None
+
+    def parse_value(self):
+        self.skip_whitespace()
+        if self.at_end():
+            return _INCOMPLETE
+        ch = self.text[self.pos]
+        structural = STRUCTURAL.get(ch)
+        if structural == '{':
+            return self.parse_object()
+        if structural == '[':
+            return self.parse_array()
+        if ch in QUOTES:
+            return self.parse_string()
+        return self.parse_bare()
+
+    def parse_object(self):
+        self.pos += 1
+        result = {}
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                self.truncated = True
+                return result
+            structural = self.peek_structural()
+            if structural == '}':
+                self.pos += 1
+                return result
+            if structural == ',':
+                # 多余或重复的逗号
+                self.pos += 1
+                continue
+            if structural == ']':
+                # 括号不匹配，跳过
+                self.pos += 1
+                continue
+
+            key = self.parse_key()
+            if key is _INCOMPLETE:
+                self.truncated = True
+                return result
+
+            self.skip_whitespace()
+            if self.peek_structural() == ':':
+                self.pos += 1
+
+            value = self.parse_value()
+            if value is _INCOMPLETE:
+                # 值被截断，丢弃该字段，由重新提问补齐
+                self.truncated = True
+                return result
+            result[key] = value
+
+    def parse_array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                self.truncated = True
+                return result
+            structural = self.peek_structural()
+            if structural == ']':
+                self.pos += 1
+                return result
+            if structural == ',':
+                self.pos += 1
+                continue
+            if structural == '}':
+                # 数组未闭合就结束了对象，交给外层处理
+                return result
+
+            value = self.parse_value()
+            if value is _INCOMPLETE:
+                self.truncated = True
+                return result
+            result.append(value)
+
+    def parse_key(self):
+        if self.text[self.pos] in QUOTES:
+            key = self.parse_string(is_key=True)
+            return key if key is _INCOMPLETE else str(key)
+
+        # 未加引号的键
+        start = self.pos
+        while not self.at_end() and self.peek_structural() not in (':', '}', ','):
+            self.pos += 1
+        if self.at_end():
+            return _INCOMPLETE
+        return self.text[start:self.pos].strip()
+
+    def parse_string(self, is_key=False):
+        text = self.text
+        closers = QUOTES[text[self.pos]]
+        self.pos += 1
+        chars = []
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == '\\':
+                if self.pos + 1 >= len(text):
+                    break
+                escaped = text[self.pos + 1]
+                if escaped == 'u':
+                    code = text[self.pos + 2:self.pos + 6]
+                    if len(code) < 4:
+                        break
+                    try:
+                        chars.append(chr(int(code, 16)))
+                        self.pos += 6
+                        continue
+                    except ValueError:
+                        pass
+                chars.append({'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}.get(escaped, escaped))
+                self.pos += 2
+                continue
+            if ch in closers and self._closes_string(self.pos + 1, is_key):
+                self.pos += 1
+                return ''.join(chars)
+            chars.append(ch)
+            self.pos += 1
+        return _INCOMPLETE
+
+    def _closes_string(self, pos, is_key=False):
+        """引号后面是结构字符（或结尾）时才视为字符串结束，否则是内容中未转义的引号"""
+        text = self.text
+        newline = False
+        while pos < len(text) and text[pos] in WHITESPACE:
+            newline = newline or text[pos] == '\n'
+            pos += 1
+        if pos >= len(text):
+            return True
+        nxt = text[pos]
+        if nxt in ',:}]' or (is_key and nxt == '：'):
+            return True
+        if nxt in '，：｝］、':
+            # 全角标点也常出现在中文内容里，后面紧跟下一个键/元素或换行时才算结构字符
+            after = pos + 1
+            while after < len(text) and text[after] in WHITESPACE:
+                newline = newline or text[after] == '\n'
+                after += 1
+            return newline or after >= len(text) or text[after] in QUOTES or text[after] in '{}[]｛｝［］'
+        # 漏写逗号：换行后紧跟下一个带引号的键或元素
+        return newline and nxt in QUOTES
+
+    def parse_bare(self):
+        """数字、true/false/null，或未加引号的文本"""
+        text = self.text
+        start = self.pos
+        while self.pos < len(text) and text[self.pos] != '\n' and STRUCTURAL.get(text[self.pos]) not in (',', '}', ']'):
+            self.pos += 1
+        if self.pos >= len(text):
+            return _INCOMPLETE
+        token = text[start:self.pos].strip()
+        if not token:
+            return _INCOMPLETE if self.at_end() else ''
+        lowered = token.lower()
+        if lowered in ('true', 'false', 'null', 'none'):
+            return {'true': True, 'false': False}.get(lowered)
+        try:
+            return json.loads(token)
+        except ValueError:
+            return token
+
+
+def parse_model_json(text):
+    """从模型输出中解析JSON对象
+
+    返回 (字典或None, 信息)，信息包含 repaired（是否经过修复）和 truncated（输出是否被截断）
+    """
+    info = {'repaired': False, 'truncated': False}
+    if not text:
+        return None, info
+
+    # 跳过代码块标记和前面的说明文字，从第一个左花括号开始
+    starts = [i for i in (text.find('{'), text.find('｛')) if i != -1]
+    if not starts:
+        return None, info
+    start = min(starts)
+
+    end = text.rfind('}')
+    if end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            if isinstance(data, dict):
+                return data, info
+        except ValueError:
+            pass
+
+    parser = _LenientParser(text, start)
+    data = parser.parse_value()
+    if not isinstance(data, dict) or not data:
+        return None, info
+
+    info['repaired'] = True
+    info['truncated'] = parser.truncated
+    return data, info
+
+
+def core_fields(platform):
+    """各提示词模板中必须有值的核心字段"""
+    if platform == 'tuchong':
+        return ['image_type', 'description', 'keywords']
+    return ['image_type', 'main_subject', 'keywords_cn', 'keywords_en']
+
+
+def missing_fields(data, fields):
+    return [field for field in fields if not (data or {}).get(field)]
+
+
+def build_reask_prompt(fields, language='zh'):
+    """只要求模型补充缺失字段的简短提示词"""
+    skeleton = ', '.join(
+        f'"{field}": [...]' if field.startswith('keywords') or field == 'color_palette' else f'"{field}": "..."'
+        for field in fields
+    )
+    if language == 'zh':
+        return f"请根据这张图片，只输出包含以下字段的JSON，不要输出其他内容：{{{skeleton}}}"
+    return f"Based on this image, output only a JSON object with these fields and nothing else: {{{skeleton}}}"
+
+
+def merge_fields(data, extra, fields):
+    """把重新提问得到的字段补充到已有结果中，不覆盖已有的值"""
+    merged = dict(data or {})
+    for field in fields:
+        if not merged.get(field) and extra.get(field):
+            merged[field] = extra[field]
+    return merged
@@ -0,0 +1,204 @@
+"""
+中英关键词词典
+通用平台的提示词要求模型同时输出 keywords_cn 和 keywords_en，关键词 token 几乎翻倍。
+词典从以往的分析结果中学习中英对照，收录足够多的词条后模型只需输出一种语言的关键词，
+另一种语言由词典补全，词典中没有的词再单独请模型翻译
+"""
+
+import re
+import time
+import sqlite3
+import threading
+
+from config import Config
+from json_repair import parse_model_json
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    zh TEXT NOT NULL,
+    en TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL,
+    PRIMARY KEY (zh, en)
+);
+"""
+
+_CJK = re.compile(r'[一-鿿]')
+
+# 一次分析中最多学习的对照数，关键词过多时模型往往不再逐一对应
+MAX_ALIGNED = 60
+
+
+def normalize_en(term):
+    return ' '.join(str(term).lower().split())
+
+
+def normalize_zh(term):
+    return str(term).strip()
+
+
+def _valid_pair(zh, en):
+    """中文词需包含汉字，英文词不能包含汉字"""
+    return bool(zh and en and _CJK.search(zh) and not _CJK.search(en))
+
+
+class KeywordDictionary:
+    """以 SQLite 持久化的中英关键词对照，查询在内存字典中进行"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # 推理线程池中的多个线程共用一个连接，由锁串行化
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+        # 每个词只保留出现次数最多的译法
+        self._zh_to_en = {}
+        self._en_to_zh = {}
+        for zh, en, count in self._conn.execute('SELECT zh, en, count FROM terms ORDER BY count'):
+            self._zh_to_en[zh] = (en, count)
+            self._en_to_zh[en] = (zh, count)
+
+    def __len__(self):
+        return len(self._zh_to_en)
+
+    def translate(self, terms, source='zh'):
+        """翻译关键词列表，返回 (译文列表, 词典中没有的原词列表)，译文与原词顺序一致"""
+        table = self._zh_to_en if source == 'zh' else self._en_to_zh
+        normalize = normalize_zh if source == 'zh' else normalize_en
+        translated, missing = [], []
+        for term in terms:
+            entry = table.get(normalize(term))
+            if entry is None:
+                missing.append(term)
+            else:
+                translated.append(entry[0])
+        return translated, missing
+
+    def learn(self, pairs):
+        """记录 (中文, 英文) 对照，返回新增的有效对照数"""
+        rows = []
+        for zh, en in pairs:
+            zh, en = normalize_zh(zh), normalize_en(en)
+            if _valid_pair(zh, en):
+                rows.append((zh, en))
+        if not rows:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO terms (zh, en, count, updated_at) VALUES (?, ?, 1, ?) '
+                    'ON CONFLICT (zh, en) DO UPDATE SET count = count + 1, updated_at = excluded.updated_at',
+                    [(zh, en, now) for zh, en in rows]
+                )
+                for zh, en in rows:
+                    count = self._conn.execute(
+                        'SELECT count FROM terms WHERE zh = ? AND en = ?', (zh, en)
+                    ).fetchone()[0]
+                    if count >= self._zh_to_en.get(zh, (None, 0))[1]:
+                        self._zh_to_en[zh] = (en, count)
+                    if count >= self._en_to_zh.get(en, (None, 0))[1]:
+                        self._en_to_zh[en] = (zh, count)
+        return len(rows)
+
+    def learn_from_analysis(self, analysis_data):
+        """从同时包含中英关键词的分析结果中学习，两个列表长度一致时按位置对应"""
+        keywords_cn = analysis_data.get('keywords_cn')
+        keywords_en = analysis_data.get('keywords_en')
+        if (not isinstance(keywords_cn, list) or not isinstance(keywords_en, list)
+                or len(keywords_cn) != len(keywords_en) or len(keywords_cn) > MAX_ALIGNED):
+            return 0
+        return self.learn(zip(keywords_cn, keywords_en))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_dictionary(db_path=None):
+    """同一进程内按路径共用一个词典实例，未配置路径时返回 None"""
+    db_path = db_path if db_path is not None else Config.KEYWORD_DICT_DB
+    if not db_path:
+        return None
+    with _shared_lock:
+        dictionary = _shared.get(db_path)
+        if dictionary is None:
+            dictionary = _shared[db_path] = KeywordDictionary(db_path)
+        return dictionary
+
+
+def use_single_language(dictionary, platform):
+    """词典收录足够多的词条后，通用格式的提示词只要求一种语言的关键词"""
+    return (dictionary is not None and platform != 'tuchong'
+            and len(dictionary) >= Config.KEYWORD_DICT_MIN_TERMS)
+
+
+def single_language_prompt(prompt, language='zh'):
+    """把要求中英两套关键词的提示词改为只要求回答语言的关键词"""
+    other_field = '"keywords_en"' if language == 'zh' else '"keywords_cn"'
+    lines = [line for line in prompt.split('\n') if not line.strip().startswith(other_field)]
+    prompt = '\n'.join(lines)
+    return (prompt
+            .replace('，关键词部分提供中英文两个版本。', '。')
+            .replace(', and provide both Chinese and English versions for keywords.', '.'))
+
+
+def build_translation_prompt(terms, source='zh'):
+    """请模型翻译词典中没有的关键词，输出 原词 -> 译文 的JSON对象"""
+    listing = ', '.join(f'"{term}"' for term in terms)
+    if source == 'zh':
+        return f"把以下中文图片关键词翻译成英文图库关键词，只输出JSON对象，键为中文原词，值为英文译文：[{listing}]"
+    return ("Translate the following English stock photo keywords into Chinese. Output only a JSON object "
+            f"mapping each English keyword to its Chinese translation: [{listing}]")
+
+
+def complete_keywords(analysis_data, language, dictionary, ask, max_tokens=256):
+    """用词典补全另一种语言的关键词，词典中没有的词调用 ask(提示词, 最大token数) 请模型翻译
+
+    返回 (词典翻译数, 模型翻译数)
+    """
+    source_field, target_field = ('keywords_cn', 'keywords_en') if language == 'zh' else ('keywords_en', 'keywords_cn')
+    terms = analysis_data.get(source_field)
+    if not isinstance(terms, list) or not terms or analysis_data.get(target_field):
+        return 0, 0
+
+    source = 'zh' if language == 'zh' else 'en'
+    translated, missing = dictionary.translate(terms, source)
+    from_dictionary = len(translated)
+
+    learned = {}
+    if missing:
+        try:
+            mapping, _ = parse_model_json(ask(build_translation_prompt(missing, source), max_tokens))
+        except Exception as e:
+            print(f"关键词翻译请求失败: {str(e)}")
+            mapping = None
+        if mapping:
+            for term in missing:
+                value = mapping.get(term)
+                if isinstance(value, str) and value.strip():
+                    learned[term] = value.strip()
+            pairs = learned.items() if source == 'zh' else ((zh, en) for en, zh in learned.items())
+            dictionary.learn(pairs)
+
+    # 按原关键词顺序组合译文，去掉重复
+    result = []
+    for term in terms:
+        value = learned.get(term)
+        if value is None:
+            found, _ = dictionary.translate([term], source)
+            value = found[0] if found else None
+        if value and value not in result:
+            result.append(value)
+
+    analysis_data[target_field] = result
+    return from_dictionary, len(learned)
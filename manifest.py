@@ -0,0 +1,88 @@
+"""
+增量处理清单
+以 (路径, 大小, 修改时间, inode) 作为文件指纹记录上次的分析结果，
+重复运行时未变化的文件只需一次 stat，无需读取文件、计算哈希或重新分析。
+压缩包成员以 (成员大小, 成员修改时间, 内容CRC32) 作为指纹，未变化的成员不再分析
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+
+from archive_input import ArchiveMember
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    result_json TEXT,
+    updated_at REAL,
+    PRIMARY KEY (path, params)
+);
+"""
+
+
+def fingerprint(path):
+    """文件指纹 (大小, 修改时间纳秒, inode)，文件不存在时返回 None"""
+    if isinstance(path, ArchiveMember):
+        # 成员数据已在内存中，压缩包内的修改时间精度只有2秒，再用内容校验
+        mtime_ns = int(path.mtime * 1_000_000_000) if path.mtime else 0
+        return len(path.data), mtime_ns, zlib.crc32(path.data)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class StatManifest:
+    """按文件指纹复用分析结果的清单"""
+
+    def __init__(self, db_path, params):
+        self.db_path = db_path
+        self.params = params
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    @staticmethod
+    def key_for(path):
+        if isinstance(path, ArchiveMember):
+            return f"{path.archive_path or path.archive_name}!{path.name}"
+        return os.path.abspath(str(path))
+
+    def lookup(self, path):
+        """返回 (上次的结果, 当前指纹)；文件有变化或没有记录时结果为 None"""
+        current = fingerprint(path)
+        if current is None:
+            return None, None
+        row = self._conn.execute(
+            'SELECT size, mtime_ns, inode, result_json FROM manifest WHERE path = ? AND params = ?',
+            (self.key_for(path), self.params)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != current:
+            return None, current
+        return json.loads(row[3]), current
+
+    def record(self, path, result, file_fingerprint):
+        """记录分析结果，指纹应在分析前获取，避免分析期间文件被修改"""
+        if file_fingerprint is None:
+            return
+        size, mtime_ns, inode = file_fingerprint
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO manifest (path, params, size, mtime_ns, inode, result_json, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.key_for(path), self.params, size, mtime_ns, inode,
+                 json.dumps(result, ensure_ascii=False), time.time())
+            )
+
+    def close(self):
+        self._conn.close()
@@ -4,42 +4,60 @@ MLX优化的图片分析器
 """
 
 import os
-import json
 import base64
+import importlib.util
 from io import BytesIO
 from PIL import Image
 
-try:
-    import mlx.core as mx
-    from mlx_vlm import load, generate
-    from mlx_vlm.utils import load_config
-    MLX_AVAILABLE = True
-except ImportError:
-    MLX_AVAILABLE = False
-    print("⚠️ MLX库未安装，将使用Ollama作为后备方案")
+from config import Config
+from prompts import build_prompt
+from json_repair import parse_model_json, core_fields, missing_fields, build_reask_prompt, merge_fields
+from keyword_dictionary import shared_dictionary, use_single_language, single_language_prompt, complete_keywords
+
+
+def mlx_installed():
+    """检查MLX相关库是否已安装，只查找模块而不导入"""
+    return (
+        importlib.util.find_spec('mlx') is not None and
+        importlib.util.find_spec('mlx_vlm') is not None
+    )
 
-from config import PLATFORM_TEMPLATES
 
 class MLXImageAnalyzer:
     def __init__(self, model_name="mlx-community/llava-1.5-7b-4bit"):
-        """初始化MLX图片分析器"""
+        """初始化MLX图片分析器，模型在首次分析时才加载"""
         self.model_name = model_name
         self.model = None
         self.processor = None
         self.config = None
-        self.mlx_available = MLX_AVAILABLE
-        
-        if self.mlx_available:
-            self._load_model()
-        else:
-            print("🔄 MLX不可用，请先安装: pip install mlx-lm mlx-vlm")
-    
+        self.mlx_available = mlx_installed()
+        self._generate = None
+        self._load_attempted = False
+        self.keyword_dictionary = shared_dictionary()
+        self.prompt_version = Config.PROMPT_VERSION or 'v1-mlx'
+
+    def check_model_availability(self):
+        """检查MLX是否可用，不触发模型加载"""
+        status = {
+            'available': self.mlx_available,
+            'model': self.model_name,
+            'loaded': self.model is not None
+        }
+        if not self.mlx_available:
+            status['error'] = "MLX不可用，请先安装: pip install mlx-lm mlx-vlm"
+        return status
+
     def _load_model(self):
         """加载MLX优化的模型"""
+        self._load_attempted = True
         try:
+            from mlx_vlm import load, generate
+            from mlx_vlm.utils import load_config
+
             print(f"🚀 正在加载MLX模型: {self.model_name}")
             self.model, self.processor = load(self.model_name)
             self.config = load_config(self.model_name)
+            self._generate = generate
             print(f"✅ MLX模型加载成功: {self.model_name}")
         except Exception as e:
             print(f"❌ MLX模型加载失败: {str(e)}")
@@ -67,87 +85,33 @@ class MLXImageAnalyzer:
                 data = f.read()
                 return data, (0, 0), (0, 0)
     
-    def generate_platform_prompt(self, platform='general', language='zh'):
-        """生成平台特定的分析提示词"""
-        if language == 'zh':
-            if platform == 'tuchong' and platform in PLATFORM_TEMPLATES:
-                categories = PLATFORM_TEMPLATES[platform].get('categories', [])
-                category_options = '、'.join(categories)
-                return f"""请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
-
-{{
-    "image_type": "图片分类，必须从以下选项中选择一个：{category_options}。如果识别不出具体分类，请选择'其他'",
-    "description": "图片说明，简洁明了地描述图片的主要内容和特点",
-    "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词5", "关键词6", "关键词7", "..."]
-}}
-
-重要要求：
-1. image_type字段必须严格从给定的12个分类选项中选择，不能使用其他分类
-2. 如果无法确定具体分类，请选择"其他"
-3. keywords字段必须包含至少5个以上的关键词，用于描述图片内容、风格、色彩、情感等
-4. 所有内容都用中文输出
-5. 请根据图片内容仔细选择最合适的分类"""
-            else:
-                return """请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
-
-{
-    "image_type": "图片类型（风景/人物/动物/建筑/美食/产品/抽象/其他）",
-    "main_subject": "主要内容简述",
-    "detailed_description": "详细描述构图、色彩、光线、氛围等",
-    "keywords_cn": ["中文关键词1", "中文关键词2", "..."],
-    "keywords_en": ["English keyword1", "English keyword2", "..."],
-    "mood": "情感基调（积极/中性/消极/神秘/温暖/平静等）",
-    "color_palette": ["主要颜色1", "主要颜色2", "..."],
-    "composition": "构图描述（三分法/对称/引导线等）",
-    "lighting": "光线描述（自然光/人工光/逆光/侧光等）",
-    "commercial_use": "商业用途建议",
-    "target_audience": "目标受众",
-    "seasonal": "季节性（如适用）",
-    "location_type": "场景类型（室内/室外/工作室等）"
-}
-
-重要：请确保所有描述性文字都使用中文，关键词部分提供中英文两个版本。"""
-        else:
-            if platform == 'tuchong' and platform in PLATFORM_TEMPLATES:
-                categories = PLATFORM_TEMPLATES[platform].get('categories', [])
-                category_options = ', '.join(categories)
-                return f"""Please analyze this image in detail and output in the following JSON format:
-
-{{
-    "image_type": "Image category, must choose one from: {category_options}. If cannot identify specific category, choose 'Other'",
-    "description": "Image description, concisely describe the main content and characteristics of the image",
-    "keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5", "keyword6", "keyword7", "..."]
-}}
+    def generate_platform_prompt(self, platform='general', language='zh', version=None):
+        """生成平台特定的分析提示词，version 为 prompts.py 中的提示词版本"""
+        return build_prompt(version or self.prompt_version, platform, language)
+    
+    def _run(self, prompt, image, max_tokens=1000, temperature=0.7):
+        """执行一次MLX推理，返回生成的文本"""
+        response = self._generate(
+            model=self.model,
+            processor=self.processor,
+            image=image,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            verbose=False
+        )
+        return response.strip()
 
-Important requirements:
-1. The image_type field must strictly choose from the given 12 category options, no other categories allowed
-2. If unable to determine specific category, choose "Other"
-3. The keywords field must contain at least 5 or more keywords describing image content, style, colors, emotions, etc.
-4. All content should be in Chinese
-5. Please carefully select the most appropriate category based on the image content"""
-            else:
-                return """Please analyze this image in detail and output in the following JSON format (please answer in English):
+    def analyze_image(self, image_path, platform='general', model=None, language='zh', image_data=None,
+                      prompt_version=None):
+        """使用MLX优化模型分析图片
 
-{
-    "image_type": "Image type (landscape/portrait/animal/architecture/food/product/abstract/other)",
-    "main_subject": "Brief description of main content",
-    "detailed_description": "Detailed description of composition, colors, lighting, atmosphere, etc.",
-    "keywords_cn": ["Chinese keyword1", "Chinese keyword2", "..."],
-    "keywords_en": ["English keyword1", "English keyword2", "..."],
-    "mood": "Emotional tone (positive/neutral/negative/mysterious/warm/calm, etc.)",
-    "color_palette": ["Main color1", "Main color2", "..."],
-    "composition": "Composition description (rule of thirds/symmetry/leading lines, etc.)",
-    "lighting": "Lighting description (natural light/artificial light/backlight/side light, etc.)",
-    "commercial_use": "Commercial use suggestions",
-    "target_audience": "Target audience",
-    "seasonal": "Seasonality (if applicable)",
-    "location_type": "Scene type (indoor/outdoor/studio, etc.)"
-}
+        image_data: 已预处理的JPEG数据，提供时不再重新读取和压缩图片
+        prompt_version: 本次使用的提示词版本，默认为分析器的 prompt_version
+        """
+        if self.mlx_available and self.model is None and not self._load_attempted:
+            self._load_model()
 
-Important: Please ensure all descriptive text is in English, and provide both Chinese and English versions for keywords."""
-    
-    def analyze_image(self, image_path, platform='general', model=None, language='zh'):
-        """使用MLX优化模型分析图片"""
         if not self.mlx_available or self.model is None:
             return {
                 'error': "MLX模型未加载，请检查MLX安装或使用Ollama",
@@ -158,74 +122,96 @@ Important: Please ensure all descriptive text is in English, and provide both Ch
             print(f"🔍 开始MLX图片分析: {os.path.basename(image_path)}")
             
             # 压缩图片
-            compressed_image, original_size, compressed_size = self.compress_image(image_path)
+            if image_data is not None:
+                compressed_image, original_size, compressed_size = image_data, None, None
+            else:
+                compressed_image, original_size, compressed_size = self.compress_image(image_path)
             image = Image.open(BytesIO(compressed_image))
             
-            # 生成提示词
-            prompt = self.generate_platform_prompt(platform, language)
+            # 生成提示词，词典可以补全时只要求一种语言的关键词
+            prompt_version = prompt_version or self.prompt_version
+            prompt = self.generate_platform_prompt(platform, language, prompt_version)
+            single_language = use_single_language(self.keyword_dictionary, platform)
+            fields = core_fields(platform)
+            if single_language:
+                prompt = single_language_prompt(prompt, language)
+                fields.remove('keywords_en' if language == 'zh' else 'keywords_cn')
             
             print("🤖 正在使用MLX进行推理...")
             
             # 使用MLX进行推理
-            response = generate(
-                model=self.model,
-                processor=self.processor,
-                image=image,
-                prompt=prompt,
-                max_tokens=1000,
-                temperature=0.7,
-                verbose=False
-            )
+            response = self._run(prompt, image, max_tokens=1000)
             
             print("✅ MLX推理完成")
             
-            # 解析JSON响应
-            try:
-                response_text = response.strip()
-                if '```json' in response_text:
-                    json_start = response_text.find('```json') + 7
-                    json_end = response_text.find('```', json_start)
-                    response_text = response_text[json_start:json_end].strip()
-                elif '{' in response_text:
-                    json_start = response_text.find('{')
-                    json_end = response_text.rfind('}') + 1
-                    response_text = response_text[json_start:json_end]
+            # 解析JSON响应，格式有误或被截断时尽量修复
+            analysis_result, repair_info = parse_model_json(response)
+            
+            if analysis_result is not None:
+                # 只针对缺失的核心字段重新提问
+                reask = missing_fields(analysis_result, fields)
+                if reask and Config.JSON_REASK_MAX_TOKENS > 0:
+                    try:
+                        extra, _ = parse_model_json(self._run(
+                            build_reask_prompt(reask, language), image,
+                            max_tokens=Config.JSON_REASK_MAX_TOKENS, temperature=0.2
+                        ))
+                        if extra:
+                            analysis_result = merge_fields(analysis_result, extra, reask)
+                    except Exception as e:
+                        print(f"补充字段请求失败: {str(e)}")
+                else:
+                    reask = []
+                
+                image_info = {
+                    'original_size': original_size,
+                    'compressed_size': compressed_size,
+                    'platform': platform,
+                    'model': self.model_name,
+                    'engine': 'MLX',
+                    'json_repaired': repair_info['repaired'],
+                    'json_truncated': repair_info['truncated'],
+                    'reask_fields': reask,
+                    'prompt_version': prompt_version
+                }
                 
-                analysis_result = json.loads(response_text)
+                # 另一种语言的关键词由词典补全，模型同时给出两种语言时从中学习对照
+                if single_language:
+                    from_dictionary, translated = complete_keywords(
+                        analysis_result, language, self.keyword_dictionary,
+                        lambda text, max_tokens: self._run(text, image, max_tokens=max_tokens, temperature=0.2)
+                    )
+                    image_info['keywords_from_dictionary'] = from_dictionary
+                    image_info['keywords_translated_by_model'] = translated
+                elif self.keyword_dictionary is not None:
+                    self.keyword_dictionary.learn_from_analysis(analysis_result)
                 
                 return {
                     'success': True,
                     'analysis': analysis_result,
-                    'image_info': {
-                        'original_size': original_size,
-                        'compressed_size': compressed_size,
-                        'platform': platform,
-                        'model': self.model_name,
-                        'engine': 'MLX'
-                    }
+                    'image_info': image_info
                 }
-                
-            except json.JSONDecodeError as e:
-                print(f"JSON解析失败: {str(e)}")
-                return {
-                    'success': True,
-                    'analysis': {
-                        'raw_response': response,
-                        'image_type': '其他',
-                        'main_subject': '图片分析',
-                        'detailed_description': response[:200] + '...' if len(response) > 200 else response,
-                        'keywords_cn': ['图片', '分析'],
-                        'keywords_en': ['image', 'analysis']
-                    },
-                    'image_info': {
-                        'original_size': original_size,
-                        'compressed_size': compressed_size,
-                        'platform': platform,
-                        'model': self.model_name,
-                        'engine': 'MLX',
-                        'note': 'JSON解析失败，返回原始响应'
-                    }
+            
+            print("JSON解析失败，返回原始响应")
+            return {
+                'success': True,
+                'analysis': {
+                    'raw_response': response,
+                    'image_type': '其他',
+                    'main_subject': '图片分析',
+                    'detailed_description': response[:200] + '...' if len(response) > 200 else response,
+                    'keywords_cn': ['图片', '分析'],
+                    'keywords_en': ['image', 'analysis']
+                },
+                'image_info': {
+                    'original_size': original_size,
+                    'compressed_size': compressed_size,
+                    'platform': platform,
+                    'model': self.model_name,
+                    'engine': 'MLX',
+                    'note': 'JSON解析失败，返回原始响应'
                 }
+            }
                 
         except Exception as e:
             print(f"MLX分析失败: {str(e)}")
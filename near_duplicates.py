@@ -0,0 +1,246 @@
+"""
+近似重复图片索引
+连拍和轻微修改过的同一画面只需分析一次：预处理时计算 64 位 dHash 感知哈希，
+已分析图片的哈希分段建立内存索引（多索引哈希），结果持久化在 SQLite 中，
+汉明距离不超过阈值的新图片直接复用已有分析结果
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from io import BytesIO
+from math import comb
+from itertools import combinations
+
+from PIL import Image
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    source TEXT,
+    result_json TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_hashes_params ON hashes (params);
+"""
+
+HASH_MASK = (1 << 64) - 1
+
+# 64 位哈希分为 4 段，每段 16 位
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_VALUES = 1 << CHUNK_BITS
+
+# 新增的哈希先在缓冲区中线性比较，积累到这一数量后插入分段索引
+PENDING_LIMIT = 256
+
+
+def dhash(image_data, size=8):
+    """64 位差值哈希：缩放为 9x8 灰度图，比较每行相邻像素的明暗"""
+    with Image.open(BytesIO(image_data)) as img:
+        img.draft('L', (size * 4, size * 4))
+        small = img.convert('L').resize((size + 1, size), Image.LANCZOS)
+        pixels = small.tobytes()
+
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _to_signed(value):
+    """SQLite 的 INTEGER 为有符号 64 位"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _neighbors(chunk, radius):
+    """与 chunk 汉明距离不超过 radius 的所有 16 位取值"""
+    values = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+if NUMPY_AVAILABLE:
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _hamming(hashes, value):
+    """一组哈希与 value 的汉明距离"""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+class _HashTable:
+    """一组分析参数下的内存多索引
+
+    哈希和行id保存在预分配的数组中，容量不足时扩容 1/4。每段按取值分桶
+    （offsets[v]:offsets[v+1] 为该段取值为 v 的哈希位置），新增的哈希先追加在数组末尾线性比较，
+    满 PENDING_LIMIT 条后插入各段的桶中，不重建整个索引。每百万条哈希约占用 40MB 内存
+    """
+
+    def __init__(self, ids, hashes):
+        ids = np.asarray(ids, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        self.size = self.indexed = len(ids)
+        capacity = self._grown(self.size)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._hashes = np.empty(capacity, dtype=np.uint64)
+        self._ids[:self.size] = ids
+        self._hashes[:self.size] = hashes
+        self._build()
+
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def hashes(self):
+        return self._hashes[:self.size]
+
+    @staticmethod
+    def _grown(size):
+        return size + max(size // 4, PENDING_LIMIT)
+
+    @staticmethod
+    def _chunk(hashes, i):
+        return ((hashes >> np.uint64(CHUNK_BITS * i)) & np.uint64(CHUNK_VALUES - 1)).astype(np.int64)
+
+    def _build(self):
+        self.offsets = []
+        self.positions = []
+        for i in range(CHUNKS):
+            chunk = self._chunk(self._hashes[:self.indexed], i)
+            offsets = np.zeros(CHUNK_VALUES + 1, dtype=np.int64)
+            np.cumsum(np.bincount(chunk, minlength=CHUNK_VALUES), out=offsets[1:])
+            self.offsets.append(offsets)
+            self.positions.append(np.argsort(chunk, kind='stable').astype(np.int32))
+
+    def _merge_pending(self):
+        """将缓冲区中的哈希插入各段的桶末尾，每段一次插入，耗时与哈希总数成线性但不排序"""
+        new = np.arange(self.indexed, self.size, dtype=np.int32)
+        for i in range(CHUNKS):
+            chunk = self._chunk(self._hashes[self.indexed:self.size], i)
+            order = np.argsort(chunk, kind='stable')
+            offsets = self.offsets[i]
+            self.positions[i] = np.insert(self.positions[i], offsets[chunk[order] + 1], new[order])
+            offsets[1:] += np.cumsum(np.bincount(chunk, minlength=CHUNK_VALUES))
+        self.indexed = self.size
+
+    def add(self, row_id, value):
+        if self.size == len(self._ids):
+            capacity = self._grown(self.size)
+            self._ids = np.concatenate([self._ids, np.empty(capacity - self.size, dtype=np.int64)])
+            self._hashes = np.concatenate([self._hashes, np.empty(capacity - self.size, dtype=np.uint64)])
+        self._ids[self.size] = row_id
+        self._hashes[self.size] = value
+        self.size += 1
+        if self.size - self.indexed >= PENDING_LIMIT:
+            self._merge_pending()
+
+    def nearest(self, value, max_distance):
+        """返回 (行id, 距离)，没有距离不超过 max_distance 的哈希时返回 None
+
+        距离不超过 r 的两个哈希至少有一段的距离不超过 r // 4（抽屉原理），
+        只需取出每段邻近取值的桶作为候选，再计算完整汉明距离
+        """
+        radius = min(max_distance // CHUNKS, CHUNK_BITS)
+        probes = CHUNKS * sum(comb(CHUNK_BITS, distance) for distance in range(radius + 1))
+        if probes >= self.size:
+            # 阈值较大时要查的桶比哈希总数还多，直接与全部哈希比较
+            candidates = np.arange(self.size)
+        else:
+            slices = []
+            for i in range(CHUNKS):
+                chunk = (value >> (CHUNK_BITS * i)) & (CHUNK_VALUES - 1)
+                offsets, positions = self.offsets[i], self.positions[i]
+                for candidate in _neighbors(chunk, radius):
+                    start, end = offsets[candidate], offsets[candidate + 1]
+                    if end > start:
+                        slices.append(positions[start:end])
+            # 尚未插入分段索引的哈希逐个比较
+            slices.append(np.arange(self.indexed, self.size))
+            candidates = np.concatenate(slices)
+
+        if not len(candidates):
+            return None
+        distances = _hamming(self._hashes[candidates], value)
+        index = int(distances.argmin())
+        if distances[index] > max_distance:
+            return None
+        return int(self._ids[candidates[index]]), int(distances[index])
+
+
+class NearDuplicateIndex:
+    """近似重复检索，SQLite 持久化，检索在内存多索引中进行
+
+    某组参数首次查询时从数据库载入该参数下的全部哈希；需要 NumPy
+    """
+
+    def __init__(self, db_path, max_distance=4):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("近似重复检索需要安装 numpy")
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._tables = {}
+        self._lock = threading.Lock()
+        # 推理线程池中的多个线程共用一个连接，由锁串行化
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _table(self, params):
+        table = self._tables.get(params)
+        if table is None:
+            rows = self._conn.execute('SELECT id, hash FROM hashes WHERE params = ?', (params,)).fetchall()
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            hashes = np.fromiter((row[1] & HASH_MASK for row in rows), dtype=np.uint64, count=len(rows))
+            table = self._tables[params] = _HashTable(ids, hashes)
+        return table
+
+    def lookup(self, value, params):
+        """返回 (最相近的已有结果, 来源, 距离)，没有足够相近的图片时返回 None"""
+        with self._lock:
+            found = self._table(params).nearest(value, self.max_distance)
+            if found is None:
+                return None
+            row_id, distance = found
+            source, result_json = self._conn.execute(
+                'SELECT source, result_json FROM hashes WHERE id = ?', (row_id,)
+            ).fetchone()
+        return json.loads(result_json), source, distance
+
+    def add(self, value, params, result, source=None):
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    'INSERT INTO hashes (params, hash, source, result_json, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (params, _to_signed(value), source, json.dumps(result, ensure_ascii=False), time.time())
+                )
+            if params in self._tables:
+                self._tables[params].add(cursor.lastrowid, value)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+"""
+预览缩略图缓存
+按内容哈希和尺寸档位生成一次缩略图并缓存到磁盘，供预览接口复用
+"""
+
+import os
+import re
+import glob
+import tempfile
+from io import BytesIO
+from PIL import Image
+
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class PreviewCache:
+    """按内容哈希缓存的缩略图"""
+
+    # 尺寸档位，请求尺寸向上取整到最近的档位
+    SIZE_BUCKETS = (128, 256, 512, 1024)
+
+    FORMATS = {
+        'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+        'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True})
+    }
+
+    def __init__(self, upload_folder, cache_folder=None):
+        self.upload_folder = upload_folder
+        self.cache_folder = cache_folder or os.path.join(upload_folder, '.previews')
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    @staticmethod
+    def is_valid_hash(file_hash):
+        return bool(file_hash and HASH_PATTERN.match(file_hash))
+
+    def bucket_for(self, size):
+        """把请求尺寸映射到档位"""
+        for bucket in self.SIZE_BUCKETS:
+            if size <= bucket:
+                return bucket
+        return self.SIZE_BUCKETS[-1]
+
+    def etag_for(self, file_hash, bucket, fmt):
+        return f"{file_hash}-{bucket}.{fmt}"
+
+    def seed(self, file_hash, data):
+        """保存分析预处理阶段得到的缩小图，作为生成缩略图的来源"""
+        if not self.is_valid_hash(file_hash) or not data:
+            return
+        path = self._source_path(file_hash)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+
+    def get_preview(self, file_hash, size=256, fmt='webp'):
+        """返回缩略图路径和档位，不存在时生成；找不到原图返回 (None, bucket)"""
+        bucket = self.bucket_for(size)
+        path = os.path.join(self.cache_folder, f"{file_hash}_{bucket}.{fmt}")
+        if os.path.exists(path):
+            return path, bucket
+
+        source = self._find_source(file_hash, bucket)
+        if source is None:
+            return None, bucket
+
+        pil_format, _, save_options = self.FORMATS[fmt]
+        with Image.open(source) as img:
+            # JPEG草稿模式可在解码时直接缩小，避免完整解码大图
+            img.draft('RGB', (bucket, bucket))
+            if img.mode not in ('RGB', 'RGBA') or (img.mode == 'RGBA' and pil_format == 'JPEG'):
+                img = img.convert('RGB')
+            img.thumbnail((bucket, bucket), Image.Resampling.LANCZOS)
+
+            buffer = BytesIO()
+            img.save(buffer, format=pil_format, **save_options)
+
+        self._write_atomic(path, buffer.getvalue())
+        return path, bucket
+
+    def evict(self, file_hash):
+        """删除某个内容哈希的全部缓存"""
+        if not self.is_valid_hash(file_hash):
+            return
+        for path in glob.glob(os.path.join(self.cache_folder, f"{file_hash}_*")):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def mimetype_for(self, fmt):
+        return self.FORMATS[fmt][1]
+
+    def _source_path(self, file_hash):
+        return os.path.join(self.cache_folder, f"{file_hash}_src.jpg")
+
+    def _find_source(self, file_hash, bucket):
+        """优先使用预处理缩小图，尺寸不足时回退到原图"""
+        seeded = self._source_path(file_hash)
+        if os.path.exists(seeded):
+            try:
+                with Image.open(seeded) as img:
+                    if max(img.size) >= bucket:
+                        return seeded
+            except Exception:
+                pass
+
+        originals = glob.glob(os.path.join(self.upload_folder, f"{file_hash}.*"))
+        if originals:
+            return originals[0]
+        return seeded if os.path.exists(seeded) else None
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_folder, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
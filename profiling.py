@@ -0,0 +1,156 @@
+"""
+单次分析的性能剖析
+通过环境变量 PICTAGGER_PROFILE 或请求头 X-PicTagger-Profile 开启，
+对一次 analyze_image 调用记录 cProfile 数据和 tracemalloc 内存峰值，
+写入按数量轮换的目录，并可汇总多次记录中耗时最多的函数
+"""
+
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+
+
+PROFILE_HEADER = 'X-PicTagger-Profile'
+
+# cProfile 和 tracemalloc 都是进程级的，同一时间只剖析一个调用
+_lock = threading.Lock()
+
+
+def header_requested(value):
+    """请求头为真值时开启，未提供时返回 None（由环境变量决定）"""
+    if value is None:
+        return None
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def profiling_enabled(requested=None):
+    return requested if requested is not None else Config.PROFILE_ENABLED
+
+
+def _rotate(directory, keep):
+    """只保留最新的 keep 份记录"""
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in profiles[:max(len(profiles) - keep, 0)]:
+        for path in (entry.path, entry.path[:-len('.prof')] + '.json'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _top_frames(stats, top):
+    """按自身耗时排列的前 top 个函数"""
+    frames = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        frames.append({
+            'function': f"{os.path.basename(filename)}:{line}({function})",
+            'calls': calls,
+            'tottime': round(tottime, 4),
+            'cumtime': round(cumtime, 4)
+        })
+    frames.sort(key=lambda frame: frame['tottime'], reverse=True)
+    return frames[:top]
+
+
+@contextmanager
+def capture(label, requested=None, directory=None, keep=None):
+    """剖析 with 语句块，产出一个字典，结束后其中的 profile 为记录文件名
+
+    未开启或已有其他调用正在剖析时不做任何记录，产出 None
+    """
+    if not profiling_enabled(requested) or not _lock.acquire(blocking=False):
+        yield None
+        return
+
+    directory = directory or Config.PROFILE_DIR
+    keep = keep or Config.PROFILE_KEEP
+    record = {}
+    started_tracing = not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    try:
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield record
+        finally:
+            profiler.disable()
+            wall_time = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+            os.makedirs(directory, exist_ok=True)
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}"
+            prof_path = os.path.join(directory, name + '.prof')
+            profiler.dump_stats(prof_path)
+            stats = pstats.Stats(profiler)
+            with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'label': label,
+                    'created_at': datetime.now().isoformat(),
+                    'wall_time': round(wall_time, 4),
+                    'peak_memory': peak,
+                    'top_frames': _top_frames(stats, 20)
+                }, f, ensure_ascii=False, indent=2)
+            _rotate(directory, keep)
+            record['profile'] = name + '.prof'
+    finally:
+        _lock.release()
+
+
+def summarize(directory=None, top=25, sort='tottime'):
+    """汇总目录中所有记录，返回可打印的文本"""
+    directory = directory or Config.PROFILE_DIR
+    if not os.path.isdir(directory):
+        return f"目录不存在: {directory}"
+
+    prof_files = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.prof')
+    )
+    if not prof_files:
+        return f"没有剖析记录: {directory}"
+
+    lines = [f"剖析记录: {len(prof_files)} 份 ({directory})"]
+
+    # 各次调用的总耗时和内存峰值
+    records = []
+    for path in prof_files:
+        try:
+            with open(path[:-len('.prof')] + '.json', encoding='utf-8') as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    if records:
+        records.sort(key=lambda record: record['wall_time'], reverse=True)
+        wall_times = sorted(record['wall_time'] for record in records)
+        lines.append(
+            f"耗时: 中位数 {wall_times[len(wall_times) // 2]:.2f}s, 最长 {wall_times[-1]:.2f}s; "
+            f"内存峰值最高 {max(record['peak_memory'] for record in records) / 1024 / 1024:.1f}MB"
+        )
+        lines.append("最慢的调用:")
+        for record in records[:5]:
+            lines.append(f"  {record['wall_time']:8.2f}s  {record['peak_memory'] / 1024 / 1024:7.1f}MB  "
+                         f"{record['created_at']}  {record['label']}")
+
+    # 合并所有记录，列出最耗时的函数
+    output = io.StringIO()
+    stats = pstats.Stats(*prof_files, stream=output)
+    stats.sort_stats(sort).print_stats(top)
+    lines.append('')
+    lines.append(output.getvalue().strip())
+    return '\n'.join(lines)
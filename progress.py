@@ -0,0 +1,202 @@
+"""
+批量处理进度报告
+统计已完成/总数、吞吐量（张/分钟）、延迟 p50/p95、缓存命中和错误数，
+按最近完成的图片估算剩余时间；终端中在底部刷新一行状态，
+非终端（重定向到文件、CI日志）时定期输出一行日志
+"""
+
+import sys
+import time
+import logging
+import threading
+from collections import deque
+
+
+def format_duration(seconds):
+    """把秒数格式化为 1h 02m / 3m 05s / 42s"""
+    if seconds is None:
+        return '--'
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def percentile(sorted_values, fraction):
+    """已排序数据的分位数（线性插值）"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class _StatusLineStream:
+    """包装终端输出流：写入前清除状态行，整行写完后重绘"""
+
+    def __init__(self, reporter, target):
+        self._reporter = reporter
+        self._target = target
+
+    def write(self, text):
+        reporter = self._reporter
+        with reporter._lock:
+            # print 会把内容和换行分两次写入，写到行中间时不能清除
+            if not reporter._mid_line:
+                reporter._clear_line()
+            written = self._target.write(text)
+            if text:
+                reporter._mid_line = not text.endswith('\n')
+            if not reporter._mid_line:
+                reporter._draw_line()
+            return written
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class ProgressReporter:
+    """批量处理进度统计与显示"""
+
+    def __init__(self, total=None, stream=None, interval=None, window=50, latency_window=1000,
+                 logger=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        # 终端刷新较频繁，日志模式避免刷屏
+        self.interval = interval if interval is not None else (0.5 if self.is_tty else 30.0)
+        self.logger = logger or logging.getLogger('PicTagger')
+
+        self.completed = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.started_at = time.monotonic()
+
+        # 最近完成时间用于估算速度和剩余时间，最近的延迟用于分位数
+        self._completions = deque(maxlen=window)
+        self._latencies = deque(maxlen=latency_window)
+        self._last_render = 0.0
+        self._status = ''
+        self._mid_line = False
+        self._lock = threading.RLock()
+        self._wrapped = []
+
+        if self.is_tty:
+            self._wrap_streams()
+
+    def add_total(self, count):
+        """增加总数（如监视模式发现新文件），总数未知时以已完成数为基准"""
+        with self._lock:
+            self.total = (self.completed if self.total is None else self.total) + count
+
+    def update(self, latency=None, error=False, cache_hit=False):
+        """记录一张图片完成"""
+        with self._lock:
+            now = time.monotonic()
+            self.completed += 1
+            self.errors += bool(error)
+            self.cache_hits += bool(cache_hit)
+            if latency is not None and not cache_hit:
+                self._latencies.append(latency)
+            self._completions.append(now)
+
+            if now - self._last_render >= self.interval:
+                self._last_render = now
+                self._render()
+
+    def snapshot(self):
+        """当前统计数据"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.started_at
+            latencies = sorted(self._latencies)
+
+            # 用最近窗口内的完成速度估算剩余时间，窗口太小时退回整体平均速度
+            if len(self._completions) >= 2 and self._completions[-1] > self._completions[0]:
+                recent_rate = (len(self._completions) - 1) / (self._completions[-1] - self._completions[0])
+            else:
+                recent_rate = self.completed / elapsed if elapsed > 0 else 0.0
+
+            remaining = None
+            if self.total is not None and recent_rate > 0:
+                remaining = max(self.total - self.completed, 0) / recent_rate
+
+            return {
+                'completed': self.completed,
+                'total': self.total,
+                'errors': self.errors,
+                'cache_hits': self.cache_hits,
+                'elapsed': elapsed,
+                'images_per_minute': self.completed / elapsed * 60 if elapsed > 0 else 0.0,
+                'recent_images_per_minute': recent_rate * 60,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'eta': remaining
+            }
+
+    def format(self, stats=None):
+        stats = stats or self.snapshot()
+        if stats['total']:
+            percent = stats['completed'] / stats['total'] * 100
+            head = f"{stats['completed']}/{stats['total']} ({percent:.1f}%)"
+        else:
+            head = f"已完成 {stats['completed']}"
+
+        parts = [head, f"{stats['recent_images_per_minute']:.1f} 张/分钟"]
+        if stats['p50'] is not None:
+            parts.append(f"p50 {stats['p50']:.2f}s p95 {stats['p95']:.2f}s")
+        parts.append(f"缓存命中 {stats['cache_hits']}")
+        parts.append(f"错误 {stats['errors']}")
+        if stats['total']:
+            parts.append(f"剩余 {format_duration(stats['eta'])}")
+        parts.append(f"已用 {format_duration(stats['elapsed'])}")
+        return ' | '.join(parts)
+
+    def close(self):
+        """输出最终统计并恢复输出流"""
+        with self._lock:
+            summary = self.format()
+            if self.is_tty:
+                self._clear_line()
+                self._status = ''
+                self._unwrap_streams()
+        self.logger.info(f"进度: {summary}")
+
+    def _render(self):
+        if self.is_tty:
+            self._clear_line()
+            self._status = self.format()
+            self._draw_line()
+        else:
+            self.logger.info(f"进度: {self.format()}")
+
+    def _clear_line(self):
+        if self._status and not self._mid_line:
+            self.stream.write('\r\x1b[K')
+
+    def _draw_line(self):
+        if self._status and not self._mid_line:
+            self.stream.write(self._status)
+            self.stream.flush()
+
+    def _wrap_streams(self):
+        """让日志和 print 输出出现在状态行上方"""
+        for handler in logging.getLogger().handlers + self.logger.handlers:
+            if type(handler) is logging.StreamHandler and handler.stream in (sys.stderr, sys.stdout):
+                original = handler.stream
+                handler.setStream(_StatusLineStream(self, original))
+                self._wrapped.append((handler, original))
+        if sys.stdout.isatty():
+            self._original_stdout = sys.stdout
+            sys.stdout = _StatusLineStream(self, sys.stdout)
+
+    def _unwrap_streams(self):
+        for handler, original in self._wrapped:
+            handler.setStream(original)
+        self._wrapped = []
+        if getattr(self, '_original_stdout', None) is not None:
+            sys.stdout = self._original_stdout
+            self._original_stdout = None
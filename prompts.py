@@ -0,0 +1,240 @@
+"""
+分析提示词版本
+Ollama 和 MLX 分析器的提示词统一在这里按版本定义，修改提示词时新增版本，
+用 benchmarks/bench_prompts.py 对比各版本的 token 数、耗时、JSON 解析成功率和字段完整度后再切换
+"""
+
+import re
+
+from config import PLATFORM_TEMPLATES
+from image_features import strip_local_fields
+
+
+ZH_TUCHONG_V1 = """请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
+
+{
+    "image_type": "图片分类，必须从以下选项中选择一个：{category_options}。如果识别不出具体分类，请选择'其他'",
+    "description": "图片说明，简洁明了地描述图片的主要内容和特点",
+    "keywords": ["关键词1", "关键词2", "关键词3", "关键词4", "关键词5", "关键词6", "关键词7", "..."]
+}
+
+重要要求：
+1. image_type字段必须严格从给定的12个分类选项中选择，不能使用其他分类
+2. 如果无法确定具体分类，请选择"其他"
+3. keywords字段必须包含至少5个以上的关键词，用于描述图片内容、风格、色彩、情感等
+4. 所有内容都用中文输出
+5. 请根据图片内容仔细选择最合适的分类"""
+
+EN_TUCHONG_V1 = """Please analyze this image in detail and output in the following JSON format:
+
+{
+    "image_type": "Image category, must choose one from: {category_options}. If cannot identify specific category, choose 'Other'",
+    "description": "Image description, concisely describe the main content and characteristics of the image",
+    "keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5", "keyword6", "keyword7", "..."]
+}
+
+Important requirements:
+1. The image_type field must strictly choose from the given 12 category options, no other categories allowed
+2. If unable to determine specific category, choose "Other"
+3. The keywords field must contain at least 5 or more keywords describing image content, style, colors, emotions, etc.
+4. All content should be in Chinese
+5. Please carefully select the most appropriate category based on the image content"""
+
+EN_GENERAL_V1 = """Please analyze this image in detail and output in the following JSON format (please answer in English):
+
+{
+    "image_type": "Image type (landscape/portrait/animal/architecture/food/product/abstract/other)",
+    "main_subject": "Brief description of main content",
+    "detailed_description": "Detailed description of composition, colors, lighting, atmosphere, etc.",
+    "keywords_cn": ["Chinese keyword1", "Chinese keyword2", "..."],
+    "keywords_en": ["English keyword1", "English keyword2", "..."],
+    "mood": "Emotional tone (positive/neutral/negative/mysterious/warm/calm, etc.)",
+    "color_palette": ["Main color1", "Main color2", "..."],
+    "composition": "Composition description (rule of thirds/symmetry/leading lines, etc.)",
+    "lighting": "Lighting description (natural light/artificial light/backlight/side light, etc.)",
+    "commercial_use": "Commercial use suggestions",
+    "target_audience": "Target audience",
+    "seasonal": "Seasonality (if applicable)",
+    "location_type": "Scene type (indoor/outdoor/studio, etc.)"
+}
+
+Important: Please ensure all descriptive text is in English, and provide both Chinese and English versions for keywords."""
+
+ZH_GENERAL_V1 = """请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
+
+{
+    "image_type": "图片类型（风景/人物/动物/建筑/食物/产品/抽象/其他）",
+    "main_subject": "主要内容的简洁描述",
+    "detailed_description": "详细描述图片的构图、色彩、光线、氛围等",
+    "keywords_cn": ["中文关键词1", "中文关键词2", "..."],
+    "keywords_en": ["English keyword1", "English keyword2", "..."],
+    "mood": "情感色调（积极/中性/消极/神秘/温暖/冷静等）",
+    "color_palette": ["主要颜色1", "主要颜色2", "..."],
+    "composition": "构图描述（三分法/对称/引导线等）",
+    "lighting": "光线描述（自然光/人工光/逆光/侧光等）",
+    "commercial_use": "商业用途建议",
+    "target_audience": "目标受众",
+    "seasonal": "季节性（如适用）",
+    "location_type": "场景类型（室内/室外/工作室等）"
+}
+
+重要：请确保所有描述性文字都使用中文，关键词部分提供中英文两个版本。"""
+
+# MLX 分析器原有的中文通用提示词，措辞与 Ollama 版本略有不同
+ZH_GENERAL_V1_MLX = """请详细分析这张图片，并按以下JSON格式输出（请用中文回答）：
+
+{
+    "image_type": "图片类型（风景/人物/动物/建筑/美食/产品/抽象/其他）",
+    "main_subject": "主要内容简述",
+    "detailed_description": "详细描述构图、色彩、光线、氛围等",
+    "keywords_cn": ["中文关键词1", "中文关键词2", "..."],
+    "keywords_en": ["English keyword1", "English keyword2", "..."],
+    "mood": "情感基调（积极/中性/消极/神秘/温暖/平静等）",
+    "color_palette": ["主要颜色1", "主要颜色2", "..."],
+    "composition": "构图描述（三分法/对称/引导线等）",
+    "lighting": "光线描述（自然光/人工光/逆光/侧光等）",
+    "commercial_use": "商业用途建议",
+    "target_audience": "目标受众",
+    "seasonal": "季节性（如适用）",
+    "location_type": "场景类型（室内/室外/工作室等）"
+}
+
+重要：请确保所有描述性文字都使用中文，关键词部分提供中英文两个版本。"""
+
+# 精简版：去掉示例占位和重复的要求说明，字段与 v1 相同
+ZH_GENERAL_V2 = """分析这张图片，只输出下面格式的JSON，不要输出其他文字。描述用中文，关键词部分提供中英文两个版本。
+{
+"image_type": "风景/人物/动物/建筑/食物/产品/抽象/其他",
+"main_subject": "主体，一句话",
+"detailed_description": "构图、色彩、光线和氛围，不超过80字",
+"keywords_cn": [],
+"keywords_en": [],
+"mood": "情感色调",
+"color_palette": [],
+"composition": "构图方式",
+"lighting": "光线",
+"commercial_use": "商业用途",
+"target_audience": "目标受众",
+"seasonal": "季节，不适用则留空",
+"location_type": "室内/室外/工作室"
+}"""
+
+EN_GENERAL_V2 = """Analyze this image and output only JSON in the format below, with no other text. Write descriptions in English, and provide both Chinese and English versions for keywords.
+{
+"image_type": "landscape/portrait/animal/architecture/food/product/abstract/other",
+"main_subject": "one sentence",
+"detailed_description": "composition, colors, lighting and atmosphere, under 50 words",
+"keywords_cn": [],
+"keywords_en": [],
+"mood": "emotional tone",
+"color_palette": [],
+"composition": "composition technique",
+"lighting": "lighting",
+"commercial_use": "commercial use",
+"target_audience": "target audience",
+"seasonal": "season, empty if not applicable",
+"location_type": "indoor/outdoor/studio"
+}"""
+
+ZH_TUCHONG_V2 = """分析这张图片，只输出下面格式的JSON，不要输出其他文字，全部用中文。
+{
+"image_type": "从以下分类中选一个：{category_options}；无法确定时选其他",
+"description": "图片说明，一两句话",
+"keywords": ["至少5个，涵盖内容、风格、色彩和情感"]
+}"""
+
+EN_TUCHONG_V2 = """Analyze this image and output only JSON in the format below, with no other text.
+{
+"image_type": "pick one of: {category_options}; choose Other if unsure",
+"description": "one or two sentences",
+"keywords": ["at least 5, covering content, style, colors and mood"]
+}"""
+
+# 只要求核心字段，负载降级时使用
+ZH_GENERAL_CORE = """分析这张图片，只输出下面格式的JSON，不要输出其他文字。描述用中文，关键词部分提供中英文两个版本。
+{
+"image_type": "风景/人物/动物/建筑/食物/产品/抽象/其他",
+"main_subject": "主体，一句话",
+"keywords_cn": [],
+"keywords_en": []
+}"""
+
+EN_GENERAL_CORE = """Analyze this image and output only JSON in the format below, with no other text. Write descriptions in English, and provide both Chinese and English versions for keywords.
+{
+"image_type": "landscape/portrait/animal/architecture/food/product/abstract/other",
+"main_subject": "one sentence",
+"keywords_cn": [],
+"keywords_en": []
+}"""
+
+PROMPT_VERSIONS = {
+    'v1': {
+        'description': 'Ollama 分析器原有的提示词，附加平台要求和关键词数量限制',
+        'general': {'zh': ZH_GENERAL_V1, 'en': EN_GENERAL_V1},
+        'tuchong': {'zh': ZH_TUCHONG_V1, 'en': EN_TUCHONG_V1},
+        'platform_suffix': True
+    },
+    'v1-mlx': {
+        'description': 'MLX 分析器原有的提示词，不附加平台要求',
+        'general': {'zh': ZH_GENERAL_V1_MLX, 'en': EN_GENERAL_V1},
+        'tuchong': {'zh': ZH_TUCHONG_V1, 'en': EN_TUCHONG_V1},
+        'platform_suffix': False
+    },
+    'v2-compact': {
+        'description': '精简版，字段不变，去掉示例占位和重复说明',
+        'general': {'zh': ZH_GENERAL_V2, 'en': EN_GENERAL_V2},
+        'tuchong': {'zh': ZH_TUCHONG_V2, 'en': EN_TUCHONG_V2},
+        'platform_suffix': True
+    },
+    'v2-core': {
+        'description': '只要求核心字段（类型、主体和关键词），生成最少，用于负载降级',
+        'general': {'zh': ZH_GENERAL_CORE, 'en': EN_GENERAL_CORE},
+        'tuchong': {'zh': ZH_TUCHONG_V2, 'en': EN_TUCHONG_V2},
+        'platform_suffix': True
+    }
+}
+
+# 分析请求的推理参数
+ANALYSIS_OPTIONS = {'temperature': 0.7, 'top_p': 0.9, 'num_predict': 1000}
+
+_FIELD_PATTERN = re.compile(r'^\s*"(\w+)"\s*:', re.MULTILINE)
+
+
+def build_prompt(version, platform='general', language='zh'):
+    """生成指定版本的平台提示词，由本地计算的字段已从JSON模板中去掉"""
+    spec = PROMPT_VERSIONS.get(version)
+    if spec is None:
+        raise ValueError(f"未知的提示词版本: {version}（可选: {', '.join(PROMPT_VERSIONS)}）")
+
+    lang = 'zh' if language == 'zh' else 'en'
+    if platform == 'tuchong' and platform in PLATFORM_TEMPLATES:
+        categories = PLATFORM_TEMPLATES[platform].get('categories', [])
+        separator = '、' if lang == 'zh' else ', '
+        prompt = spec['tuchong'][lang].replace('{category_options}', separator.join(categories))
+    else:
+        prompt = spec['general'][lang]
+
+    # 色彩和光线由本地计算，不再让模型生成
+    prompt = strip_local_fields(prompt)
+
+    if spec['platform_suffix'] and platform in PLATFORM_TEMPLATES:
+        template = PLATFORM_TEMPLATES[platform]
+        if lang == 'zh':
+            prompt += f"\n\n特别要求：{template['prompt_suffix']}"
+            prompt += f"\n关键词数量限制：{template['max_keywords']}个"
+        else:
+            prompt += f"\n\nSpecial requirements: {template['prompt_suffix']}"
+            prompt += f"\nKeyword limit: {template['max_keywords']} keywords"
+    return prompt
+
+
+def prompt_fields(prompt):
+    """提示词JSON模板中要求的字段"""
+    return _FIELD_PATTERN.findall(prompt)
+
+
+def add_usage(usage, response):
+    """累加 Ollama 响应中的提示词和生成 token 数"""
+    usage['prompt_tokens'] += response.get('prompt_eval_count') or 0
+    usage['completion_tokens'] += response.get('eval_count') or 0
+    return response
@@ -0,0 +1,116 @@
+"""
+推理前质量筛查
+模糊、近乎纯色、严重过曝/欠曝或分辨率不足的图片会被图库平台拒收，
+在调用模型之前用 NumPy 快速检测，不合格的图片直接标记，不再进行推理。
+各平台阈值配置在 PLATFORM_TEMPLATES[平台]['quality'] 中，QUALITY_SCREEN 开启时才生效
+"""
+
+import importlib.util
+from io import BytesIO
+
+from PIL import Image
+
+from config import Config, PLATFORM_TEMPLATES
+
+# 只检查是否安装，NumPy 在计算时才导入，不拖慢 CLI 和 Web 服务的启动
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+
+# 统一缩放到该长边后再计算清晰度，使不同尺寸的图片阈值可比
+WORKING_SIZE = 512
+
+
+def measure_quality(image_data):
+    """计算清晰度（拉普拉斯方差）、曝光裁切比例和颜色离散度
+
+    在预处理阶段调用，返回可序列化的字典；NumPy 不可用或无法解码时返回 None
+    """
+    if not NUMPY_AVAILABLE or not image_data:
+        return None
+    import numpy as np
+
+    try:
+        with Image.open(BytesIO(image_data)) as img:
+            img.draft('RGB', (WORKING_SIZE, WORKING_SIZE))
+            img = img.convert('RGB')
+            img.thumbnail((WORKING_SIZE, WORKING_SIZE))
+            rgb = np.asarray(img, dtype=np.float32)
+    except Exception:
+        return None
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    # 四邻域拉普拉斯算子，只取内部像素
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+
+    return {
+        'sharpness': round(float(laplacian.var()) if laplacian.size else 0.0, 2),
+        'dark_clipped': round(float((gray <= 2).mean()), 4),
+        'bright_clipped': round(float((gray >= 253).mean()), 4),
+        'color_spread': round(float(rgb.reshape(-1, 3).std(axis=0).max()), 2)
+    }
+
+
+def thresholds_for(platform):
+    """平台的质量阈值，未开启 QUALITY_SCREEN 或未配置时不做筛查"""
+    if not Config.QUALITY_SCREEN:
+        return None
+    template = PLATFORM_TEMPLATES.get(platform) or PLATFORM_TEMPLATES.get('general', {})
+    return template.get('quality')
+
+
+def screen(metrics, original_size, thresholds):
+    """按阈值检查图片，返回未通过的项目列表（全部通过时为空列表）"""
+    if not thresholds:
+        return []
+
+    issues = []
+
+    min_megapixels = thresholds.get('min_megapixels')
+    if min_megapixels and original_size:
+        megapixels = original_size[0] * original_size[1] / 1_000_000
+        if megapixels < min_megapixels:
+            issues.append({
+                'check': 'resolution',
+                'value': round(megapixels, 2),
+                'threshold': min_megapixels,
+                'message': f"分辨率过低（{original_size[0]}x{original_size[1]}，要求至少{min_megapixels}百万像素）"
+            })
+
+    if not metrics:
+        return issues
+
+    # 纯色画面的清晰度也接近零，只报告纯色
+    min_color_spread = thresholds.get('min_color_spread')
+    if min_color_spread is not None and metrics['color_spread'] < min_color_spread:
+        issues.append({
+            'check': 'uniform',
+            'value': metrics['color_spread'],
+            'threshold': min_color_spread,
+            'message': "画面接近纯色，没有可识别的内容"
+        })
+        return issues
+
+    max_clipped = thresholds.get('max_clipped')
+    if max_clipped is not None:
+        clipped = max(metrics['dark_clipped'], metrics['bright_clipped'])
+        if clipped > max_clipped:
+            kind = '过曝' if metrics['bright_clipped'] >= metrics['dark_clipped'] else '欠曝'
+            issues.append({
+                'check': 'clipping',
+                'value': clipped,
+                'threshold': max_clipped,
+                'message': f"严重{kind}（{clipped:.0%}的像素丢失细节）"
+            })
+
+    min_sharpness = thresholds.get('min_sharpness')
+    if min_sharpness is not None and metrics['sharpness'] < min_sharpness:
+        issues.append({
+            'check': 'blur',
+            'value': metrics['sharpness'],
+            'threshold': min_sharpness,
+            'message': f"图片模糊（清晰度{metrics['sharpness']:.1f}，要求至少{min_sharpness}）"
+        })
+
+    return issues
@@ -0,0 +1,145 @@
+"""
+批量处理检查点的单元测试：中断时写了一半的行、多次恢复产生的重复记录和分片合并
+"""
+
+import sys
+import json
+
+import pytest
+
+from checkpoint import ResultCheckpoint, merge_checkpoints, read_records, params_key
+
+PARAMS = params_key('general', 'zh', 'llava:7b', 'ollama')
+
+
+def _ok(path):
+    return {'filename': path.rsplit('/', 1)[-1], 'filepath': path, 'analysis': f'分析 {path}'}
+
+
+def _failed(path):
+    return {'filename': path.rsplit('/', 1)[-1], 'filepath': path, 'error': '分析失败: 连接超时'}
+
+
+def _write(path, results, params=PARAMS, resume=False):
+    with ResultCheckpoint(path, params, resume=resume) as checkpoint:
+        for result in results:
+            checkpoint.append(result)
+
+
+def _lines(path):
+    with open(path, 'rb') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_truncates_torn_final_line(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write(path, [_ok('/a.jpg'), _ok('/b.jpg')])
+    intact = path.read_bytes()
+    with open(path, 'ab') as f:
+        f.write(b'{"key": "/c.jpg", "params": "' + PARAMS.encode() + b'", "result": {"filena')
+
+    checkpoint = ResultCheckpoint(path, PARAMS, resume=True)
+    assert path.read_bytes() == intact
+    assert checkpoint.counts() == (2, 0)
+    assert not checkpoint.is_done('/c.jpg')
+
+    # 截断后继续追加，文件仍是完整的 JSONL
+    checkpoint.append(_ok('/c.jpg'))
+    checkpoint.close()
+    assert [line['key'] for line in _lines(path)] == ['/a.jpg', '/b.jpg', '/c.jpg']
+
+
+def test_resume_stops_at_complete_but_invalid_line(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write(path, [_ok('/a.jpg')])
+    intact = path.read_bytes()
+    with open(path, 'ab') as f:
+        f.write(b'{"key": "/b.jpg", \n')
+        f.write(json.dumps({'key': '/c.jpg', 'params': PARAMS, 'result': _ok('/c.jpg')}).encode() + b'\n')
+
+    checkpoint = ResultCheckpoint(path, PARAMS, resume=True)
+    checkpoint.close()
+    assert path.read_bytes() == intact
+    assert len(checkpoint) == 1
+
+
+def test_duplicate_entries_across_resumes(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write(path, [_ok('/a.jpg'), _failed('/b.jpg'), _failed('/c.jpg')])
+
+    # 第二次运行只重试失败的图片，/b.jpg 成功、/c.jpg 再次失败
+    checkpoint = ResultCheckpoint(path, PARAMS, resume=True)
+    assert checkpoint.is_done('/a.jpg') and not checkpoint.is_done('/b.jpg')
+    checkpoint.append(_ok('/b.jpg'))
+    checkpoint.append(_failed('/c.jpg'))
+    checkpoint.close()
+
+    checkpoint = ResultCheckpoint(path, PARAMS, resume=True)
+    assert len(_lines(path)) == 5
+    assert len(checkpoint) == 3
+    assert checkpoint.counts() == (2, 1)
+    assert checkpoint.is_done('/b.jpg') and not checkpoint.is_done('/c.jpg')
+
+    # 每张图片只输出最新的结果，顺序为首次处理的顺序
+    results = list(checkpoint)
+    checkpoint.close()
+    assert [result['filepath'] for result in results] == ['/a.jpg', '/b.jpg', '/c.jpg']
+    assert 'error' not in results[1] and 'error' in results[2]
+
+
+def test_resume_ignores_results_with_other_params(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    _write(path, [_ok('/a.jpg')], params=params_key('tuchong'))
+
+    checkpoint = ResultCheckpoint(path, PARAMS, resume=True)
+    assert not checkpoint.is_done('/a.jpg')
+    assert len(checkpoint) == 0
+    checkpoint.close()
+    assert len(_lines(path)) == 1
+
+
+def _overlapping_shards(tmp_path):
+    first, second = tmp_path / 'shard1.jsonl', tmp_path / 'shard2.jsonl'
+    _write(first, [_ok('/b.jpg'), _failed('/c.jpg'), _failed('/d.jpg'), _ok('/a.jpg')])
+    _write(second, [_failed('/b.jpg'), _ok('/c.jpg'), _failed('/d.jpg'), _ok('/e.jpg')])
+    with open(second, 'ab') as f:
+        f.write(b'{"key": "/f.jpg", "par')
+    return [str(first), str(second)]
+
+
+def test_merge_overlapping_shards_prefers_successful_results(tmp_path):
+    shards = _overlapping_shards(tmp_path)
+    merged = tmp_path / 'merged.jsonl'
+
+    assert merge_checkpoints(shards, str(merged)) == PARAMS
+    records = [record for _, _, record in read_records(merged)]
+    assert [record['key'] for record in records] == ['/a.jpg', '/b.jpg', '/c.jpg', '/d.jpg', '/e.jpg']
+    assert ['error' not in record['result'] for record in records] == [True, True, True, False, True]
+
+    checkpoint = ResultCheckpoint(merged, PARAMS, resume=True)
+    assert checkpoint.counts() == (4, 1)
+    checkpoint.close()
+
+
+def test_merge_rejects_mismatched_params(tmp_path):
+    first, second = tmp_path / 'shard1.jsonl', tmp_path / 'shard2.jsonl'
+    _write(first, [_ok('/a.jpg')])
+    _write(second, [_ok('/b.jpg')], params=params_key('tuchong'))
+    with pytest.raises(ValueError):
+        merge_checkpoints([str(first), str(second)], str(tmp_path / 'merged.jsonl'))
+
+
+def test_cli_merge_exports_merged_results(tmp_path, monkeypatch):
+    import cli
+
+    shards = _overlapping_shards(tmp_path)
+    output = tmp_path / 'merged.json'
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['cli.py', '--merge', *shards, '-o', str(output)])
+    cli.main()
+
+    exported = json.loads(output.read_text(encoding='utf-8'))
+    assert exported['total_images'] == 5
+    assert [result['filepath'] for result in exported['results']] == ['/a.jpg', '/b.jpg', '/c.jpg', '/d.jpg', '/e.jpg']
+    # 分片检查点保持不变
+    assert len(_lines(shards[0])) == 4
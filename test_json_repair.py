@@ -0,0 +1,79 @@
+"""
+模型输出JSON修复的单元测试
+"""
+
+from json_repair import parse_model_json, core_fields, missing_fields, build_reask_prompt, merge_fields
+
+
+def test_fenced_json_with_surrounding_prose():
+    text = '好的，以下是分析结果：\n```json\n{"image_type": "风景", "keywords_cn": ["山", "水"]}\n```\n希望对你有帮助'
+    data, info = parse_model_json(text)
+    assert data == {'image_type': '风景', 'keywords_cn': ['山', '水']}
+    assert info == {'repaired': False, 'truncated': False}
+
+
+def test_trailing_commas():
+    data, info = parse_model_json('{"image_type": "风景", "keywords_cn": ["山", "水",],}')
+    assert data == {'image_type': '风景', 'keywords_cn': ['山', '水']}
+    assert info['repaired'] and not info['truncated']
+
+
+def test_single_quotes():
+    data, info = parse_model_json("{'image_type': '风景', 'keywords_cn': ['山', '水']}")
+    assert data == {'image_type': '风景', 'keywords_cn': ['山', '水']}
+    assert info['repaired']
+
+
+def test_fullwidth_punctuation():
+    data, _ = parse_model_json('｛"image_type"：“风景”，"keywords_cn"：［"山"、"水"］｝')
+    assert data == {'image_type': '风景', 'keywords_cn': ['山', '水']}
+
+
+def test_missing_comma_between_lines():
+    data, _ = parse_model_json('{\n"image_type": "风景"\n"main_subject": "山"\n}')
+    assert data == {'image_type': '风景', 'main_subject': '山'}
+
+
+def test_unescaped_inner_quotes():
+    data, _ = parse_model_json('{"main_subject": "一块写着"欢迎"的牌子", "image_type": "其他"}')
+    assert data == {'main_subject': '一块写着"欢迎"的牌子', 'image_type': '其他'}
+
+
+def test_truncated_object_keeps_complete_values():
+    text = '{"image_type": "风景", "main_subject": "湖边的山", "keywords_cn": ["山", "水", "湖'
+    data, info = parse_model_json(text)
+    # 写了一半的最后一个关键词被丢弃，已完整输出的值保留
+    assert data == {'image_type': '风景', 'main_subject': '湖边的山', 'keywords_cn': ['山', '水']}
+    assert info == {'repaired': True, 'truncated': True}
+
+
+def test_truncated_inside_string_value_drops_the_field():
+    data, info = parse_model_json('{"image_type": "风景", "main_subject": "湖边的')
+    assert data == {'image_type': '风景'}
+    assert info['truncated']
+
+
+def test_non_json_prose_returns_none():
+    assert parse_model_json('这是一张美丽的风景照片，画面中有山和水。')[0] is None
+    assert parse_model_json('')[0] is None
+    assert parse_model_json('["a", "b"]')[0] is None
+
+
+def test_missing_fields_drive_reask():
+    data, _ = parse_model_json('{"image_type": "风景", "main_subject": "", "keywords_cn": []')
+    fields = core_fields('general')
+    # 空字符串和空列表视为缺失
+    assert missing_fields(data, fields) == ['main_subject', 'keywords_cn', 'keywords_en']
+    assert missing_fields(None, core_fields('tuchong')) == ['image_type', 'description', 'keywords']
+
+    prompt = build_reask_prompt(['main_subject', 'keywords_en'], 'en')
+    assert '"main_subject": "..."' in prompt and '"keywords_en": [...]' in prompt
+    assert 'image_type' not in prompt
+
+
+def test_merge_fields_does_not_overwrite_existing_values():
+    data = {'image_type': '风景', 'main_subject': ''}
+    extra = {'image_type': '人物', 'main_subject': '湖边的山', 'mood': '平静'}
+    merged = merge_fields(data, extra, ['image_type', 'main_subject'])
+    assert merged == {'image_type': '风景', 'main_subject': '湖边的山'}
+    assert data['main_subject'] == ''
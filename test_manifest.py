@@ -0,0 +1,86 @@
+"""
+增量处理清单的单元测试：未变化的文件和压缩包成员在第二次运行时直接复用上次的结果
+"""
+
+import sys
+import json
+import zipfile
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from archive_input import ArchiveMember
+from manifest import StatManifest, fingerprint
+
+
+def _jpeg(color):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+
+def test_archive_member_fingerprint_and_key(tmp_path):
+    member = ArchiveMember('shoot.zip', 'a/b.jpg', b'abc', 1700000000.0, str(tmp_path / 'shoot.zip'))
+    assert StatManifest.key_for(member) == f"{tmp_path / 'shoot.zip'}!a/b.jpg"
+    assert fingerprint(member) == fingerprint(ArchiveMember('other.zip', 'b.jpg', b'abc', 1700000000.0))
+    assert fingerprint(member) != fingerprint(ArchiveMember('shoot.zip', 'a/b.jpg', b'abd', 1700000000.0))
+
+    manifest = StatManifest(str(tmp_path / 'm.db'), 'params')
+    assert manifest.lookup(member) == (None, fingerprint(member))
+    manifest.record(member, {'analysis': '分析'}, fingerprint(member))
+    assert manifest.lookup(member)[0] == {'analysis': '分析'}
+    # 内容变化后指纹不同，不复用
+    changed = ArchiveMember('shoot.zip', 'a/b.jpg', b'xyz', 1700000000.0, str(tmp_path / 'shoot.zip'))
+    assert manifest.lookup(changed)[0] is None
+    manifest.close()
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    import image_analyzer
+
+    calls = []
+
+    def analyze_image(self, image_path, platform='general', model=None, language='zh', image_data=None,
+                      prompt_version=None):
+        calls.append(str(image_path))
+        return {'image_type': '风景', 'main_subject': str(image_path).rsplit('!', 1)[-1],
+                'keywords_cn': ['山'], 'keywords_en': ['mountain'], 'image_info': {}}
+
+    monkeypatch.setattr(image_analyzer.ImageAnalyzer, 'analyze_image', analyze_image)
+    monkeypatch.setattr(image_analyzer.ImageAnalyzer, 'check_and_download_model', lambda self, model: True)
+    return calls
+
+
+def test_cli_manifest_reuses_unchanged_archive_members(tmp_path, monkeypatch, fake_engine):
+    import cli
+
+    archive = tmp_path / 'shoot.zip'
+    _zip(archive, {'a.jpg': _jpeg('red'), 'sub/b.jpg': _jpeg('blue')})
+    monkeypatch.chdir(tmp_path)
+
+    def run(output):
+        monkeypatch.setattr(sys, 'argv', ['cli.py', str(archive), '--manifest', str(tmp_path / 'm.db'),
+                                          '-o', str(tmp_path / output), '--no-progress'])
+        cli.main()
+        return json.loads((tmp_path / output).read_text(encoding='utf-8'))
+
+    first = run('first.json')
+    assert sorted(call.rsplit('!', 1)[-1] for call in fake_engine) == ['a.jpg', 'sub/b.jpg']
+
+    fake_engine.clear()
+    second = run('second.json')
+    assert fake_engine == []
+    assert [r['analysis'] for r in second['results']] == [r['analysis'] for r in first['results']]
+
+    # 压缩包中修改过的成员重新分析，未变化的继续复用
+    _zip(archive, {'a.jpg': _jpeg('red'), 'sub/b.jpg': _jpeg('green')})
+    run('third.json')
+    assert [call.rsplit('!', 1)[-1] for call in fake_engine] == ['sub/b.jpg']
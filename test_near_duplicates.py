@@ -0,0 +1,167 @@
+"""
+近似重复索引的单元测试：多索引检索结果与暴力汉明距离搜索对比
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import near_duplicates  # noqa: E402
+from near_duplicates import NearDuplicateIndex, _HashTable  # noqa: E402
+
+
+def _flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def _brute_force(hashes, value, max_distance):
+    """返回最小汉明距离，没有不超过 max_distance 的哈希时返回 None"""
+    best = min(bin(h ^ value).count('1') for h in hashes)
+    return best if best <= max_distance else None
+
+
+def _corpus(rng, size=300):
+    """随机哈希，其中一部分为已有哈希翻转若干位得到的近似值"""
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    for _ in range(size // 3):
+        hashes.append(_flip(rng.choice(hashes), rng.sample(range(64), rng.randint(1, 12))))
+    return hashes
+
+
+def _queries(rng, hashes, count=200):
+    queries = []
+    for _ in range(count):
+        base = rng.choice(hashes)
+        queries.append(_flip(base, rng.sample(range(64), rng.randint(0, 16))))
+    queries.extend(rng.getrandbits(64) for _ in range(20))
+    return queries
+
+
+def _counting(function):
+    """包装 _neighbors，记录分段索引是否被使用"""
+    _counting.calls = 0
+
+    def wrapper(*args):
+        _counting.calls += 1
+        return function(*args)
+    return wrapper
+
+
+def _check(table, hashes, queries, max_distance):
+    for query in queries:
+        expected = _brute_force(hashes, query, max_distance)
+        found = table.nearest(query, max_distance)
+        if expected is None:
+            assert found is None
+        else:
+            row_id, distance = found
+            assert distance == expected
+            assert bin(hashes[row_id] ^ query).count('1') == distance
+
+
+@pytest.mark.parametrize('max_distance', [0, 1, 3, 4, 5, 7, 8, 12, 15])
+def test_lookup_matches_brute_force(max_distance, monkeypatch):
+    rng = random.Random(max_distance)
+    # 哈希数多于要查的桶数，检索走分段索引而不是线性比较
+    hashes = _corpus(rng, size=2400)
+    table = _HashTable(list(range(len(hashes))), hashes)
+    monkeypatch.setattr(near_duplicates, '_neighbors', _counting(near_duplicates._neighbors))
+    _check(table, hashes, _queries(rng, hashes, count=60), max_distance)
+    assert _counting.calls
+
+
+def test_linear_scan_for_small_tables(monkeypatch):
+    rng = random.Random(5)
+    hashes = _corpus(rng, size=30)
+    table = _HashTable(list(range(len(hashes))), hashes)
+    monkeypatch.setattr(near_duplicates, '_neighbors', _counting(near_duplicates._neighbors))
+    _check(table, hashes, _queries(rng, hashes, count=60), 8)
+    assert not _counting.calls
+    assert _HashTable([], []).nearest(rng.getrandbits(64), 8) is None
+
+
+def test_distance_equal_to_threshold_is_a_match():
+    rng = random.Random(1)
+    base = rng.getrandbits(64)
+    # 其余随机哈希与 base 相距很远，只用于让检索走分段索引
+    hashes = [base] + [rng.getrandbits(64) for _ in range(3000)]
+    table = _HashTable(list(range(len(hashes))), hashes)
+    for max_distance in (1, 4, 7, 8):
+        # 翻转的位集中在同一段，另外三段完全相同
+        query = _flip(base, range(max_distance))
+        assert table.nearest(query, max_distance) == (0, max_distance)
+        assert table.nearest(query, max_distance - 1) is None
+
+        # 翻转的位均匀分布在四段，每段距离都接近 max_distance / 4
+        query = _flip(base, [(i % 4) * 16 + i // 4 for i in range(max_distance)])
+        assert table.nearest(query, max_distance) == (0, max_distance)
+        assert table.nearest(query, max_distance - 1) is None
+
+
+def test_threshold_beyond_band_limit():
+    # 每段只有16位，阈值达到64时任何哈希都匹配，每段的搜索半径超出段长也不应出错
+    rng = random.Random(2)
+    hashes = _corpus(rng, size=20)
+    table = _HashTable(list(range(len(hashes))), hashes)
+    for max_distance in (64, 70):
+        for query in _queries(rng, hashes, count=5):
+            row_id, distance = table.nearest(query, max_distance)
+            assert distance == _brute_force(hashes, query, max_distance)
+
+
+def test_pending_hashes_are_merged_into_bands(monkeypatch):
+    monkeypatch.setattr(near_duplicates, 'PENDING_LIMIT', 16)
+    rng = random.Random(3)
+    hashes = _corpus(rng, size=1500)
+    table = _HashTable(list(range(1000)), hashes[:1000])
+    queries = _queries(rng, hashes, count=50)
+    for row_id in range(1000, len(hashes)):
+        table.add(row_id, hashes[row_id])
+        # 缓冲区中的哈希和插入分段索引后的哈希都应能找到，数组扩容后也一样
+        if row_id % 97 == 0:
+            _check(table, hashes[:row_id + 1], queries, 6)
+    assert table.size == len(hashes) and table.size - table.indexed < 16
+    _check(table, hashes, queries, 6)
+
+    # 逐条插入的分段索引与一次性建立的完全相同
+    rebuilt = _HashTable(list(range(table.indexed)), hashes[:table.indexed])
+    for i in range(near_duplicates.CHUNKS):
+        assert (table.offsets[i] == rebuilt.offsets[i]).all()
+        for value in range(0, near_duplicates.CHUNK_VALUES, 251):
+            start, end = rebuilt.offsets[i][value], rebuilt.offsets[i][value + 1]
+            assert sorted(table.positions[i][start:end]) == sorted(rebuilt.positions[i][start:end])
+
+
+def test_index_persists_and_separates_params(tmp_path):
+    db_path = str(tmp_path / 'phash.db')
+    rng = random.Random(4)
+    # 最高位为1的哈希在 SQLite 中以负数保存
+    value = rng.getrandbits(63) | (1 << 63)
+
+    index = NearDuplicateIndex(db_path, max_distance=4)
+    assert index.lookup(value, 'a') is None
+    index.add(value, 'a', {'image_type': '风景'}, source='a.jpg')
+    assert index.lookup(_flip(value, [0, 63]), 'a') == ({'image_type': '风景'}, 'a.jpg', 2)
+    assert index.lookup(value, 'b') is None
+    index.close()
+
+    index = NearDuplicateIndex(db_path, max_distance=4)
+    assert index.lookup(_flip(value, [1, 2, 3, 4]), 'a')[2] == 4
+    assert index.lookup(_flip(value, [1, 2, 3, 4, 5]), 'a') is None
+    assert len(index) == 1
+    index.close()
+
+
+def test_preprocess_hashes_only_when_requested():
+    from io import BytesIO
+    from PIL import Image
+    from unified_analyzer import preprocess_image
+
+    buffer = BytesIO()
+    Image.new('RGB', (96, 64), (200, 120, 40)).save(buffer, format='JPEG')
+    assert preprocess_image('a.jpg', data=buffer.getvalue())['phash'] is None
+    assert isinstance(preprocess_image('a.jpg', data=buffer.getvalue(), phash=True)['phash'], int)
@@ -5,26 +5,38 @@
 
 import time
 import os
-from models import OllamaImageAnalyzer, MLXImageAnalyzer
 from platforms import (
     GeneralFormatter, TuchongFormatter,
     AdobeStockFormatter, VCGFormatter
 )
-from config import PLATFORM_TEMPLATES
+from config import Config, PLATFORM_TEMPLATES
 from image_validator import ImageValidator
+from image_features import extract_features, apply_features
+from quality_screen import measure_quality, screen, thresholds_for
+from checkpoint import params_key
+from profiling import capture
+from degradation import policy_from_config, downscale
 
 
 class UnifiedImageAnalyzer:
     """统一图片分析器，整合模型和平台"""
 
     def __init__(self):
-        # 初始化不同的AI模型分析器
-        self.ollama_analyzer = OllamaImageAnalyzer()
-        self.mlx_analyzer = MLXImageAnalyzer()
+        # AI模型分析器在首次使用时才创建，避免启动时导入重型依赖或加载模型
+        self._ollama_analyzer = None
+        self._mlx_analyzer = None
 
         # 初始化图片验证器
         self.image_validator = ImageValidator()
 
+        # 近似重复索引，启用后连拍等相似图片直接复用已有分析结果
+        self.duplicate_index = None
+        if Config.NEAR_DUPLICATE_DB:
+            self.enable_near_duplicates(Config.NEAR_DUPLICATE_DB, Config.NEAR_DUPLICATE_DISTANCE)
+
+        # 负载降级策略，DEGRADE_SLO_SECONDS 为0时不启用
+        self.degradation = policy_from_config()
+
         # 初始化平台格式化器
         self.formatters = {
             'general': GeneralFormatter(PLATFORM_TEMPLATES.get('general', {})),
@@ -33,89 +45,143 @@ class UnifiedImageAnalyzer:
             'vcg': VCGFormatter(PLATFORM_TEMPLATES.get('vcg', {}))
         }
 
-    def analyze_image(self, image_path, platform='general', model=None, language='zh', engine='ollama'):
-        """统一的图片分析接口，包含图片验证和耗时统计"""
-        start_time = time.time()
-        image_name = os.path.basename(image_path) if image_path else "Unknown"
+    def enable_near_duplicates(self, db_path, max_distance=4):
+        """启用近似重复复用，需要 NumPy，不可用时返回 False"""
+        from near_duplicates import NearDuplicateIndex, NUMPY_AVAILABLE
+        if not NUMPY_AVAILABLE:
+            print("⚠️ 未安装 numpy，近似重复复用未启用")
+            return False
+        if self.duplicate_index is not None:
+            self.duplicate_index.close()
+        self.duplicate_index = NearDuplicateIndex(db_path, max_distance)
+        return True
 
-        print(f"🔍 开始分析图片: {image_name}")
+    @property
+    def ollama_analyzer(self):
+        if self._ollama_analyzer is None:
+            from image_analyzer import ImageAnalyzer as OllamaImageAnalyzer
+            self._ollama_analyzer = OllamaImageAnalyzer()
+        return self._ollama_analyzer
 
-        # 第一步：验证和修复图片
-        try:
-            validation_result, error_info = self.image_validator.validate_and_fix_image(image_path)
-
-            if validation_result and validation_result.get('success'):
-                print(f"✅ 图片验证通过，使用方法: {validation_result.get('method_used', 'unknown')}")
-
-                # 如果图片被修复了，需要创建临时文件
-                if validation_result.get('data'):
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-                        tmp.write(validation_result['data'])
-                        processed_image_path = tmp.name
-                        print(f"📝 图片已处理并保存为临时文件")
-                else:
-                    processed_image_path = image_path
-            else:
-                # 验证失败，返回详细错误信息
-                error_msg = self.image_validator.get_detailed_error_message(error_info)
-                return {
-                    'error': f"图片格式错误：{error_msg}",
-                    'error_type': 'image_validation_failed',
-                    'suggestions': [
-                        "重新保存为标准JPEG格式",
-                        "使用其他图片编辑软件转换格式",
-                        "检查文件是否完整下载",
-                        "尝试重新截图或重新获取图片"
-                    ]
-                }
+    @property
+    def mlx_analyzer(self):
+        if self._mlx_analyzer is None:
+            from mlx_analyzer import MLXImageAnalyzer
+            self._mlx_analyzer = MLXImageAnalyzer()
+        return self._mlx_analyzer
+
+    def analyze_image(self, image_path, platform='general', model=None, language='zh', engine='ollama',
+                      on_preprocessed=None, profile=None, display_name=None):
+        """统一的图片分析接口，包含图片验证和耗时统计
+
+        on_preprocessed: 可选回调，接收预处理后的JPEG数据（如用于生成预览缩略图）
+        profile: 是否剖析本次调用，None 时由 PICTAGGER_PROFILE 环境变量决定
+        display_name: 结果和日志中显示的文件名（如上传时的原始文件名），默认取 image_path 的文件名
+        """
+        image_name = display_name or (os.path.basename(image_path) if image_path else "Unknown")
+
+        with capture(f"analyze_image {image_name} ({platform}/{engine})", profile) as record:
+            print(f"🔍 开始分析图片: {image_name}")
+
+            # 第一步：验证和修复图片
+            preprocessed = preprocess_image(image_path, validator=self.image_validator,
+                                            phash=self.duplicate_index is not None)
 
-        except Exception as e:
+            if on_preprocessed and preprocessed.get('data'):
+                try:
+                    on_preprocessed(preprocessed['data'])
+                except Exception as e:
+                    print(f"⚠️ 预处理回调失败: {str(e)}")
+
+            # 第二步：模型推理
+            result = self.analyze_preprocessed(image_path, preprocessed, platform, model, language, engine,
+                                               display_name=display_name)
+
+        if record:
+            result.setdefault('image_info', {})['profile'] = record['profile']
+        return result
+
+    def analyze_preprocessed(self, image_path, preprocessed, platform='general', model=None, language='zh',
+                             engine='ollama', display_name=None):
+        """使用预处理结果进行模型推理，供流水线在预处理与推理分离时调用"""
+        start_time = time.time()
+        image_name = display_name or (os.path.basename(image_path) if image_path else "Unknown")
+
+        if not preprocessed.get('success'):
+            return preprocessed
+
+        # 平台会拒收的图片（模糊、纯色、严重过曝/欠曝、分辨率不足）不调用模型
+        issues = screen(preprocessed.get('quality'), preprocessed.get('original_size'), thresholds_for(platform))
+        if issues:
+            print(f"⚠️ 图片 {image_name} 未通过质量筛查，跳过模型推理")
             return {
-                'error': f"图片验证过程出错：{str(e)}",
-                'error_type': 'validation_process_error',
+                'error': f"图片质量未通过筛查：{'；'.join(issue['message'] for issue in issues)}",
+                'error_type': 'quality_screen_failed',
+                'quality_issues': issues,
                 'suggestions': [
-                    "检查图片文件权限",
-                    "确保图片文件未损坏",
-                    "尝试复制图片到其他位置"
-                ]
+                    "使用对焦清晰、曝光正常的原图",
+                    "确认图片分辨率满足平台要求"
+                ],
+                'image_info': {
+                    'platform': platform,
+                    'image_name': image_name,
+                    'original_size': preprocessed.get('original_size'),
+                    'quality_metrics': preprocessed.get('quality'),
+                    'processing_time': time.time() - start_time + preprocessed.get('preprocess_time', 0)
+                }
             }
 
-        # 根据引擎选择分析器
-        if engine.lower() == 'mlx':
-            analyzer = self.mlx_analyzer
-            # 检查MLX是否可用
-            availability = analyzer.check_model_availability()
-            if not availability.get('available', False):
-                # 如果MLX不可用，回退到Ollama
-                print("MLX不可用，自动切换到Ollama")
-                analyzer = self.ollama_analyzer
-        else:
-            analyzer = self.ollama_analyzer
+        # 与已分析过的图片足够相似时直接复用其结果
+        duplicate_params = match = None
+        if self.duplicate_index is not None and preprocessed.get('phash') is not None:
+            duplicate_params = params_key(platform, language, model or Config.OLLAMA_MODEL, engine.lower())
+            match = self.duplicate_index.lookup(preprocessed['phash'], duplicate_params)
 
-        try:
-            # 执行分析
-            analysis_result = analyzer.analyze_image(processed_image_path, platform, model, language)
+        if match is not None:
+            analysis_result, source, distance = match
+            analysis_result.setdefault('image_info', {})
+            analysis_result['image_info']['near_duplicate_of'] = source
+            analysis_result['image_info']['near_duplicate_distance'] = distance
+            print(f"♻️ 图片 {image_name} 与 {os.path.basename(source or '')} 近似重复（距离 {distance}），复用分析结果")
+        else:
+            # 根据引擎选择分析器
+            if engine.lower() == 'mlx':
+                analyzer = self.mlx_analyzer
+                # 检查MLX是否可用
+                availability = analyzer.check_model_availability()
+                if not availability.get('available', False):
+                    # 如果MLX不可用，回退到Ollama
+                    print("MLX不可用，自动切换到Ollama")
+                    analyzer = self.ollama_analyzer
+            else:
+                analyzer = self.ollama_analyzer
 
-            # 如果使用了临时文件，清理它
-            if 'processed_image_path' in locals() and processed_image_path != image_path:
-                try:
-                    os.unlink(processed_image_path)
-                except:
-                    pass
+            # 直接使用预处理后的图片数据，无需写临时文件再重新压缩
+            if self.degradation is None:
+                analysis_result = analyzer.analyze_image(
+                    image_path, platform, model, language, image_data=preprocessed['data']
+                )
+            else:
+                # 按当前负载选择档位，降级档位使用更小的图片、模型或只要求核心字段
+                with self.degradation.slot() as (level, tier):
+                    image_data = preprocessed['data']
+                    if tier['max_image_size']:
+                        image_data = downscale(image_data, tier['max_image_size'], Config.IMAGE_QUALITY)
+                    analysis_result = analyzer.analyze_image(
+                        image_path, platform, tier['model'] or model, language, image_data=image_data,
+                        prompt_version=tier['prompt_version']
+                    )
+                analysis_result.setdefault('image_info', {})
+                analysis_result['image_info']['tier'] = tier['name']
+                analysis_result['image_info']['tier_level'] = level
 
-        except Exception as e:
-            # 清理临时文件
-            if 'processed_image_path' in locals() and processed_image_path != image_path:
-                try:
-                    os.unlink(processed_image_path)
-                except:
-                    pass
-            raise e
+        # 合并预处理阶段在本地计算的色彩和光线特征（MLX结果嵌套在 analysis 中）
+        if 'error' not in analysis_result:
+            target = analysis_result['analysis'] if isinstance(analysis_result.get('analysis'), dict) else analysis_result
+            apply_features(target, preprocessed.get('features'), language)
 
-        # 计算耗时
-        end_time = time.time()
-        processing_time = end_time - start_time
+        # 计算耗时（包含预处理耗时）
+        processing_time = time.time() - start_time + preprocessed.get('preprocess_time', 0)
 
         # 添加耗时信息到结果中
         if 'image_info' not in analysis_result:
@@ -124,12 +190,18 @@ class UnifiedImageAnalyzer:
         analysis_result['image_info']['processing_time'] = processing_time
         analysis_result['image_info']['image_name'] = image_name
 
-        # 如果图片被处理过，添加处理信息
-        if validation_result and validation_result.get('success'):
-            analysis_result['image_info']['image_processed'] = True
-            analysis_result['image_info']['original_size'] = validation_result.get('original_size')
-            analysis_result['image_info']['compressed_size'] = validation_result.get('compressed_size')
-            analysis_result['image_info']['processing_method'] = validation_result.get('method_used')
+        # 添加图片处理信息
+        analysis_result['image_info']['image_processed'] = True
+        analysis_result['image_info']['original_size'] = preprocessed.get('original_size')
+        analysis_result['image_info']['compressed_size'] = preprocessed.get('compressed_size')
+        analysis_result['image_info']['processing_method'] = preprocessed.get('method_used')
+        analysis_result['image_info']['quality_metrics'] = preprocessed.get('quality')
+
+        # 成功的新结果加入近似重复索引（原始文本等解析失败的结果和降级结果不复用）
+        if (duplicate_params is not None and match is None and 'error' not in analysis_result
+                and 'raw_response' not in target and not analysis_result['image_info'].get('tier_level')):
+            self.duplicate_index.add(preprocessed['phash'], duplicate_params, analysis_result,
+                                     source=display_name or image_path)
 
         # 打印耗时信息
         print(f"✅ 图片 {image_name} 分析完成，耗时: {processing_time:.2f}秒")
@@ -160,5 +232,68 @@ class UnifiedImageAnalyzer:
         return list(self.formatters.keys())
 
 
+
+def preprocess_image(image_path, validator=None, data=None, phash=False):
+    """验证并压缩图片，返回可跨进程传递的结果字典
+
+    成功时包含 data（JPEG字节）、尺寸、本地图像特征、质量指标、感知哈希和耗时；失败时返回带 error 的字典。
+    传入 data 时直接处理内存中的图片字节（如压缩包成员），image_path 仅作为名称。
+    质量指标只在开启质量筛查时计算，感知哈希只在 phash 为真（启用了近似重复检索）时计算。
+    定义为模块级函数，以便在预处理进程池中调用。
+    """
+    start_time = time.time()
+    validator = validator or ImageValidator()
+
+    try:
+        max_size = (Config.MAX_IMAGE_SIZE, Config.MAX_IMAGE_SIZE)
+        if data is not None:
+            validation_result, error_info = validator.validate_and_fix_bytes(
+                data, image_path, max_size, Config.IMAGE_QUALITY
+            )
+        else:
+            validation_result, error_info = validator.validate_and_fix_image(
+                image_path, max_size, Config.IMAGE_QUALITY
+            )
+    except Exception as e:
+        return {
+            'error': f"图片验证过程出错：{str(e)}",
+            'error_type': 'validation_process_error',
+            'suggestions': [
+                "检查图片文件权限",
+                "确保图片文件未损坏",
+                "尝试复制图片到其他位置"
+            ]
+        }
+
+    if not validation_result or not validation_result.get('success'):
+        # 验证失败，返回详细错误信息
+        error_msg = validator.get_detailed_error_message(error_info)
+        return {
+            'error': f"图片格式错误：{error_msg}",
+            'error_type': 'image_validation_failed',
+            'suggestions': [
+                "重新保存为标准JPEG格式",
+                "使用其他图片编辑软件转换格式",
+                "检查文件是否完整下载",
+                "尝试重新截图或重新获取图片"
+            ]
+        }
+
+    print(f"✅ 图片验证通过，使用方法: {validation_result.get('method_used', 'unknown')}")
+
+    # 色彩、光线特征、质量指标和感知哈希在缩略图上计算，与预处理一起在进程池中完成
+    validation_result['features'] = extract_features(validation_result.get('data'))
+    validation_result['quality'] = measure_quality(validation_result.get('data')) if Config.QUALITY_SCREEN else None
+    validation_result['phash'] = None
+    if phash:
+        try:
+            from near_duplicates import dhash
+            validation_result['phash'] = dhash(validation_result['data'])
+        except Exception:
+            pass
+    validation_result['preprocess_time'] = time.time() - start_time
+    return validation_result
+
+
 # 向后兼容的别名
-ImageAnalyzer = UnifiedImageAnalyzer
\ No newline at end of file
+ImageAnalyzer = UnifiedImageAnalyzer
@@ -0,0 +1,227 @@
+"""
+上传文件存储
+流式写入磁盘、写入过程中计算SHA-256，按内容哈希存储以去重，
+并通过保留期限和磁盘配额进行LRU清理
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+from flask import Request
+
+
+# 扩展名归一化，避免同一内容因扩展名写法不同而重复存储
+EXTENSION_ALIASES = {
+    '.jpeg': '.jpg',
+    '.tif': '.tiff'
+}
+
+
+def normalize_extension(filename):
+    """从原始文件名中提取并归一化扩展名"""
+    _, ext = os.path.splitext(filename or '')
+    ext = ext.lower()
+    return EXTENSION_ALIASES.get(ext, ext)
+
+
+class HashingUploadFile:
+    """边写入边计算SHA-256的临时文件，供Werkzeug解析multipart时直接写入"""
+
+    def __init__(self, directory, chunk_size=1024 * 1024):
+        fd, self.name = tempfile.mkstemp(dir=directory, suffix='.part')
+        # 使用大缓冲区，把解析器的小块写入合并为大块落盘
+        self._file = os.fdopen(fd, 'w+b', buffering=chunk_size)
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hasher.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadStore:
+    """按内容哈希寻址的上传文件存储"""
+
+    def __init__(self, upload_folder, quota_bytes=0, retention_seconds=0, chunk_size=1024 * 1024,
+                 on_evict=None):
+        self.upload_folder = upload_folder
+        self.tmp_folder = os.path.join(upload_folder, '.tmp')
+        self.quota_bytes = quota_bytes
+        self.retention_seconds = retention_seconds
+        self.chunk_size = chunk_size
+        # 文件被清理时的回调，参数为内容哈希
+        self.on_evict = on_evict
+
+        self._lock = threading.Lock()
+        self._active = {}
+        self._total_bytes = None
+        self._last_sweep = 0
+
+        os.makedirs(self.tmp_folder, exist_ok=True)
+
+    def create_upload_file(self):
+        """创建一个边写边哈希的临时文件"""
+        return HashingUploadFile(self.tmp_folder, self.chunk_size)
+
+    def save(self, file_storage):
+        """保存上传文件，返回存储信息；相同内容只保存一份"""
+        stream = file_storage.stream
+        ext = normalize_extension(file_storage.filename)
+
+        if isinstance(stream, HashingUploadFile):
+            # 解析请求时已写入磁盘并完成哈希
+            stream.flush()
+            tmp_path, file_hash, size = stream.name, stream.hexdigest(), stream.size
+        else:
+            tmp_path, file_hash, size = self._copy_with_hash(stream)
+
+        stored_name = f"{file_hash}{ext}"
+        stored_path = os.path.join(self.upload_folder, stored_name)
+
+        with self._lock:
+            duplicate = os.path.exists(stored_path)
+            if duplicate:
+                os.unlink(tmp_path)
+                # 更新修改时间，作为LRU的最近使用时间
+                os.utime(stored_path)
+            else:
+                os.replace(tmp_path, stored_path)
+                if self._total_bytes is not None:
+                    self._total_bytes += size
+            self._active[stored_name] = self._active.get(stored_name, 0) + 1
+
+        self.enforce_quota()
+
+        return {
+            'file_hash': file_hash,
+            'stored_name': stored_name,
+            'path': stored_path,
+            'size': size,
+            'duplicate': duplicate
+        }
+
+    def discard(self, file_storage):
+        """丢弃未被保存的上传临时文件"""
+        stream = file_storage.stream
+        if isinstance(stream, HashingUploadFile):
+            stream.close()
+            try:
+                os.unlink(stream.name)
+            except OSError:
+                pass
+
+    def release(self, stored_name):
+        """分析结束后释放文件，允许其被清理"""
+        with self._lock:
+            count = self._active.get(stored_name, 0) - 1
+            if count > 0:
+                self._active[stored_name] = count
+            else:
+                self._active.pop(stored_name, None)
+
+    def touch(self, stored_name):
+        """标记文件最近被访问"""
+        path = os.path.join(self.upload_folder, stored_name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _copy_with_hash(self, stream):
+        """按大块读取流，写入临时文件并同时计算哈希"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_folder, suffix='.part')
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return tmp_path, hasher.hexdigest(), size
+
+    def _scan(self):
+        """列出已存储文件 (mtime, size, name)"""
+        entries = []
+        with os.scandir(self.upload_folder) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    stat = entry.stat(follow_symlinks=False)
+                    entries.append((stat.st_mtime, stat.st_size, entry.name))
+        return entries
+
+    def _remove_stale_parts(self, now):
+        """清理中断上传遗留的临时文件"""
+        with os.scandir(self.tmp_folder) as it:
+            for entry in it:
+                try:
+                    if now - entry.stat().st_mtime > 3600:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def enforce_quota(self):
+        """按保留期限和磁盘配额清理最久未使用的文件"""
+        if not self.quota_bytes and not self.retention_seconds:
+            return 0
+
+        with self._lock:
+            # 配额内且距上次清理不足一分钟时，避免每次都扫描目录
+            now = time.time()
+            sweep_due = self.retention_seconds and now - self._last_sweep >= 60
+            over_quota = self.quota_bytes and (
+                self._total_bytes is None or self._total_bytes > self.quota_bytes
+            )
+            if not sweep_due and not over_quota:
+                return 0
+
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+
+            for mtime, size, name in entries:
+                expired = self.retention_seconds and now - mtime > self.retention_seconds
+                over_quota = self.quota_bytes and total > self.quota_bytes
+                if not expired and not over_quota:
+                    continue
+                if name in self._active:
+                    continue
+                try:
+                    os.unlink(os.path.join(self.upload_folder, name))
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                if self.on_evict:
+                    self.on_evict(os.path.splitext(name)[0])
+
+            self._total_bytes = total
+            self._last_sweep = now
+            self._remove_stale_parts(now)
+
+        return removed
+
+
+def make_request_class(upload_store):
+    """创建把上传文件直接写入存储临时目录的Request类"""
+
+    class UploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return upload_store.create_upload_file()
+
+    return UploadRequest
@@ -51,16 +51,19 @@ class ResultExporter:
     
     @staticmethod
     def export_to_json(results, filename='analysis_results.json'):
-        """导出结果为JSON格式"""
-        export_data = {
+        """导出结果为JSON格式，逐条写入，results 可以是检查点等可迭代对象"""
+        header = json.dumps({
             'export_time': datetime.now().isoformat(),
-            'total_images': len(results),
-            'results': results
-        }
-        
+            'total_images': len(results)
+        }, ensure_ascii=False, indent=2)
+
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
-        
+            f.write(header[:-2] + ',\n  "results": [')
+            for i, result in enumerate(results):
+                item = json.dumps(result, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+                f.write(('\n    ' if i == 0 else ',\n    ') + item)
+            f.write('\n  ]\n}' if len(results) else ']\n}')
+
         return filename
     
     @staticmethod
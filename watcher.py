@@ -0,0 +1,145 @@
+"""
+目录监视
+持续监视输入目录中新增或修改的图片文件，等文件大小和修改时间稳定后
+再交给分析流程，避免读取尚未写完的文件；安装了 watchdog 时使用系统文件事件
+（Linux 上为 inotify），否则退化为定期扫描
+"""
+
+import os
+import time
+import threading
+from pathlib import Path
+
+from file_discovery import iter_image_files, is_image_name
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+
+def file_signature(path):
+    """(大小, 修改时间)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+if WATCHDOG_AVAILABLE:
+    class _ChangeHandler(FileSystemEventHandler):
+        """把文件事件记录为待检查的路径"""
+
+        def __init__(self, watcher):
+            self.watcher = watcher
+
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            for path in (getattr(event, 'dest_path', None), event.src_path):
+                if path and is_image_name(path):
+                    self.watcher.mark_dirty(path)
+
+
+class DirectoryWatcher:
+    """监视目录，按批产出已写完的新增或修改的图片"""
+
+    def __init__(self, root, recursive=False, settle_seconds=2.0, poll_interval=5.0, use_events=True):
+        # 使用绝对路径，与文件事件中的路径保持一致
+        self.root = Path(os.path.abspath(root))
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_events = use_events and WATCHDOG_AVAILABLE
+
+        # 已交给分析流程的文件版本，路径 -> (大小, 修改时间)
+        self._seen = {}
+        # 等待稳定的文件，路径 -> ((大小, 修改时间), 最近一次变化的时间)
+        self._candidates = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._observer = None
+        self._last_scan = 0.0
+
+        self.snapshot()
+
+    @property
+    def mode(self):
+        return 'inotify' if self.use_events else 'polling'
+
+    def snapshot(self):
+        """记录当前已存在的文件作为基线，之后只处理变化的部分"""
+        for path in iter_image_files(self.root, self.recursive):
+            signature = file_signature(path)
+            if signature:
+                self._seen[str(path)] = signature
+        self._last_scan = time.monotonic()
+
+    def mark_dirty(self, path):
+        with self._lock:
+            self._dirty.add(str(path))
+
+    def start(self):
+        if self.use_events and self._observer is None:
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(self), str(self.root), recursive=self.recursive)
+            self._observer.start()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def batches(self, tick=0.5):
+        """阻塞等待，每当有文件写完就产出一批路径（Path 列表）"""
+        self.start()
+        try:
+            while True:
+                ready = self.poll()
+                if ready:
+                    yield ready
+                else:
+                    time.sleep(tick)
+        finally:
+            self.stop()
+
+    def poll(self):
+        """检查一次变化，返回已稳定的文件"""
+        now = time.monotonic()
+        if not self.use_events and now - self._last_scan >= self.poll_interval:
+            self._scan()
+            self._last_scan = now
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+
+        for path in dirty | set(self._candidates):
+            signature = file_signature(path)
+            if signature is None or signature == self._seen.get(path):
+                self._candidates.pop(path, None)
+                continue
+
+            candidate = self._candidates.get(path)
+            if candidate is None or candidate[0] != signature:
+                # 新文件或仍在写入，重新计时
+                self._candidates[path] = (signature, now)
+
+        ready = []
+        for path, (signature, changed_at) in list(self._candidates.items()):
+            if now - changed_at >= self.settle_seconds:
+                del self._candidates[path]
+                self._seen[path] = signature
+                ready.append(Path(path))
+        return sorted(ready)
+
+    def _scan(self):
+        """轮询模式：扫描目录，找出与已处理版本不同的文件"""
+        for path in iter_image_files(self.root, self.recursive):
+            path = str(path)
+            signature = file_signature(path)
+            if signature and signature != self._seen.get(path) and path not in self._candidates:
+                self.mark_dirty(path)